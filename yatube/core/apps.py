@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import metrics, slow_queries
+        connection_created.connect(metrics.install)
+        if settings.SLOW_QUERY_LOG and (
+                settings.SLOW_QUERY_THRESHOLD is not None
+                or settings.SLOW_QUERY_REPORT):
+            connection_created.connect(slow_queries.install)
@@ -0,0 +1,174 @@
+import random
+import re
+import threading
+import time
+
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import Database
+from django.db.utils import OperationalError
+
+# busy_timeout первым: смена journal_mode ждет блокировку файла.
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+WRITE_RE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.I)
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def write_lock(name):
+    """Общая для процесса очередь писателей в файл name."""
+    with _write_locks_lock:
+        return _write_locks.setdefault(name, threading.Lock())
+
+
+def is_locked_error(error):
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite для нескольких потоков и процессов.
+
+    При подключении ставит pragma из OPTIONS['pragmas'] поверх
+    DEFAULT_PRAGMAS: WAL, чтобы чтение не ждало запись, и busy_timeout.
+    Писатели процесса выстраиваются в очередь на общей блокировке файла,
+    не дольше OPTIONS['write_timeout'] секунд, а занятость базы другим
+    процессом пересиливают повторами с экспоненциальной паузой.
+
+    Транзакции начинаются отложенным BEGIN, и читающие транзакции очередь
+    не занимают. Первая запись в транзакции встает в очередь и держит ее
+    до конца транзакции. Запись после чтения в отложенной транзакции
+    падает, если между ними закоммитил другой писатель; такие блоки
+    открывают через core.transactions.atomic_write — с BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.holds_write_lock = False
+        self.begin_immediate = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        options = {
+            'pragmas': kwargs.pop('pragmas', {}),
+            'write_timeout': kwargs.pop('write_timeout', 5),
+            'write_retries': kwargs.pop('write_retries', 5),
+            'write_backoff': kwargs.pop('write_backoff', 0.01),
+        }
+        self.pragmas = dict(DEFAULT_PRAGMAS, **options['pragmas'])
+        self.write_timeout = options['write_timeout']
+        self.write_retries = options['write_retries']
+        self.write_backoff = options['write_backoff']
+        if kwargs['database'] == ':memory:':
+            # У каждого соединения с :memory: своя база.
+            self.write_lock = threading.Lock()
+        else:
+            self.write_lock = write_lock(kwargs['database'])
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            connection.execute('PRAGMA %s = %s' % (pragma, value))
+        return connection
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SerializedCursorWrapper)
+        cursor.database = self
+        return cursor
+
+    def acquire_write_lock(self):
+        if self.holds_write_lock:
+            return False
+        if not self.write_lock.acquire(timeout=self.write_timeout):
+            raise Database.OperationalError(
+                'database is locked: очередь записи не освободилась '
+                'за %s с' % self.write_timeout
+            )
+        self.holds_write_lock = True
+        return True
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def retry_locked(self, func, *args):
+        """func(*args), повторенная при занятой базе с ростом паузы."""
+        delay = self.write_backoff
+        for attempt in range(self.write_retries + 1):
+            try:
+                return func(*args)
+            except (Database.OperationalError, OperationalError) as error:
+                if attempt == self.write_retries or not is_locked_error(
+                        error):
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+
+    def _start_transaction_under_autocommit(self):
+        immediate, self.begin_immediate = self.begin_immediate, False
+        if not immediate:
+            return super()._start_transaction_under_autocommit()
+        with self.wrap_database_errors:
+            self.acquire_write_lock()
+        try:
+            self.retry_locked(self.cursor().execute, 'BEGIN IMMEDIATE')
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_lock()
+
+
+class SerializedCursorWrapper(base.SQLiteCursorWrapper):
+    """Запись идет через очередь писателей и повторы."""
+
+    def execute(self, query, params=None):
+        if not WRITE_RE.match(query):
+            return super().execute(query, params)
+        if self.database.in_atomic_block:
+            return self.in_transaction(super().execute, query, params)
+        return self.serialized(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        if self.database.in_atomic_block:
+            return self.in_transaction(
+                super().executemany, query, param_list
+            )
+        return self.serialized(super().executemany, query, param_list)
+
+    def in_transaction(self, func, *args):
+        """Блокировка записи остается до COMMIT или ROLLBACK."""
+        self.database.acquire_write_lock()
+        return self.database.retry_locked(func, *args)
+
+    def serialized(self, func, *args):
+        acquired = self.database.acquire_write_lock()
+        try:
+            return self.database.retry_locked(func, *args)
+        finally:
+            if acquired:
+                self.database.release_write_lock()
@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+@contextmanager
+def temporary_database(using='default'):
+    """Подменяет базу на пустую тестовую, чтобы не трогать рабочие данные."""
+    connection = connections[using]
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat):
+    """Время каждого из repeat вызовов func в секундах."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summary(samples):
+    """p50/p95/p99 в миллисекундах."""
+    return {
+        'p50': percentile(samples, 0.50) * 1000,
+        'p95': percentile(samples, 0.95) * 1000,
+        'p99': percentile(samples, 0.99) * 1000,
+    }
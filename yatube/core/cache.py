@@ -0,0 +1,308 @@
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import CACHE_FLIGHTS, CACHE_TIERS, cache_result
+
+MISSING = object()
+LOCK_POLL = 0.02
+
+# Значение из get_or_compute: свежее до fresh_until, потом — устаревшее.
+Entry = namedtuple('Entry', ('value', 'fresh_until'))
+
+_lrus = {}
+_lrus_lock = threading.Lock()
+
+
+class LocalLRU:
+    """Ограниченный по числу записей кеш процесса со сроком жизни."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        evicted = 0
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            CACHE_TIERS.inc('local', 'eviction', amount=evicted)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def local_lru(name, max_entries):
+    """Один LRU на процесс для LOCATION, как у LocMemCache."""
+    with _lrus_lock:
+        return _lrus.setdefault(name, LocalLRU(max_entries))
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU процесса перед общим для воркеров кешем.
+
+    Чтение идет сначала в LRU, потом в кеш OPTIONS['SHARED'] и кладет
+    найденное в LRU на LOCAL_TIMEOUT секунд — столько другие воркеры
+    могут видеть старое значение после записи в общий кеш. Сроки жизни
+    в общем кеше размываются на ±JITTER, чтобы ключи, положенные разом,
+    не истекали одновременно. Защита от одновременного пересчета —
+    в get_or_compute.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local = local_lru(
+            location, options.get('LOCAL_MAX_ENTRIES', 1000)
+        )
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 2)
+        self.jitter = options.get('JITTER', 0.1)
+        self.stale_timeout = options.get('STALE_TIMEOUT', 60)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self.lock_wait = options.get('LOCK_WAIT', 2)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def jittered(self, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout and self.jitter:
+            timeout *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return timeout
+
+    def _remember(self, key, value, timeout, version):
+        local_key = self.make_key(key, version)
+        if timeout is not None and timeout <= 0:
+            self.local.delete(local_key)
+            return
+        local_timeout = self.local_timeout
+        if timeout is not None:
+            local_timeout = min(local_timeout, timeout)
+        self.local.set(local_key, value, local_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(self.make_key(key, version))
+        if value is not MISSING:
+            CACHE_TIERS.inc('local', 'hit')
+            return value
+        CACHE_TIERS.inc('local', 'miss')
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            CACHE_TIERS.inc('shared', 'miss')
+            return default
+        CACHE_TIERS.inc('shared', 'hit')
+        self._remember(key, value, None, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(self.make_key(key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if found:
+            CACHE_TIERS.inc('local', 'hit', amount=len(found))
+        if not missing:
+            return found
+        CACHE_TIERS.inc('local', 'miss', amount=len(missing))
+        shared = self.shared.get_many(missing, version=version)
+        if shared:
+            CACHE_TIERS.inc('shared', 'hit', amount=len(shared))
+        if len(shared) < len(missing):
+            CACHE_TIERS.inc(
+                'shared', 'miss', amount=len(missing) - len(shared)
+            )
+        for key, value in shared.items():
+            self._remember(key, value, None, version)
+        found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.jittered(timeout)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, value, timeout, version)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._remember(key, value, None, version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self.make_key(key, version))
+        return self.shared.touch(key, self.jittered(timeout), version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_key(key, version))
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self.make_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def get_or_compute(self, key, compute, timeout=DEFAULT_TIMEOUT,
+                       version=None):
+        """Значение key; при промахе compute() считает один воркер.
+
+        Значение лежит в кеше на STALE_TIMEOUT дольше своего срока:
+        пока воркер, взявший блокировку, пересчитывает истекший ключ,
+        остальные отдают старое. Если старого нет, они ждут до LOCK_WAIT
+        секунд и только потом считают сами. Результат None не кешируется.
+        Возвращает пару (значение, посчитано ли оно в этом вызове).
+        """
+        entry = self.get(key, version=version)
+        if entry is not None and not isinstance(entry, Entry):
+            return entry, False
+        if entry is not None and entry.fresh_until > time.time():
+            return entry.value, False
+        lock_key = 'lock:%s' % key
+        if self.shared.add(lock_key, 1, self.lock_timeout, version=version):
+            CACHE_FLIGHTS.inc('computed')
+            try:
+                value = compute()
+                if value is not None:
+                    self._store(key, value, timeout, version)
+                return value, True
+            finally:
+                self.shared.delete(lock_key, version=version)
+        if entry is not None:
+            CACHE_FLIGHTS.inc('stale')
+            return entry.value, False
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = self.shared.get(key, version=version)
+            if isinstance(entry, Entry):
+                CACHE_FLIGHTS.inc('waited')
+                self._remember(key, entry, None, version)
+                return entry.value, False
+        CACHE_FLIGHTS.inc('timeout')
+        return compute(), True
+
+    def _store(self, key, value, timeout, version):
+        timeout = self.jittered(timeout)
+        if timeout is None:
+            self.set(key, Entry(value, float('inf')), None, version)
+            return
+        entry = Entry(value, time.time() + timeout)
+        timeout += self.stale_timeout
+        self.shared.set(key, entry, timeout, version=version)
+        self._remember(key, entry, timeout, version)
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, name=None):
+    """Значение из кеша по умолчанию, при промахе — compute().
+
+    На TieredCache пересчет истекшего ключа идет в одном воркере, на
+    других бэкендах — обычные get и set. name — назначение кеша для
+    счетчиков попаданий в метриках.
+    """
+    backend = caches['default']
+    if isinstance(backend, TieredCache):
+        value, computed = backend.get_or_compute(key, compute, timeout)
+    else:
+        value = backend.get(key)
+        computed = value is None
+        if computed:
+            value = compute()
+            if value is not None:
+                backend.set(key, value, timeout)
+    if name:
+        cache_result(name, hits=not computed, misses=computed)
+    return value
+
+
+def max_age(timeout):
+    """Сколько воркеры могут видеть значение, положенное на timeout секунд.
+
+    Сверху к сроку добавляются размытие и время жизни в LRU воркера.
+    """
+    backend = caches['default']
+    if not isinstance(backend, TieredCache):
+        return timeout
+    return timeout * (1 + backend.jitter) + backend.local_timeout
+
+
+class Namespace:
+    """Ключи с общей версией: invalidate() сбрасывает их все разом.
+
+    Версия хранится бессрочно. Начальная берется из времени, чтобы после
+    вытеснения версии из кеша не ожили ключи прошлых версий.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = 'ns:%s' % name
+
+    def version(self):
+        return cache.get_or_set(
+            self.version_key, lambda: int(time.time() * 1000), None
+        )
+
+    def key(self, key):
+        return '%s:%s:%s' % (self.name, self.version(), key)
+
+    def invalidate(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            pass
@@ -0,0 +1,175 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.shortcuts import resolve_url
+
+from .benchmark import summary
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def has_wsgi_server():
+    return importlib.util.find_spec('gunicorn') is not None
+
+
+@contextmanager
+def local_server(workers=2, threads=8, timeout=30):
+    """Поднимает gunicorn с WSGI_APPLICATION проекта в отдельном процессе.
+
+    runserver не годится: он однопроцессный, отдает статику и меряет
+    себя, а не приложение. Сервер не делит GIL с генератором нагрузки.
+    Вывод сервера скрыт, ошибки видны по кодам ответов.
+    """
+    module, application = settings.WSGI_APPLICATION.rsplit('.', 1)
+    port = free_port()
+    url = 'http://127.0.0.1:%s' % port
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', '127.0.0.1:%s' % port,
+            '--workers', str(workers),
+            '--threads', str(threads),
+            '--chdir', settings.BASE_DIR,
+            '%s:%s' % (module, application),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'yatube.settings'
+            ),
+        ),
+    )
+    try:
+        wait_ready(url, server, timeout)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def wait_ready(url, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(
+                'Сервер завершился с кодом %s' % server.returncode
+            )
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError('Сервер не ответил за %s с' % timeout)
+
+
+class LoadStats:
+    """Время и ошибки по маршрутам, общее для всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, elapsed, status):
+        """status — код ответа или имя исключения, строка — всегда ошибка."""
+        with self.lock:
+            self.samples[route].append(elapsed)
+            self.statuses[route][status] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[route] += 1
+
+    def report(self, duration):
+        report = {}
+        for route, samples in sorted(self.samples.items()):
+            report[route] = dict(
+                summary(samples),
+                requests=len(samples),
+                rps=len(samples) / duration,
+                error_rate=self.errors[route] / len(samples),
+                statuses={
+                    str(status): total
+                    for status, total in self.statuses[route].items()
+                },
+            )
+        return report
+
+
+class LoadUser:
+    """Виртуальный пользователь: своя сессия requests и свой random.
+
+    Подклассы задают ROUTES — словарь «маршрут: метод», метод делает
+    один запрос и возвращает Response.
+    """
+
+    ROUTES = {}
+
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.rng = rng
+        self.session = requests.Session()
+
+    def setup(self):
+        pass
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('timeout', 30)
+        return self.session.request(method, self.base_url + path, **kwargs)
+
+    def hit(self, route, stats):
+        started = time.perf_counter()
+        try:
+            response = getattr(self, self.ROUTES[route])()
+            status = response.status_code
+            if is_login_redirect(response):
+                status = 'LoginRedirect'
+        except requests.RequestException as error:
+            status = type(error).__name__
+        stats.record(route, time.perf_counter() - started, status)
+
+
+def is_login_redirect(response):
+    """Редирект на вход: сессия потеряна, и запрос на деле не выполнен."""
+    if not response.is_redirect:
+        return False
+    location = urlsplit(response.headers['Location']).path
+    return location == resolve_url(settings.LOGIN_URL)
+
+
+def run_load(make_user, mix, concurrency, duration):
+    """Гоняет concurrency пользователей duration секунд по весам mix."""
+    stats = LoadStats()
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        user = make_user(number)
+        user.setup()
+        while time.monotonic() < deadline:
+            route = user.rng.choices(routes, weights)[0]
+            user.hit(route, stats)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker, n) for n in range(concurrency)]:
+            future.result()
+    return stats.report(time.monotonic() - started)
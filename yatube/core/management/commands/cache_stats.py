@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from core.metrics import CACHE, CACHE_FLIGHTS, CACHE_TIERS, registry
+
+TIERS = ('local', 'shared')
+FLIGHTS = ('computed', 'stale', 'waited', 'timeout')
+
+
+def ratio(hits, misses):
+    total = hits + misses
+    return 100 * hits / total if total else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Попадания, промахи и вытеснения кеша по уровням и назначениям, '
+        'сложенные по метрикам всех воркеров.'
+    )
+
+    def handle(self, *args, **options):
+        snapshots = registry.collect()
+        tiers = registry.merged(CACHE_TIERS.name, snapshots)
+        for tier in TIERS:
+            hits = tiers.get((tier, 'hit'), 0)
+            misses = tiers.get((tier, 'miss'), 0)
+            line = '%s: попаданий %d, промахов %d (%.1f%%)' % (
+                tier, hits, misses, ratio(hits, misses)
+            )
+            if tier == 'local':
+                line += ', вытеснений %d' % tiers.get(
+                    (tier, 'eviction'), 0
+                )
+            self.stdout.write(line)
+        flights = registry.merged(CACHE_FLIGHTS.name, snapshots)
+        self.stdout.write('пересчет: %s' % ', '.join(
+            '%s %d' % (result, flights.get((result,), 0))
+            for result in FLIGHTS
+        ))
+        purposes = registry.merged(CACHE.name, snapshots)
+        for name in sorted({name for name, _ in purposes}):
+            hits = purposes.get((name, 'hit'), 0)
+            misses = purposes.get((name, 'miss'), 0)
+            self.stdout.write('  %s: попаданий %d, промахов %d (%.1f%%)' % (
+                name, hits, misses, ratio(hits, misses)
+            ))
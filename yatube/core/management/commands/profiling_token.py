@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдает подписанный токен для заголовка X-Profile: запрос с ним '
+        'будет профилирован.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write('Действует %s с.' % settings.PROFILING_TOKEN_MAX_AGE)
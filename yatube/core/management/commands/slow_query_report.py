@@ -0,0 +1,58 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводит отчет медленных запросов по формам: суммарное время, '
+        'число медленных и таблицы, которые читаются целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.SLOW_QUERY_REPORT)
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument(
+            '--scans', action='store_true',
+            help='Только запросы с полным сканированием таблиц.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = open(options['path'], encoding='utf-8')
+        except (OSError, TypeError):
+            raise CommandError('Нет отчета: %s' % options['path'])
+        merged = {}
+        with source:
+            for line in source:
+                for statement in json.loads(line)['statements']:
+                    entry = merged.setdefault(statement['fingerprint'], {
+                        'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                        'slow': 0, 'views': Counter(),
+                        'scans': statement['scans'],
+                    })
+                    entry['count'] += statement['count']
+                    entry['total_ms'] += statement['total_ms']
+                    entry['max_ms'] = max(entry['max_ms'], statement['max_ms'])
+                    entry['slow'] += statement['slow']
+                    entry['views'].update(statement['views'])
+        statements = sorted(
+            merged.items(), key=lambda item: -item[1]['total_ms']
+        )
+        if options['scans']:
+            statements = [item for item in statements if item[1]['scans']]
+        for shape, entry in statements[:options['top']]:
+            self.stdout.write(
+                '{total_ms:.1f} мс всего, {count} раз, макс {max_ms:.1f} мс, '
+                'медленных {slow}'.format(**entry)
+            )
+            if entry['scans']:
+                self.stdout.write(
+                    '  полный скан: %s' % ', '.join(entry['scans'])
+                )
+            self.stdout.write('  view: %s' % ', '.join(
+                view for view, _ in entry['views'].most_common(3)
+            ))
+            self.stdout.write('  %s' % shape)
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replicas import sync_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу в реплики из REPLICA_DATABASES и '
+        'отмечает время синхронизации. С --loop повторяет раз в '
+        'REPLICA_SYNC_INTERVAL секунд.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('Реплики не настроены, см. REPLICA_COUNT.')
+        while True:
+            for alias in settings.REPLICA_DATABASES:
+                elapsed = sync_replica(alias)
+                self.stdout.write('%s: %.2f с' % (alias, elapsed))
+            if not options['loop']:
+                return
+            time.sleep(settings.REPLICA_SYNC_INTERVAL)
@@ -0,0 +1,329 @@
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+SNAPSHOT_RE = re.compile(r'^metrics-(\d+)-\w+\.json$')
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labels):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        with self.registry.lock:
+            self.values[labels] += amount
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, merged, rows):
+        for labels, value in rows:
+            merged[tuple(labels)] = merged.get(tuple(labels), 0) + value
+
+    def expose(self, merged):
+        for labels, value in sorted(merged.items()):
+            yield '%s%s %s' % (
+                self.name, format_labels(self.labels, labels), number(value)
+            )
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus."""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по корзинам + переполнение, сумма]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0
+                ]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self):
+        return [
+            [list(labels), list(counts), total]
+            for labels, (counts, total) in self.values.items()
+        ]
+
+    def merge(self, merged, rows):
+        for labels, counts, total in rows:
+            state = merged.setdefault(
+                tuple(labels), [[0] * (len(self.buckets) + 1), 0.0]
+            )
+            for index, count in enumerate(counts):
+                state[0][index] += count
+            state[1] += total
+
+    def expose(self, merged):
+        bounds = [number(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '%s_bucket%s %s' % (
+                    self.name,
+                    format_labels(self.labels + ('le',), labels + (bound,)),
+                    cumulative,
+                )
+            base = format_labels(self.labels, labels)
+            yield '%s_sum%s %s' % (self.name, base, number(total))
+            yield '%s_count%s %s' % (self.name, base, cumulative)
+
+
+def number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, escape(value))
+        for name, value in zip(names, values)
+    )
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_snapshot(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Registry:
+    """Метрики процесса и их сведение между воркерами.
+
+    Каждый процесс раз в METRICS_FLUSH_INTERVAL секунд и при выходе
+    пишет снимок в свой файл в METRICS_DIR; экспорт складывает файлы
+    живых воркеров. Файлы завершившихся воркеров экспорт удаляет: сумма
+    счетчиков при этом падает, и Prometheus считает это сбросом счетчика.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.flushed = time.monotonic()
+        self.filename = 'metrics-%s-%s.json' % (
+            os.getpid(), uuid.uuid4().hex[:8]
+        )
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(self, name, documentation, tuple(labels))
+        self.metrics[name] = metric
+        return metric
+
+    def histogram(self, name, documentation, labels=(),
+                  buckets=LATENCY_BUCKETS):
+        metric = Histogram(
+            self, name, documentation, tuple(labels), buckets
+        )
+        self.metrics[name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: metric.snapshot()
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        temporary = '%s.%s.tmp' % (path, threading.get_ident())
+        with open(temporary, 'w', encoding='utf-8') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Снимки живых воркеров; свой берется из памяти, он свежее."""
+        snapshots = [self.snapshot()]
+        directory = settings.METRICS_DIR
+        if directory:
+            own = os.path.join(directory, self.filename)
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                if path == own:
+                    continue
+                match = SNAPSHOT_RE.match(os.path.basename(path))
+                if match and not is_alive(int(match.group(1))):
+                    remove_snapshot(path)
+                    continue
+                try:
+                    with open(path, encoding='utf-8') as source:
+                        snapshots.append(json.load(source))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def merged(self, name, snapshots=None):
+        """Значения метрики name, сложенные по всем воркерам."""
+        metric = self.metrics[name]
+        merged = {}
+        for snapshot in self.collect() if snapshots is None else snapshots:
+            metric.merge(merged, snapshot.get(name, []))
+        return merged
+
+    def expose(self):
+        """Все метрики в текстовом формате Prometheus."""
+        snapshots = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            merged = self.merged(name, snapshots)
+            lines.append('# HELP %s %s' % (name, metric.documentation))
+            lines.append('# TYPE %s %s' % (name, metric.kind))
+            lines.extend(metric.expose(merged))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUESTS = registry.counter(
+    'yatube_requests_total',
+    'Ответы по view, методу и коду.',
+    ('view', 'method', 'status'),
+)
+LATENCY = registry.histogram(
+    'yatube_request_duration_seconds',
+    'Время ответа по view.',
+    ('view',),
+)
+QUERIES = registry.histogram(
+    'yatube_request_queries',
+    'Число запросов к базе на ответ по view.',
+    ('view',),
+    QUERY_BUCKETS,
+)
+TEMPLATE_TIME = registry.histogram(
+    'yatube_template_render_seconds',
+    'Время рендера шаблонов на ответ по view.',
+    ('view',),
+)
+CACHE = registry.counter(
+    'yatube_cache_requests_total',
+    'Обращения к кешу по назначению и результату.',
+    ('cache', 'result'),
+)
+CACHE_TIERS = registry.counter(
+    'yatube_cache_tier_total',
+    'Попадания, промахи и вытеснения по уровням кеша.',
+    ('tier', 'result'),
+)
+CACHE_FLIGHTS = registry.counter(
+    'yatube_cache_single_flight_total',
+    'Исходы пересчета истекших ключей: computed, stale, waited, timeout.',
+    ('result',),
+)
+
+
+def cache_result(name, hits=0, misses=0):
+    """Учитывает попадания и промахи кеша с назначением name."""
+    if hits:
+        CACHE.inc(name, 'hit', amount=hits)
+    if misses:
+        CACHE.inc(name, 'miss', amount=misses)
+
+
+_active = threading.local()
+
+
+def current():
+    """Замеры текущего запроса или None."""
+    return getattr(_active, 'request', None)
+
+
+class RequestMetrics:
+    """Счетчик запросов к базе и времени шаблонов одного ответа."""
+
+    __slots__ = ('queries', 'template', 'depth', 'started')
+
+    def __init__(self):
+        self.queries = 0
+        self.template = 0.0
+        self.depth = 0
+
+    def template_started(self):
+        self.depth += 1
+        if self.depth == 1:
+            self.started = time.perf_counter()
+
+    def template_finished(self):
+        self.depth -= 1
+        if not self.depth:
+            self.template += time.perf_counter() - self.started
+
+    def activate(self):
+        _active.request = self
+
+    def deactivate(self):
+        _active.request = None
+
+
+def count_query(execute, sql, params, many, context):
+    """Постоянная обертка execute: учитывает запрос в текущем ответе."""
+    request_metrics = getattr(_active, 'request', None)
+    if request_metrics is not None:
+        request_metrics.queries += 1
+    return execute(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created, см. slow_queries.install."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
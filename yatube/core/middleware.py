@@ -0,0 +1,117 @@
+import logging
+import time
+
+from django.conf import settings
+
+from . import metrics, profiling, replicas
+from .queries import record_queries, set_current_view
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы к базе на каждый запрос и предупреждает об N+1.
+
+    Запросы, сделанные при отдаче StreamingHttpResponse, не учитываются:
+    они выполняются уже после выхода из middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            with record_queries() as log:
+                response = self.get_response(request)
+        finally:
+            set_current_view(None)
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        for shape, times in log.repeated(settings.QUERY_REPEAT_THRESHOLD):
+            logger.warning('N+1 в %s: %s раз %s', view, times, shape)
+        logger.debug(
+            '%s: %s запросов, %.1f мс', view, log.count, log.duration * 1000
+        )
+        if settings.DEBUG:
+            response['Server-Timing'] = 'db;dur=%.1f;desc="%s queries"' % (
+                log.duration * 1000, log.count
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        set_current_view(request.resolver_match.view_name)
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет за основной базой пользователя, который только что писал.
+
+    Без реплик в REPLICA_DATABASES ничего не делает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        with replicas.request_routing(
+            pinned=replicas.PIN_COOKIE in request.COOKIES
+        ):
+            response = self.get_response(request)
+            wrote = replicas.wrote()
+        if wrote:
+            response.set_cookie(
+                replicas.PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует долю запросов или запросы с подписанным X-Profile.
+
+    Имя дампов возвращается в заголовке X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+        with profiling.profile_request(request) as result:
+            response = self.get_response(request)
+        response['X-Profile-Id'] = result['name']
+        return response
+
+
+class MetricsMiddleware:
+    """Время ответа, коды, число запросов к базе и время шаблонов по view.
+
+    Ответы без view (404 на неизвестный адрес) идут под view="unmatched",
+    чтобы число рядов метрик не зависело от адресов из запросов.
+    """
+
+    METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        request_metrics.activate()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics.deactivate()
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in self.METHODS else 'other'
+        metrics.REQUESTS.inc(view, method, response.status_code)
+        metrics.LATENCY.observe(elapsed, view)
+        metrics.QUERIES.observe(request_metrics.queries, view)
+        metrics.TEMPLATE_TIME.observe(request_metrics.template, view)
+        metrics.registry.maybe_flush()
+        return response
@@ -0,0 +1,84 @@
+import base64
+import json
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
+from .cache import Namespace, get_or_compute
+
+PAGE_PARAMS = ('page', 'after', 'before')
+PERSONAL_RE = re.compile(r'<!--personal:([A-Za-z0-9_=-]+)-->')
+
+
+def personal_placeholder(template_name, params):
+    payload = json.dumps((template_name, params)).encode()
+    return '<!--personal:%s-->' % base64.urlsafe_b64encode(payload).decode()
+
+
+def fill_personal(content, request):
+    """Дорисовывает в закешированную страницу части текущего пользователя."""
+    def render(match):
+        template_name, params = json.loads(
+            base64.urlsafe_b64decode(match.group(1))
+        )
+        return render_to_string(template_name, params, request=request)
+    return PERSONAL_RE.sub(render, content)
+
+
+def page_key(path, params):
+    params = {
+        name: value for name, value in params.items()
+        if name in PAGE_PARAMS and value
+    }
+    if params.get('page') == '1':
+        del params['page']
+    return Namespace('page:%s' % path).key(urlencode(sorted(params.items())))
+
+
+def purge_path(path):
+    """Сбрасывает все закешированные страницы адреса."""
+    Namespace('page:%s' % path).invalidate()
+
+
+def purge_page(path, params=None):
+    """Сбрасывает одну страницу адреса, по умолчанию первую."""
+    cache.delete(page_key(path, params or {}))
+
+
+def cache_page_for_everyone(view):
+    """Кеширует страницу одной для всех пользователей.
+
+    Личные части страницы, отмеченные тегом personal, в кеш попадают
+    заглушками и дорисовываются для каждого запроса.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        rendered = []
+
+        def render():
+            request.page_cache_render = True
+            response = view(request, *args, **kwargs)
+            rendered.append(response)
+            if response.status_code != 200 or response.streaming:
+                return None
+            return response.content.decode(response.charset)
+
+        content = get_or_compute(
+            page_key(request.path, request.GET), render,
+            settings.PAGE_CACHE_TIMEOUT, name='page',
+        )
+        if content is None:
+            return rendered[0]
+        response = rendered[0] if rendered else HttpResponse()
+        response.content = fill_personal(content, request)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapper
@@ -0,0 +1,252 @@
+import cProfile
+import json
+import linecache
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_SALT = 'core.profiling'
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+
+_active = threading.local()
+# Сколько профилей сейчас пишут выделения памяти и включали ли
+# tracemalloc мы сами, см. start_tracing.
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+# Выделения памяти самого профилировщика в отчет не попадают.
+OWN_ALLOCATIONS = [
+    tracemalloc.Filter(False, module.__file__)
+    for module in (tracemalloc, linecache)
+] + [tracemalloc.Filter(False, __file__)]
+
+
+def current():
+    """Профиль текущего потока или None."""
+    return getattr(_active, 'profile', None)
+
+
+def make_token():
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+def has_valid_token(request):
+    token = request.META.get(PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    if has_valid_token(request):
+        return True
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(settings.BASE_DIR):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[-1]
+    else:
+        filename = os.path.basename(filename)
+    return '%s (%s:%s)' % (code.co_name, filename, code.co_firstlineno)
+
+
+class StackSampler(threading.Thread):
+    """Раз в interval снимает стек потока запроса для flamegraph."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """Строки «кадр;кадр;кадр число» для flamegraph.pl и speedscope."""
+        return ''.join(
+            '%s %s\n' % (stack, count)
+            for stack, count in self.stacks.most_common()
+        )
+
+
+class RequestProfile:
+    """Время запроса по корзинам: база, шаблоны и остальной Python.
+
+    Запросы к базе, сделанные во время рендера (ленивые QuerySet в
+    шаблонах), относятся к базе, а не к шаблонам.
+    """
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.template_total = 0.0
+        self.template_db = 0.0
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db += elapsed
+            self.queries += 1
+            if self.depth:
+                self.template_db += elapsed
+
+    @contextmanager
+    def template(self):
+        self.depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.template_total += time.perf_counter() - started
+
+    def buckets(self, total):
+        template = self.template_total - self.template_db
+        return {
+            'total': total * 1000,
+            'db': self.db * 1000,
+            'template': template * 1000,
+            'python': (total - self.db - template) * 1000,
+        }
+
+
+def start_tracing():
+    """Включает tracemalloc для профиля, парный вызов — stop_tracing.
+
+    tracemalloc общий на процесс: выключает его последний закончившийся
+    профиль и только если включил его профилировщик, а не кто-то еще.
+    """
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if not _tracing_users and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def stop_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if not _tracing_users and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def dump_name(request):
+    match = request.resolver_match
+    view = match.view_name if match else request.path
+    return '%s-%s-%s' % (
+        timezone.now().strftime('%Y%m%dT%H%M%S'),
+        re.sub(r'[^\w.-]+', '_', view).strip('_') or 'request',
+        '%06x' % random.getrandbits(24),
+    )
+
+
+@contextmanager
+def profile_request(request):
+    """Профилирует запрос и пишет дампы в PROFILING_DIR.
+
+    Получаются файлы .prof (pstats), .collapsed (стеки для flamegraph),
+    .alloc.txt (tracemalloc) и .json с корзинами времени. tracemalloc
+    общий на процесс: при параллельных запросах в снимок попадут и их
+    выделения памяти.
+    """
+    profile = RequestProfile()
+    sampler = StackSampler(
+        threading.get_ident(), settings.PROFILING_INTERVAL
+    )
+    profiler = cProfile.Profile()
+    start_tracing()
+    baseline = tracemalloc.take_snapshot().filter_traces(OWN_ALLOCATIONS)
+    _active.profile = profile
+    result = {}
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+    finally:
+        total = time.perf_counter() - started
+        sampler.stop()
+        _active.profile = None
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                OWN_ALLOCATIONS
+            )
+        finally:
+            stop_tracing()
+        result['name'] = write_dumps(
+            request, profile.buckets(total), profile.queries,
+            profiler, sampler, snapshot.compare_to(baseline, 'lineno'),
+        )
+
+
+def write_dumps(request, buckets, queries, profiler, sampler, allocations):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = dump_name(request)
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path + '.prof')
+    with open(path + '.collapsed', 'w', encoding='utf-8') as output:
+        output.write(sampler.collapsed())
+    with open(path + '.alloc.txt', 'w', encoding='utf-8') as output:
+        for stat in allocations[:TOP_ALLOCATIONS]:
+            output.write('%s\n' % stat)
+    with open(path + '.json', 'w', encoding='utf-8') as output:
+        json.dump({
+            'path': request.get_full_path(),
+            'method': request.method,
+            'queries': queries,
+            'buckets_ms': buckets,
+            'samples': sum(sampler.stacks.values()),
+        }, output, ensure_ascii=False, indent=2)
+    return name
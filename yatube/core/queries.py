@@ -0,0 +1,70 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.db import connections
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+\b')
+LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+_view = threading.local()
+
+
+def current_view():
+    """Имя view, которое сейчас обрабатывает поток, или None."""
+    return getattr(_view, 'name', None)
+
+
+def set_current_view(name):
+    _view.name = name
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Форма запроса без литералов: одинаковая для всех id и списков IN."""
+    sql = STRING_RE.sub('%s', sql)
+    sql = NUMBER_RE.sub('%s', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+
+class QueryLog:
+    """Обертка execute: число запросов, время в базе и повторы форм."""
+
+    def __init__(self):
+        self.statements = []
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.statements.append(sql)
+            self.shapes[fingerprint(sql)] += 1
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold):
+        """Формы, повторенные threshold и более раз, — признак N+1."""
+        return [
+            (shape, times) for shape, times in self.shapes.most_common()
+            if times >= threshold
+        ]
+
+
+@contextmanager
+def record_queries():
+    log = QueryLog()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(log))
+        yield log
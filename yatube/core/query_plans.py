@@ -0,0 +1,94 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+
+from .queries import fingerprint
+from .slow_queries import explain, scanned_tables
+
+TEMP_ORDER_RE = re.compile(
+    r'^USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY$'
+)
+
+
+class PlanCapture:
+    """Обертка execute: запоминает по одному запросу каждой формы."""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if not many:
+            self.statements.setdefault(
+                fingerprint(sql), (context['connection'], sql, params)
+            )
+        return result
+
+    def plans(self):
+        """Форма запроса -> строки EXPLAIN QUERY PLAN, без INSERT и DDL."""
+        plans = {}
+        for shape, (connection, sql, params) in self.statements.items():
+            plan = explain(connection, sql, params)
+            if plan:
+                plans[shape] = plan
+        return plans
+
+
+@contextmanager
+def capture_plans(using='default'):
+    capture = PlanCapture()
+    with connections[using].execute_wrapper(capture):
+        yield capture
+
+
+def plan_problems(plan, tables):
+    """Строки плана с полным сканом таблиц tables или сортировкой в памяти."""
+    return sorted(
+        line for line in plan
+        if TEMP_ORDER_RE.match(line)
+        or set(scanned_tables([line])) & set(tables)
+    )
+
+
+def plan_regressions(current, snapshot, tables):
+    """Проблемы планов current, которых нет в snapshot.
+
+    Оба словаря устроены как «сценарий: {форма запроса: план}».
+    Проблема из снимка считается принятой, пока у той же формы запроса
+    в том же сценарии она остается.
+    """
+    regressions = []
+    for scenario, plans in sorted(current.items()):
+        accepted = snapshot.get(scenario, {})
+        for shape, plan in sorted(plans.items()):
+            known = plan_problems(accepted.get(shape, []), tables)
+            for line in plan_problems(plan, tables):
+                if line not in known:
+                    regressions.append('%s: %s\n    %s' % (
+                        scenario, line, shape
+                    ))
+    return regressions
+
+
+def shape_changes(current, snapshot):
+    """Формы запросов, которые появились или пропали по сравнению со снимком.
+
+    Новый JOIN или лишний запрос меняет набор форм даже тогда, когда
+    план не стал хуже.
+    """
+    changes = []
+    for scenario in sorted(set(current) | set(snapshot)):
+        shapes = set(current.get(scenario, {}))
+        accepted = set(snapshot.get(scenario, {}))
+        changes.extend(
+            '%s: + %s' % (scenario, shape) for shape in sorted(
+                shapes - accepted
+            )
+        )
+        changes.extend(
+            '%s: - %s' % (scenario, shape) for shape in sorted(
+                accepted - shapes
+            )
+        )
+    return changes
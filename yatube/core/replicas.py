@@ -0,0 +1,177 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.utils import ConnectionDoesNotExist
+
+logger = logging.getLogger('core.replicas')
+
+PIN_COOKIE = 'primary_pin'
+
+_state = threading.local()
+
+
+@contextmanager
+def request_routing(pinned=False):
+    """Состояние маршрутизации на время запроса.
+
+    pinned — пользователь недавно писал и читает только с основной базы.
+    Внутри можно узнать, была ли запись, через wrote().
+    """
+    _state.pinned = pinned
+    _state.replica_reads = False
+    _state.wrote = False
+    try:
+        yield
+    finally:
+        _state.pinned = False
+        _state.replica_reads = False
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def record_write():
+    """Отмечает запись в запросе: дальше он читает из default."""
+    _state.wrote = True
+
+
+def reads_from_replicas():
+    return getattr(_state, 'replica_reads', False) and not (
+        getattr(_state, 'pinned', False) or wrote()
+    )
+
+
+def replica_reads(view):
+    """Чтения view уходят на реплики, если пользователь не закреплен."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_state, 'replica_reads', False)
+        _state.replica_reads = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _state.replica_reads = previous
+    return wrapper
+
+
+def replica_lag(alias):
+    """Секунды с последней синхронизации реплики, см. sync_replica."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA user_version')
+        synced_at = cursor.fetchone()[0]
+    return time.time() - synced_at
+
+
+class ReplicaHealth:
+    """Кеширует на REPLICA_HEALTH_INTERVAL, годится ли реплика для чтения.
+
+    Реплика выпадает из ротации, если отстает больше REPLICA_MAX_LAG
+    или не отвечает, и возвращается на следующей удачной проверке.
+    """
+
+    def __init__(self):
+        self.checked = {}
+
+    def healthy(self, alias):
+        now = time.monotonic()
+        checked_at, healthy = self.checked.get(alias, (None, False))
+        if checked_at is None or (
+                now - checked_at >= settings.REPLICA_HEALTH_INTERVAL):
+            healthy = self.check(alias)
+            if healthy != self.checked.get(alias, (None, True))[1]:
+                logger.warning(
+                    'Реплика %s %s ротации', alias,
+                    'возвращена в' if healthy else 'выведена из',
+                )
+            self.checked[alias] = (now, healthy)
+        return healthy
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except (DatabaseError, ConnectionDoesNotExist) as error:
+            logger.warning('Реплика %s недоступна: %s', alias, error)
+            return False
+        if lag > settings.REPLICA_MAX_LAG:
+            logger.warning('Реплика %s отстает на %.1f с', alias, lag)
+            return False
+        return True
+
+
+health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """Чтения view с replica_reads — на реплики, остальное — в default.
+
+    Реплика выбирается случайно из здоровых в REPLICA_DATABASES. После
+    записи в запросе и, через cookie PIN_COOKIE, еще REPLICA_PIN_SECONDS
+    чтения пользователя идут в default, чтобы он видел свои изменения.
+    Закрепляет только запись моделей из REPLICA_PIN_APPS: сессии и
+    last_login при входе не в счет.
+
+    Вне реплик роутер ничего не решает: связанные объекты экземпляра,
+    прочитанного из шарда, Django читает из той же базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not reads_from_replicas():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db not in (
+                None, 'default'):
+            return None
+        replicas = [
+            alias for alias in settings.REPLICA_DATABASES
+            if health.healthy(alias)
+        ]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in settings.REPLICA_PIN_APPS:
+            record_write()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+def sync_replica(alias, using='default'):
+    """Переносит основную базу в файл реплики через backup API.
+
+    Копия сначала собирается рядом во временном файле, где в
+    PRAGMA user_version записывается время начала синхронизации, и только
+    потом переносится в реплику: открытые соединения реплики увидят
+    новые данные сразу, а отставание не будет мигать.
+    """
+    target_path = connections[alias].settings_dict['NAME']
+    staging_path = '%s.sync' % target_path
+    started = time.time()
+    source = connections[using]
+    source.ensure_connection()
+    staging = sqlite3.connect(staging_path)
+    try:
+        source.connection.backup(staging)
+        staging.execute('PRAGMA user_version = %d' % started)
+        staging.commit()
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            staging.backup(target)
+        finally:
+            target.close()
+    finally:
+        staging.close()
+        os.remove(staging_path)
+    return time.time() - started
@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.backends.sqlite3.base import FORMAT_QMARK_REGEX
+from django.utils import timezone
+
+from .queries import current_view, fingerprint
+
+logger = logging.getLogger('core.slow_queries')
+
+EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.I)
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+
+
+def explain(connection, sql, params):
+    """План запроса строками; мимо обычных курсоров, чтобы не считаться."""
+    if not EXPLAINABLE_RE.match(sql):
+        return []
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + FORMAT_QMARK_REGEX.sub(
+            '?', sql
+        ).replace('%%', '%')
+    else:
+        sql = 'EXPLAIN ' + sql
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql, params or ())
+        rows = cursor.fetchall()
+    except connection.Database.Error:
+        return []
+    finally:
+        cursor.close()
+    if connection.vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    return [' '.join(map(str, row)) for row in rows]
+
+
+def scanned_tables(plan):
+    """Таблицы, которые план читает целиком, без индекса."""
+    return sorted({
+        match.group(1) for match in map(FULL_SCAN_RE.match, plan) if match
+    })
+
+
+class SlowQueryLog:
+    """Обертка execute для всех соединений процесса.
+
+    Включается настройкой SLOW_QUERY_LOG. Запросы дольше
+    SLOW_QUERY_THRESHOLD уходят в лог формой с плейсхолдерами вместо
+    значений (в параметрах бывают хеши паролей и личные данные), с view
+    и планом. Все запросы сводятся по форме в отчет, который раз в
+    SLOW_QUERY_REPORT_INTERVAL дописывается строкой JSON в
+    SLOW_QUERY_REPORT. План каждой новой формы снимается один раз за
+    период, поэтому в отчете видны и быстрые пока полные сканы.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.flushed = time.monotonic()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(
+                context['connection'], sql, params, many,
+                time.perf_counter() - started,
+            )
+
+    def record(self, connection, sql, params, many, elapsed):
+        shape = fingerprint(sql)
+        view = current_view() or '-'
+        with self.lock:
+            entry = self.statements.get(shape)
+        if entry is None:
+            plan = [] if many else explain(connection, sql, params)
+            entry = {
+                'count': 0, 'total': 0.0, 'max': 0.0, 'slow': 0,
+                'views': Counter(), 'plan': plan,
+                'scans': scanned_tables(plan),
+            }
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        slow = threshold is not None and elapsed >= threshold
+        if slow:
+            logger.warning(
+                '%.1f мс в %s: %s; план: %s',
+                elapsed * 1000, view, shape,
+                ' | '.join(entry['plan']) or '-',
+            )
+        with self.lock:
+            entry = self.statements.setdefault(shape, entry)
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['slow'] += slow
+            entry['views'][view] += 1
+            due = (
+                time.monotonic() - self.flushed
+                >= settings.SLOW_QUERY_REPORT_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def report(self):
+        with self.lock:
+            statements, self.statements = self.statements, {}
+            self.flushed = time.monotonic()
+        return [
+            {
+                'fingerprint': shape,
+                'count': entry['count'],
+                'total_ms': entry['total'] * 1000,
+                'max_ms': entry['max'] * 1000,
+                'slow': entry['slow'],
+                'views': dict(entry['views'].most_common(10)),
+                'plan': entry['plan'],
+                'scans': entry['scans'],
+            }
+            for shape, entry in sorted(
+                statements.items(), key=lambda item: -item[1]['total']
+            )
+        ]
+
+    def flush(self):
+        path = settings.SLOW_QUERY_REPORT
+        statements = self.report()
+        if not path or not statements:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as output:
+            output.write(json.dumps({
+                'time': timezone.now().isoformat(),
+                'pid': os.getpid(),
+                'statements': statements,
+            }, ensure_ascii=False) + '\n')
+
+
+slow_query_log = SlowQueryLog()
+atexit.register(slow_query_log.flush)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: ставит обертку на соединение.
+
+    Соединение может открыться внутри execute_wrapper(), который при
+    выходе снимает последнюю обертку, поэтому наша встает в начало.
+    """
+    if slow_query_log not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_log)
@@ -0,0 +1,40 @@
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import metrics, profiling
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.template_started()
+        try:
+            profile = profiling.current()
+            if profile is None:
+                return super().render(context, request)
+            with profile.template():
+                return super().render(context, request)
+        finally:
+            if request_metrics is not None:
+                request_metrics.template_finished()
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который сообщает время рендера метрикам и
+    профилировщику.
+
+    Рендер учитывается вместе с контекст-процессорами и вложенными
+    include.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.page_cache import personal_placeholder
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def personal(context, template_name, **params):
+    request = context.get('request')
+    if getattr(request, 'page_cache_render', False):
+        return mark_safe(personal_placeholder(template_name, params))
+    with context.push(**params):
+        return context.template.engine.get_template(
+            template_name
+        ).render(context)
@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+
+from .queries import record_queries
+
+
+class QueryBudgetMixin:
+    """assertQueryBudget для TestCase: потолок запросов и запрет N+1."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_threshold=None):
+        if repeat_threshold is None:
+            repeat_threshold = settings.QUERY_REPEAT_THRESHOLD
+        with record_queries() as log:
+            yield log
+        if log.count > budget:
+            self.fail('%s запросов при бюджете %s:\n%s' % (
+                log.count, budget, '\n'.join(log.statements)
+            ))
+        repeated = log.repeated(repeat_threshold)
+        if repeated:
+            self.fail('Повторяющиеся запросы (N+1):\n%s' % '\n'.join(
+                '%s раз: %s' % (times, shape) for shape, times in repeated
+            ))
+
+
+class ExtraDatabasesMixin:
+    """Пустые базы в памяти с миграциями под псевдонимами extra_databases.
+
+    Базы создаются до setUpClass TestCase, поэтому тесты их видят через
+    databases и так же откатываются после каждого теста.
+    """
+
+    extra_databases = ()
+
+    @classmethod
+    def setUpClass(cls):
+        for alias in cls.extra_databases:
+            connections.databases[alias] = dict(
+                connections['default'].settings_dict, NAME=':memory:'
+            )
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = set(cls.databases) | set(cls.extra_databases)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.extra_databases:
+            del connections[alias]
+            del connections.databases[alias]
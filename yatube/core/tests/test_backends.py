@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase
+
+from ..transactions import atomic_write
+
+
+class SQLiteBackendTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def file_database(self, **options):
+        """Псевдоним на файловую базу с одной таблицей."""
+        alias = 'backend_test'
+        path = os.path.join(self.directory, 'backend.sqlite3')
+        with sqlite3.connect(path) as raw:
+            raw.execute('CREATE TABLE item (value INTEGER)')
+        raw.close()
+        connections.databases[alias] = dict(
+            connection.settings_dict, NAME=path,
+            OPTIONS=dict({'pragmas': {'busy_timeout': 0}}, **options),
+        )
+        database = connections[alias]
+        self.addCleanup(connections.databases.pop, alias)
+        self.addCleanup(connections.__delitem__, alias)
+        self.addCleanup(database.close)
+        return database, path
+
+    def test_pragmas(self):
+        """Соединение открывается с WAL, NORMAL и busy_timeout."""
+        database, _ = self.file_database(pragmas={})
+        with database.cursor() as cursor:
+            for pragma, expected in (
+                ('journal_mode', 'wal'),
+                ('synchronous', 1),
+                ('busy_timeout', 5000),
+            ):
+                cursor.execute('PRAGMA %s' % pragma)
+                self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_locked_write_is_retried(self):
+        """Занятая другим процессом база дожидается повторами."""
+        database, path = self.file_database(
+            write_retries=6, write_backoff=0.01
+        )
+        database.ensure_connection()
+        holder = sqlite3.connect(path, check_same_thread=False)
+        holder.execute('BEGIN IMMEDIATE')
+        threading.Timer(0.05, holder.rollback).start()
+        with transaction.atomic(using=database.alias):
+            with database.cursor() as cursor:
+                cursor.execute('INSERT INTO item VALUES (1)')
+        self.assertFalse(database.holds_write_lock)
+        holder.close()
+
+    def test_locked_write_fails_without_retries(self):
+        """Без повторов занятая база дает OperationalError."""
+        database, path = self.file_database(write_retries=0)
+        database.ensure_connection()
+        holder = sqlite3.connect(path)
+        holder.execute('BEGIN IMMEDIATE')
+        try:
+            with self.assertRaises(OperationalError):
+                with database.cursor() as cursor:
+                    cursor.execute('INSERT INTO item VALUES (1)')
+        finally:
+            holder.close()
+        self.assertFalse(database.holds_write_lock)
+
+    def test_only_writing_transactions_take_write_lock(self):
+        """Очередь записи занимает только пишущая транзакция, до ее конца."""
+        database, _ = self.file_database()
+        with transaction.atomic(using=database.alias):
+            with database.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM item')
+                self.assertFalse(database.holds_write_lock)
+                cursor.execute('INSERT INTO item VALUES (1)')
+                self.assertTrue(database.holds_write_lock)
+                cursor.execute('SELECT COUNT(*) FROM item')
+            self.assertTrue(database.holds_write_lock)
+        self.assertFalse(database.holds_write_lock)
+        with atomic_write(using=database.alias):
+            self.assertTrue(database.holds_write_lock)
+            with transaction.atomic(using=database.alias):
+                self.assertTrue(database.holds_write_lock)
+        self.assertFalse(database.holds_write_lock)
+        self.assertFalse(database.begin_immediate)
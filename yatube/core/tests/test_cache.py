@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import metrics
+from ..cache import Entry, Namespace, TieredCache
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tiered = TieredCache('tests-tiered', {'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 2, 'JITTER': 0.5, 'LOCK_WAIT': 1,
+        }})
+        self.addCleanup(self.tiered.clear)
+
+    def test_local_tier_is_bounded(self):
+        """LRU воркера вытесняет старые ключи, общий кеш их помнит."""
+        before = metrics.CACHE_TIERS.values[('local', 'eviction')]
+        for key in ('a', 'b', 'c'):
+            self.tiered.set(key, key.upper())
+        self.assertEqual(len(self.tiered.local), 2)
+        self.assertEqual(
+            metrics.CACHE_TIERS.values[('local', 'eviction')] - before, 1
+        )
+        hits = metrics.CACHE_TIERS.values[('shared', 'hit')]
+        self.assertEqual(self.tiered.get('a'), 'A')
+        self.assertEqual(
+            metrics.CACHE_TIERS.values[('shared', 'hit')] - hits, 1
+        )
+
+    def test_tests_do_not_touch_shared_files(self):
+        """И manage.py test, и py.test работают с общим кешем в памяти."""
+        self.assertIsInstance(caches['shared'], LocMemCache)
+        self.assertIsInstance(cache.shared, LocMemCache)
+
+    def test_timeouts_are_jittered(self):
+        """Сроки жизни размываются в пределах JITTER."""
+        timeouts = {self.tiered.jittered(100) for _ in range(20)}
+        self.assertGreater(len(timeouts), 1)
+        self.assertTrue(all(50 <= timeout <= 150 for timeout in timeouts))
+        self.assertIsNone(self.tiered.jittered(None))
+
+    def test_namespace_invalidation(self):
+        """invalidate() меняет ключи всего пространства имен."""
+        pages = Namespace('tests:pages')
+        key = pages.key('page=2')
+        self.assertEqual(pages.key('page=2'), key)
+        pages.invalidate()
+        self.assertNotEqual(pages.key('page=2'), key)
+
+    def test_single_flight(self):
+        """Промах по одному ключу в нескольких потоках считается один раз."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.tiered.get_or_compute('flight', compute, 60)[0]
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_while_recomputing(self):
+        """Пока ключ пересчитывает другой воркер, отдается старое значение."""
+        self.tiered.shared.set('stale', Entry('old', time.time() - 1), 60)
+        self.tiered.shared.add('lock:stale', 1, 10)
+        value, computed = self.tiered.get_or_compute(
+            'stale', lambda: 'new', 60
+        )
+        self.assertEqual((value, computed), ('old', False))
+        self.tiered.shared.delete('lock:stale')
+        self.assertEqual(
+            self.tiered.get_or_compute('stale', lambda: 'new', 60),
+            ('new', True),
+        )
+
+
+class CacheStatsTests(TestCase):
+    def test_stats_include_other_workers(self):
+        """Команда складывает счетчики кеша всех воркеров."""
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = {
+                'yatube_cache_tier_total': [[['local', 'eviction'], 7]],
+                'yatube_cache_single_flight_total': [[['stale'], 3]],
+                'yatube_cache_requests_total': [[['worker', 'hit'], 3]],
+            }
+            path = os.path.join(directory, 'metrics-1-a.json')
+            with open(path, 'w', encoding='utf-8') as output:
+                json.dump(snapshot, output)
+            evictions = metrics.CACHE_TIERS.values[('local', 'eviction')]
+            stale = metrics.CACHE_FLIGHTS.values[('stale',)]
+            stdout = StringIO()
+            with self.settings(METRICS_DIR=directory):
+                call_command('cache_stats', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('вытеснений %d' % (evictions + 7), output)
+        self.assertIn('stale %d' % (stale + 3), output)
+        self.assertIn(
+            'worker: попаданий 3, промахов 0 (100.0%)', output
+        )
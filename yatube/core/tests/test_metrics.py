@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from .. import metrics
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def metrics(self, token='secret', **extra):
+        with self.settings(METRICS_DIR=self.directory, METRICS_TOKEN='secret'):
+            return self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer %s' % token,
+                **extra
+            )
+
+    def write_snapshot(self, pid, name, snapshot):
+        path = os.path.join(self.directory, 'metrics-%s-%s.json' % (pid, name))
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(snapshot, output)
+        return path
+
+    def test_views_and_caches_are_exposed(self):
+        """Эндпоинт отдает гистограммы по view и попадания в кеш."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/no-such-page/')
+        content = self.metrics().content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"}', content
+        )
+        self.assertIn(
+            'yatube_request_queries_count{view="posts:index"}', content
+        )
+        self.assertIn(
+            'yatube_requests_total'
+            '{view="unmatched",method="GET",status="404"}', content
+        )
+        self.assertIn(
+            'yatube_cache_requests_total{cache="page",result="hit"}',
+            content,
+        )
+
+    def test_query_count_is_observed(self):
+        """В гистограмму попадает число запросов к базе за ответ."""
+        before = metrics.QUERIES.values.get(('posts:post_detail',))
+        before = before[1] if before else 0
+        self.client.get(reverse('posts:post_detail', args=(self.post.id,)))
+        after = metrics.QUERIES.values[('posts:post_detail',)][1]
+        self.assertGreater(after - before, 0)
+
+    def test_other_workers_are_summed(self):
+        """Снимки других воркеров из METRICS_DIR складываются."""
+        snapshot = {'yatube_requests_total': [
+            [['posts:worker', 'GET', 200], 3],
+        ]}
+        for name in ('a', 'b'):
+            self.write_snapshot(os.getpid(), name, snapshot)
+        self.assertIn(
+            'yatube_requests_total'
+            '{view="posts:worker",method="GET",status="200"} 6',
+            self.metrics().content.decode(),
+        )
+
+    def test_dead_workers_are_removed(self):
+        """Снимок завершившегося воркера удаляется и не складывается."""
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        path = self.write_snapshot(worker.pid, 'a', {
+            'yatube_requests_total': [[['posts:dead', 'GET', 200], 3]],
+        })
+        self.assertNotIn('posts:dead', self.metrics().content.decode())
+        self.assertFalse(os.path.exists(path))
+
+    def test_requests_without_token_get_404(self):
+        """Без верного токена эндпоинт не виден, в том числе с localhost."""
+        response = self.metrics(token='wrong')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        with self.settings(METRICS_TOKEN=''):
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer '
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
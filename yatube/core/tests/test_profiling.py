@@ -0,0 +1,81 @@
+import json
+import os
+import pstats
+import tempfile
+import threading
+import tracemalloc
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from ..profiling import make_token, profile_request
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_signed_header_enables_profiling(self):
+        """Запрос с подписанным X-Profile оставляет дампы и корзины."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        with self.settings(PROFILING_DIR=self.directory):
+            response = self.client.get(url, HTTP_X_PROFILE=make_token())
+        name = response['X-Profile-Id']
+        self.assertIn('posts_post_detail', name)
+        path = os.path.join(self.directory, name)
+        for suffix in ('.prof', '.collapsed', '.alloc.txt'):
+            self.assertTrue(os.path.exists(path + suffix))
+        pstats.Stats(path + '.prof')
+        with open(path + '.json', encoding='utf-8') as summary:
+            summary = json.load(summary)
+        buckets = summary['buckets_ms']
+        self.assertGreater(summary['queries'], 0)
+        self.assertGreater(buckets['db'], 0)
+        self.assertGreater(buckets['template'], 0)
+        self.assertAlmostEqual(
+            buckets['db'] + buckets['template'] + buckets['python'],
+            buckets['total'],
+        )
+
+    def test_unsigned_or_sampled_out_requests_are_not_profiled(self):
+        """Без токена и при нулевой доле профиля нет."""
+        url = reverse('posts:index')
+        with self.settings(PROFILING_DIR=self.directory):
+            response = self.client.get(url, HTTP_X_PROFILE='profile:x:y')
+            self.assertFalse(response.has_header('X-Profile-Id'))
+            with self.settings(PROFILING_SAMPLE_RATE=1):
+                response = self.client.get(url)
+            self.assertTrue(response.has_header('X-Profile-Id'))
+
+    def test_tracing_stops_after_last_profile(self):
+        """tracemalloc выключается только после последнего профиля."""
+        request = RequestFactory().get('/')
+        entered = threading.Event()
+        release = threading.Event()
+
+        def first():
+            with profile_request(request):
+                entered.set()
+                release.wait()
+
+        with self.settings(PROFILING_DIR=self.directory):
+            thread = threading.Thread(target=first)
+            thread.start()
+            entered.wait()
+            with profile_request(request):
+                release.set()
+                thread.join()
+                self.assertTrue(tracemalloc.is_tracing())
+        self.assertFalse(tracemalloc.is_tracing())
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import time
+from http import HTTPStatus
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from .. import replicas
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.router = replicas.ReplicaRouter()
+        self.addCleanup(replicas.health.checked.clear)
+        replicas.health.checked['replica'] = (time.monotonic(), True)
+
+    def read_db(self, pinned=False, wrote=False):
+        with replicas.request_routing(pinned=pinned):
+            if wrote:
+                self.router.db_for_write(Post)
+            return replicas.replica_reads(
+                lambda: self.router.db_for_read(Post)
+            )()
+
+    def test_reads_go_to_healthy_replica(self):
+        """Чтения из view с replica_reads идут на здоровую реплику."""
+        self.assertEqual(self.read_db(), 'replica')
+        with replicas.request_routing():
+            self.assertIsNone(self.router.db_for_read(Post))
+        replicas.health.checked['replica'] = (time.monotonic(), False)
+        self.assertIsNone(self.read_db())
+
+    def test_writer_reads_from_primary(self):
+        """После записи и с cookie закрепления реплики не читаются."""
+        self.assertIsNone(self.read_db(wrote=True))
+        self.assertIsNone(self.read_db(pinned=True))
+
+    def test_related_reads_follow_instance_database(self):
+        """Связанные объекты экземпляра из шарда читаются из шарда."""
+        post = Post(author=self.author, text='Пост')
+        post._state.db = 'shard_a'
+        with replicas.request_routing():
+            self.assertIsNone(replicas.replica_reads(
+                lambda: self.router.db_for_read(User, instance=post)
+            )())
+        self.assertEqual(
+            User.objects.db_manager(hints={'instance': post}).db, 'shard_a'
+        )
+
+    def test_login_does_not_pin_client(self):
+        """Сессия и last_login при входе не закрепляют за default."""
+        User.objects.create_user(username='reader', password='pass')
+        response = self.client.post(reverse('users:login'), {
+            'username': 'reader', 'password': 'pass',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_post_create_pins_client(self):
+        """post_create ставит cookie закрепления за основной базой."""
+        client = Client()
+        client.force_login(self.author)
+        response = client.post(reverse('posts:post_create'), {
+            'text': 'Новый пост',
+        })
+        pin = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.REPLICA_PIN_SECONDS)
+        response = client.get(reverse('posts:index'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_lagging_replica_leaves_rotation(self):
+        """Недоступная реплика выводится из ротации с предупреждением."""
+        replicas.health.checked.clear()
+        with self.assertLogs('core.replicas', 'WARNING') as logs:
+            self.assertFalse(replicas.health.healthy('replica'))
+        self.assertIn('выведена из ротации', '\n'.join(logs.output))
+
+
+class SyncReplicasTests(TransactionTestCase):
+    def test_sync_and_lag(self):
+        """Реплика получает данные, а отставание выводит ее из ротации."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica_test'] = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory.name, 'replica.sqlite3'),
+        )
+        self.addCleanup(connections.databases.pop, 'replica_test')
+        replica = connections['replica_test']
+        self.addCleanup(connections.__delitem__, 'replica_test')
+        self.addCleanup(replica.close)
+        self.addCleanup(replicas.health.checked.clear)
+        User.objects.create_user(username='auth')
+        with self.settings(REPLICA_DATABASES=['replica_test']):
+            call_command('sync_replicas', stdout=StringIO())
+        self.assertTrue(
+            User.objects.using('replica_test').filter(
+                username='auth'
+            ).exists()
+        )
+        self.assertLess(replicas.replica_lag('replica_test'), 5)
+        with self.settings(REPLICA_MAX_LAG=5, REPLICA_HEALTH_INTERVAL=0):
+            self.assertTrue(replicas.health.healthy('replica_test'))
+            with replica.cursor() as cursor:
+                cursor.execute('PRAGMA user_version = 1')
+            with self.assertLogs('core.replicas', 'WARNING'):
+                self.assertFalse(replicas.health.healthy('replica_test'))
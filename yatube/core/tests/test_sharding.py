@@ -0,0 +1,301 @@
+import json
+import os
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import sharding
+from posts.models import Follow, Group, Post, TimelineEntry, User
+from posts.search import search_posts
+from posts.utils import CursorPaginator
+
+from users.models import Profile
+
+from ..testing import ExtraDatabasesMixin
+
+
+@override_settings(POST_SHARDS=['shard_a', 'shard_b'])
+class ShardingTests(ExtraDatabasesMixin, TestCase):
+    extra_databases = ('shard_a', 'shard_b')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        sharding.post_ids.reset()
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.authors = [
+            User.objects.create_user(username=username)
+            for username in ('first', 'second')
+        ]
+        cls.posts = [
+            Post.objects.create(
+                author=cls.authors[number % 2],
+                text='Пост %s' % number,
+                group=cls.group if number < 4 else None,
+            )
+            for number in range(6)
+        ]
+        cls.expected = sorted(cls.posts, key=sharding.merge_key, reverse=True)
+
+    def setUp(self):
+        cache.clear()
+        sharding.post_ids.reset()
+
+    def test_posts_live_on_author_shard(self):
+        """Посты лежат на шарде автора со сквозными id, в default пусто."""
+        for post in self.posts:
+            self.assertEqual(
+                post._state.db, sharding.shard_for(post.author_id)
+            )
+            self.assertTrue(
+                Post.objects.using(post._state.db).filter(pk=post.pk)
+            )
+        self.assertEqual(
+            {post._state.db for post in self.posts}, {'shard_a', 'shard_b'}
+        )
+        self.assertEqual(len({post.pk for post in self.posts}), 6)
+        self.assertFalse(Post.objects.using('default').exists())
+
+    def test_references_are_replicated(self):
+        """Пользователи, группы и счетчик автора копируются в шарды."""
+        author = self.authors[0]
+        for alias in sharding.shards():
+            self.assertEqual(User.objects.using(alias).count(), 2)
+        self.assertEqual(
+            Profile.objects.using(sharding.shard_for(author.pk)).get(
+                user=author
+            ).posts_count,
+            3,
+        )
+        self.group.title = 'Новый заголовок'
+        self.group.save()
+        self.assertEqual(
+            Group.objects.using('shard_b').get(pk=self.group.pk).title,
+            'Новый заголовок',
+        )
+
+    @override_settings(NUMBER_OBJECTS=4)
+    def test_index_and_group_merge_shards(self):
+        """index и group_posts сливают шарды по дате публикации."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.expected[:4]
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 6)
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(
+            list(response.context['page_obj']), self.expected[4:]
+        )
+        response = self.client.get(
+            reverse('posts:group_list', args=(self.group.slug,))
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post for post in self.expected if post.group_id],
+        )
+
+    def test_merged_slices_and_cursor(self):
+        """Срезы и курсоры ленты шардов совпадают с общей сортировкой."""
+        posts = sharding.all_posts()
+        self.assertEqual(posts[0:3], self.expected[0:3])
+        self.assertEqual(posts[2:5], self.expected[2:5])
+        self.assertEqual(posts[5], self.expected[5])
+        self.assertEqual(list(posts.reverse()), self.expected[::-1])
+        paginator = CursorPaginator(posts, 4)
+        page = paginator.get_page()
+        self.assertEqual(list(page), self.expected[:4])
+        page = paginator.get_page(after=page.next_cursor())
+        self.assertEqual(list(page), self.expected[4:])
+        page = paginator.get_page(before=page.previous_cursor())
+        self.assertEqual(list(page), self.expected[:4])
+
+    def test_profile_reads_one_shard(self):
+        """Профиль читает посты только с шарда автора."""
+        author = self.authors[0]
+        other = ({'shard_a', 'shard_b'} - {sharding.shard_for(author.pk)})
+        with self.assertNumQueries(0, using=other.pop()):
+            response = self.client.get(
+                reverse('posts:profile', args=(author.username,))
+            )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post for post in self.expected if post.author == author],
+        )
+
+    def test_post_detail_and_edit_find_shard(self):
+        """Страница и правка поста находят его шард."""
+        post = next(post for post in self.posts if post._state.db == 'shard_b')
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertEqual(response.context['post'], post)
+        client = Client()
+        client.force_login(post.author)
+        client.post(
+            reverse('posts:post_edit', args=(post.pk,)), {'text': 'Правка'}
+        )
+        self.assertEqual(
+            Post.objects.using('shard_b').get(pk=post.pk).text, 'Правка'
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=(10 ** 6,))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_index_merges_followed_authors(self):
+        """Лента подписок собирается с шардов при показе."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.authors[1])
+        client = Client()
+        client.force_login(reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post for post in self.expected if post.author == self.authors[1]],
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_is_inserted_without_update(self):
+        """Новый пост с id от распределителя вставляется без UPDATE."""
+        author = self.authors[0]
+        alias = sharding.shard_for(author.pk)
+        with CaptureQueriesContext(connections[alias]) as queries:
+            post = Post(author=author, text='Новый пост')
+            post.save()
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertTrue(any(sql.startswith('INSERT') for sql in statements))
+        self.assertFalse(any(
+            sql.startswith('UPDATE "posts_post"') for sql in statements
+        ))
+
+    def test_reserved_id_blocks_do_not_overlap(self):
+        """Блоки id идут подряд и не пересекаются."""
+        first = sharding.reserve_ids('tests', 10)
+        second = sharding.reserve_ids('tests', 5)
+        self.assertEqual(first[1] - first[0], 10)
+        self.assertEqual(second, (first[1], first[1] + 5))
+
+    def test_search_and_export_merge_shards(self):
+        """Поиск и выгрузка читают посты со всех шардов."""
+        found = search_posts('Пост')
+        self.assertEqual(found.count(), 6)
+        self.assertEqual(
+            {post.pk for post in found[0:6]}, {post.pk for post in self.posts}
+        )
+        self.assertEqual(len(found[2:4]), 2)
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl')
+            call_command('export_posts', output=path, stdout=output)
+            with open(path, encoding='utf-8') as export:
+                ids = [json.loads(line)['id'] for line in export]
+        self.assertEqual(ids, sorted(post.pk for post in self.posts))
+
+    def test_migration_data_steps_by_database(self):
+        """Старые шаги с данными идут в default, шаги для шардов — в шарды."""
+        router = sharding.ShardRouter()
+        self.assertFalse(router.allow_migrate('shard_a', 'posts'))
+        self.assertIsNone(router.allow_migrate('default', 'posts'))
+        self.assertTrue(router.allow_migrate('shard_a', 'posts', shards=True))
+        self.assertFalse(router.allow_migrate('default', 'posts', shards=True))
+        self.assertIsNone(
+            router.allow_migrate('shard_a', 'posts', model_name='post')
+        )
+
+
+@override_settings(POST_SHARDS=['shard_a', 'shard_b'])
+class RebalanceShardsTests(ExtraDatabasesMixin, TestCase):
+    extra_databases = ('shard_a', 'shard_b')
+
+    def setUp(self):
+        cache.clear()
+        sharding.post_ids.reset()
+        self.author = User.objects.create_user(username='auth')
+        self.source = sharding.shard_for(self.author.pk)
+        self.target = ({'shard_a', 'shard_b'} - {self.source}).pop()
+
+    def test_move_author_keeps_late_writes(self):
+        """Перенос не теряет посты и правки, сделанные во время переноса."""
+        posts = [
+            Post.objects.create(author=self.author, text=str(number))
+            for number in range(3)
+        ]
+
+        def sleep(seconds):
+            Post.objects.using(self.source).filter(pk=posts[0].pk).update(
+                text='Правка', updated_at=timezone.now()
+            )
+
+        moved = sharding.move_authors(
+            [(self.author.pk, self.source, self.target)], grace=1,
+            sleep=sleep,
+        )
+        self.assertEqual(moved, {self.author.pk: 3})
+        self.assertEqual(sharding.shard_for(self.author.pk), self.target)
+        self.assertFalse(Post.objects.using(self.source).exists())
+        copies = Post.objects.using(self.target).in_bulk()
+        self.assertEqual(
+            {post.pk: post.pub_date for post in posts},
+            {pk: post.pub_date for pk, post in copies.items()},
+        )
+        self.assertEqual(copies[posts[0].pk].text, 'Правка')
+        self.assertEqual(
+            Profile.objects.using(self.target).get(
+                user=self.author
+            ).posts_count,
+            3,
+        )
+        post = Post.objects.create(author=self.author, text='После')
+        self.assertEqual(post._state.db, self.target)
+
+    def test_plan_moves(self):
+        """План переносит крупных авторов с тяжелого шарда на легкий."""
+        loads = {'a': {1: 10, 2: 6, 3: 1}, 'b': {4: 1}}
+        self.assertEqual(
+            sharding.plan_moves(loads, limit=5),
+            [(1, 'a', 'b', 10), (4, 'b', 'a', 1)],
+        )
+
+    def test_command_moves_posts_from_default(self):
+        """rebalance_shards --from-default раскладывает старые посты."""
+        with self.settings(POST_SHARDS=[]):
+            post = Post.objects.create(author=self.author, text='Старый')
+        out = StringIO()
+        call_command('rebalance_shards', '--dry-run', stdout=out)
+        self.assertIn('Переносить нечего', out.getvalue())
+        call_command('rebalance_shards', '--from-default', stdout=out)
+        self.assertIn('Перенесено постов: 1', out.getvalue())
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertTrue(
+            Post.objects.using(self.source).filter(pk=post.pk).exists()
+        )
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards', '--move', '1:shard_c')
+
+    def test_sync_shard_references(self):
+        """sync_shard_references докопирует и чистит справочники шардов."""
+        User.objects.using('shard_a').filter(pk=self.author.pk).delete()
+        User.objects.using('shard_b').bulk_create(
+            [User(id=10 ** 6, username='ghost')]
+        )
+        call_command('sync_shard_references', stdout=StringIO())
+        for alias in ('shard_a', 'shard_b'):
+            self.assertEqual(
+                list(User.objects.using(alias).values_list('pk', flat=True)),
+                [self.author.pk],
+            )
+        self.assertTrue(
+            Profile.objects.using('shard_a').filter(user=self.author)
+        )
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+
+from ..slow_queries import slow_query_log
+
+
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.report = os.path.join(directory.name, 'slow.jsonl')
+        slow_query_log.report()
+        self.addCleanup(slow_query_log.report)
+        wrapper = connection.execute_wrapper(slow_query_log)
+        wrapper.__enter__()
+        self.addCleanup(wrapper.__exit__, None, None, None)
+
+    def test_slow_statement_is_logged_with_view_and_plan(self):
+        """Медленный запрос попадает в лог с view и планом, без значений."""
+        with self.settings(SLOW_QUERY_THRESHOLD=0):
+            with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+                self.client.get(
+                    reverse('posts:profile', args=(self.author.username,))
+                )
+        output = '\n'.join(logs.output)
+        self.assertIn('в posts:profile', output)
+        self.assertIn('"username" = %s', output)
+        self.assertNotIn("'auth'", output)
+        self.assertNotIn(self.author.password, output)
+        self.assertIn('SEARCH auth_user', output)
+
+    def test_report_groups_fingerprints_and_scans(self):
+        """Отчет сводит запросы по форме и отмечает полные сканы."""
+        with self.settings(SLOW_QUERY_REPORT=self.report):
+            for text in ('раз', 'два', 'три'):
+                list(Post.objects.filter(text=text).order_by())
+            slow_query_log.flush()
+            output = StringIO()
+            call_command('slow_query_report', scans=True, stdout=output)
+        with open(self.report, encoding='utf-8') as report:
+            statements = json.loads(report.readline())['statements']
+        scans = [s for s in statements if '"text" = %s' in s['fingerprint']]
+        self.assertEqual(len(scans), 1)
+        self.assertEqual(scans[0]['count'], 3)
+        self.assertEqual(scans[0]['scans'], ['posts_post'])
+        self.assertIn('полный скан: posts_post', output.getvalue())
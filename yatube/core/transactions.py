@@ -0,0 +1,26 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+class ImmediateAtomic(transaction.Atomic):
+    def __enter__(self):
+        connection = connections[self.using or DEFAULT_DB_ALIAS]
+        immediate = hasattr(connection, 'begin_immediate')
+        if immediate:
+            connection.begin_immediate = not connection.in_atomic_block
+        try:
+            super().__enter__()
+        finally:
+            if immediate:
+                connection.begin_immediate = False
+
+
+def atomic_write(using=None, savepoint=True):
+    """transaction.atomic, который сразу берет блокировку записи.
+
+    Для блоков, которые сначала читают, а потом пишут: в SQLite с WAL
+    отложенная транзакция не начнет запись, если после ее первого чтения
+    закоммитил другой писатель. Внешний блок открывает транзакцию с
+    BEGIN IMMEDIATE, вложенный живет в транзакции внешнего. На других
+    бэкендах — обычный atomic.
+    """
+    return ImmediateAtomic(using, savepoint)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import registry
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token
+    )
+
+
+def metrics(request):
+    """Метрики в формате Prometheus по токену METRICS_TOKEN.
+
+    REMOTE_ADDR за прокси — адрес прокси, поэтому доступ только по
+    заголовку Authorization: Bearer; без токена эндпоинт выключен.
+    """
+    if not has_metrics_token(request):
+        raise Http404
+    return HttpResponse(
+        registry.expose(), content_type=PROMETHEUS_CONTENT_TYPE
+    )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import filter_by_search
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -12,10 +13,25 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'group' and request is not None:
+            # Выбор группы в каждой строке списка иначе читает все группы.
+            if not hasattr(request, '_group_choices'):
+                request._group_choices = list(field.choices)
+            field.choices = request._group_choices
+        return field
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_by_search(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,322 @@
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, Max
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.benchmark import measure, summary
+
+from users.models import Profile
+
+from . import sharding
+from .models import Group, Post, User
+from .search import SEARCH_TRIGGERS
+from .utils import CursorPaginator, encode_cursor
+
+SQLITE_MODES = {
+    # Как было: журнал отката, соединение на запрос, отложенный BEGIN.
+    'stock': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {},
+    },
+    'tuned': {
+        'ENGINE': 'core.backends.sqlite3',
+        'CONN_MAX_AGE': None,
+        'OPTIONS': {},
+    },
+}
+
+
+class ViewBenchmark:
+    """Прогоняет основные страницы через тестовый клиент.
+
+    Для каждой страницы собирает перцентили времени ответа, число
+    запросов к базе и размер ответа в байтах. Без warm кеш очищается
+    перед каждым запросом, чтобы мерить полный путь рендера. Прогон идет
+    на кешах из TEST_CACHES: общий кеш dev-сервера и воркеров не трогаем.
+    """
+
+    def __init__(self, repeat, warm=False):
+        self.repeat = repeat
+        self.warm = warm
+
+    def targets(self):
+        group = Group.objects.order_by('-posts_count', 'id').first()
+        author = User.objects.order_by('-profile__posts_count', 'id').first()
+        middle = Post.objects.aggregate(last=Max('id'))['last'] // 2
+        post = Post.objects.filter(id__gte=middle).order_by('id').first()
+        own_post = Post.objects.filter(author=author).order_by('-id').first()
+        pages = Post.objects.count() // settings.NUMBER_OBJECTS or 1
+        return author, (
+            ('index', 'get', reverse('posts:index'), None),
+            ('index_deep', 'get', '%s?page=%s' % (
+                reverse('posts:index'), pages // 2 or 1
+            ), None),
+            ('group_posts', 'get', reverse(
+                'posts:group_list', args=(group.slug,)
+            ), None),
+            ('profile', 'get', reverse(
+                'posts:profile', args=(author.username,)
+            ), None),
+            ('post_detail', 'get', reverse(
+                'posts:post_detail', args=(post.pk,)
+            ), None),
+            ('post_create', 'post', reverse('posts:post_create'), {
+                'text': 'Пост из бенчмарка', 'group': group.pk,
+            }),
+            ('post_edit', 'post', reverse(
+                'posts:post_edit', args=(own_post.pk,)
+            ), {'text': 'Правка из бенчмарка', 'group': group.pk}),
+        )
+
+    def run(self):
+        author, scenarios = self.targets()
+        with override_settings(CACHES=settings.TEST_CACHES):
+            client = Client()
+            client.force_login(author)
+            return {
+                name: self.run_view(client, method, url, data)
+                for name, method, url, data in scenarios
+            }
+
+    def run_view(self, client, method, url, data):
+        samples = []
+        queries = 0
+        size = 0
+        for _ in range(self.repeat):
+            if not self.warm:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                samples.append(time.perf_counter() - started)
+            queries = max(queries, len(captured))
+            size = len(response.content)
+        result = summary(samples)
+        result.update(queries=queries, bytes=size)
+        return result
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно сохраненного baseline."""
+    regressions = []
+    for scale, views in results.items():
+        for view, current in views.items():
+            previous = baseline.get(scale, {}).get(view)
+            if previous is None:
+                continue
+            if current['p95'] > previous['p95'] * (1 + tolerance):
+                regressions.append(
+                    '%s/%s: p95 %.2f мс, было %.2f мс' % (
+                        scale, view, current['p95'], previous['p95']
+                    )
+                )
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    '%s/%s: запросов %s, было %s' % (
+                        scale, view, current['queries'], previous['queries']
+                    )
+                )
+    return regressions
+
+
+def save_database(path):
+    """Копирует текущую базу default в файл path через backup API."""
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+class SQLiteBenchmark:
+    """Читатели и писатели в потоках на копии базы в режимах SQLITE_MODES.
+
+    Читатель берет страницу главной, писатель в транзакции добавляет
+    пост и увеличивает счетчик автора, а счетчик группы правит отдельным
+    запросом вне транзакции, как сигналы после post_create. После каждой
+    операции соединение закрывается по правилам CONN_MAX_AGE, как в
+    конце запроса.
+    """
+
+    def __init__(self, source, readers, writers, duration):
+        self.source = source
+        self.readers = readers
+        self.writers = writers
+        self.duration = duration
+        self.author_ids = list(User.objects.values_list('id', flat=True))
+        self.group_ids = list(Group.objects.values_list('id', flat=True))
+
+    def run(self, mode, directory):
+        alias = 'benchmark_%s' % mode
+        path = os.path.join(directory, '%s.sqlite3' % mode)
+        shutil.copyfile(self.source, path)
+        connections.databases[alias] = dict(
+            settings.DATABASES['default'], NAME=path, **SQLITE_MODES[mode]
+        )
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        deadline = time.monotonic() + self.duration
+
+        def worker(kind, number):
+            rng = random.Random('%s:%s' % (kind, number))
+            operation = getattr(self, kind)
+            database = connections[alias]
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operation(alias, rng)
+                        failed = False
+                    except DatabaseError:
+                        failed = True
+                    elapsed = time.perf_counter() - started
+                    database.close_if_unusable_or_obsolete()
+                    with lock:
+                        if failed:
+                            errors[kind] += 1
+                        else:
+                            samples[kind].append(elapsed)
+            finally:
+                database.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(kind, number))
+            for kind, total in (
+                ('read', self.readers), ('write', self.writers)
+            )
+            for number in range(total)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        del connections.databases[alias]
+        return {
+            kind: dict(
+                summary(samples[kind]),
+                ops=len(samples[kind]),
+                per_second=len(samples[kind]) / elapsed,
+                errors=errors[kind],
+            )
+            for kind in ('read', 'write')
+        }
+
+    def read(self, alias, rng):
+        list(Post.objects.using(alias).select_related(
+            'author', 'group'
+        )[:settings.NUMBER_OBJECTS])
+
+    def write(self, alias, rng):
+        author_id = rng.choice(self.author_ids)
+        group_id = rng.choice(self.group_ids)
+        with transaction.atomic(using=alias):
+            Post.objects.using(alias).bulk_create([Post(
+                text='Пост из бенчмарка SQLite',
+                author_id=author_id,
+                group_id=group_id,
+            )])
+            Profile.objects.using(alias).filter(user_id=author_id).update(
+                posts_count=F('posts_count') + 1
+            )
+        Group.objects.using(alias).filter(id=group_id).update(
+            posts_count=F('posts_count') + 1
+        )
+
+
+class ShardBenchmark:
+    """Задержка слитых лент при росте числа шардов.
+
+    Копия засеянной базы source раскладывается на count файлов по
+    author_id % count, как делает shard_for без справочника. Меряются
+    первая и глубокая страницы главной (через OFFSET и через курсор),
+    страница группы и профиль, который читает один шард.
+    """
+
+    def __init__(self, source, repeat, deep_page):
+        self.source = source
+        self.repeat = repeat
+        self.deep_page = deep_page
+        self.group = Group.objects.order_by('-posts_count', 'id').first()
+        self.author_id = User.objects.order_by(
+            '-profile__posts_count', 'id'
+        ).values_list('id', flat=True).first()
+
+    def split(self, count, directory):
+        aliases = []
+        for number in range(count):
+            alias = 'benchmark_shard%s_%s' % (count, number)
+            path = os.path.join(directory, '%s.sqlite3' % alias)
+            shutil.copyfile(self.source, path)
+            database = sqlite3.connect(path)
+            try:
+                for trigger in SEARCH_TRIGGERS:
+                    database.execute('DROP TRIGGER IF EXISTS %s' % trigger)
+                database.execute('DELETE FROM posts_timelineentry')
+                database.execute(
+                    'DELETE FROM posts_post WHERE author_id % ? != ?',
+                    (count, number),
+                )
+                database.commit()
+            finally:
+                database.close()
+            connections.databases[alias] = dict(
+                settings.DATABASES['default'], NAME=path
+            )
+            aliases.append(alias)
+        return aliases
+
+    def run(self, count, directory):
+        aliases = self.split(count, directory)
+        try:
+            with override_settings(POST_SHARDS=aliases):
+                return {
+                    name: self.measure(read)
+                    for name, read in self.scenarios()
+                }
+        finally:
+            for alias in aliases:
+                connections[alias].close()
+                del connections[alias]
+                del connections.databases[alias]
+
+    def measure(self, read):
+        read()
+        return summary(measure(read, self.repeat))
+
+    def scenarios(self):
+        per_page = settings.NUMBER_OBJECTS
+        offset = self.deep_page * per_page
+        posts = sharding.all_posts().select_related('author', 'group')
+        cursor = encode_cursor(posts[offset - 1])
+        paginator = CursorPaginator(posts, per_page)
+        group_posts = sharding.group_posts(self.group).select_related(
+            'author'
+        )
+        profile = Post.objects.using(
+            sharding.hashed_shard(self.author_id)
+        ).filter(author_id=self.author_id).select_related('group')
+        return (
+            ('index', lambda: posts[:per_page]),
+            ('index_deep', lambda: posts[offset:offset + per_page]),
+            ('index_cursor_deep', lambda: paginator.get_page(
+                after=cursor
+            ).object_list),
+            ('group_posts', lambda: group_posts[:per_page]),
+            ('profile', lambda: list(profile[:per_page])),
+        )
@@ -0,0 +1,139 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from core.page_cache import purge_page
+
+from users.models import Profile
+
+from .counters import change_author_count, change_group_count
+from .lookups import GROUPS, USERS
+from .models import Follow, Group, Post, User
+from .signals import purge_view
+from .timeline import fill_timeline
+from .utils import invalidate_counts
+
+INSERT_FIELDS = ('text', 'author', 'group', 'pub_date', 'updated_at')
+
+
+class RelationMap:
+    """Username и slug -> id, недостающие создаются пачкой."""
+
+    def __init__(self):
+        self.authors = {}
+        self.groups = {}
+        self.created_authors = {}
+        self.created_groups = {}
+
+    def resolve(self, usernames, slugs):
+        self._resolve_authors(set(usernames) - self.authors.keys())
+        self._resolve_groups(set(slugs) - self.groups.keys() - {None})
+
+    def _resolve_authors(self, usernames):
+        if not usernames:
+            return
+        self.authors.update(User.objects.filter(
+            username__in=usernames
+        ).values_list('username', 'id'))
+        missing = usernames - self.authors.keys()
+        User.objects.bulk_create(
+            User(username=username, password=make_password(None))
+            for username in missing
+        )
+        created = dict(User.objects.filter(
+            username__in=missing
+        ).values_list('username', 'id'))
+        Profile.objects.bulk_create(
+            Profile(user_id=user_id) for user_id in created.values()
+        )
+        self.authors.update(created)
+        self.created_authors.update(created)
+
+    def _resolve_groups(self, slugs):
+        if not slugs:
+            return
+        self.groups.update(Group.objects.filter(
+            slug__in=slugs
+        ).values_list('slug', 'id'))
+        missing = slugs - self.groups.keys()
+        Group.objects.bulk_create(
+            Group(slug=slug, title=slug, description='') for slug in missing
+        )
+        created = dict(Group.objects.filter(
+            slug__in=missing
+        ).values_list('slug', 'id'))
+        self.groups.update(created)
+        self.created_groups.update(created)
+
+
+def insert_sql():
+    columns = ', '.join(
+        connection.ops.quote_name(Post._meta.get_field(name).column)
+        for name in INSERT_FIELDS
+    )
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(Post._meta.db_table),
+        columns,
+        ', '.join(['%s'] * len(INSERT_FIELDS)),
+    )
+
+
+def post_rows(posts):
+    """Строки для insert_sql: pub_date берется из поста как есть.
+
+    bulk_create вызывает pre_save полей, и auto_now_add затер бы дату
+    загружаемого поста.
+    """
+    fields = [Post._meta.get_field(name) for name in INSERT_FIELDS]
+    now = timezone.now()
+    for post in posts:
+        post.updated_at = now
+        yield tuple(
+            field.get_db_prep_save(getattr(post, field.attname), connection)
+            for field in fields
+        )
+
+
+def insert_posts(posts):
+    """Вставляет посты одной транзакцией и поправляет счетчики.
+
+    Сигналы сохранения при этом не шлются, кеши и ленты после загрузки
+    обновляет refresh_after_import.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(insert_sql(), list(post_rows(posts)))
+        authors = Counter(post.author_id for post in posts)
+        groups = Counter(post.group_id for post in posts if post.group_id)
+        for author_id, total in authors.items():
+            change_author_count(author_id, total)
+        for group_id, total in groups.items():
+            change_group_count(group_id, total)
+
+
+def refresh_after_import(relations):
+    """Сбрасывает кеши и дополняет ленты после загрузки постов.
+
+    Новые авторы и группы сбрасываются вместе с ключами по username и slug:
+    там мог остаться ответ «такого нет» от запроса до загрузки.
+    """
+    invalidate_counts(relations.authors.values(), relations.groups.values())
+    for username, pk in relations.created_authors.items():
+        USERS.forget(User(pk=pk, username=username))
+    for slug, pk in relations.created_groups.items():
+        GROUPS.forget(Group(pk=pk, slug=slug))
+    purge_page(reverse('posts:index'))
+    for username in relations.authors:
+        purge_view('posts:profile', username)
+    for slug in relations.groups:
+        purge_view('posts:group_list', slug)
+    followed = defaultdict(list)
+    for user_id, author_id in Follow.objects.filter(
+        author_id__in=relations.authors.values()
+    ).values_list('user_id', 'author_id'):
+        followed[user_id].append(author_id)
+    for user_id, author_ids in followed.items():
+        fill_timeline(user_id, author_ids)
@@ -0,0 +1,43 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from core.metrics import cache_result
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post):
+    """Ключ карточки меняется вместе с постом, именем автора и группой."""
+    author = post.author
+    group = post.group
+    version = hashlib.md5(repr((
+        post.text,
+        post.pub_date.isoformat(),
+        author.username,
+        author.get_full_name(),
+        group and (group.slug, group.title),
+        get_language(),
+    )).encode()).hexdigest()
+    return 'posts:card:%s:%s' % (post.pk, version)
+
+
+def render_cards(page_obj):
+    """Прикрепляет к постам страницы готовые карточки `post.card`."""
+    page_obj.object_list = list(page_obj.object_list)
+    keys = {card_key(post): post for post in page_obj.object_list}
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in keys.items():
+        if key not in cards:
+            cards[key] = missing[key] = render_to_string(
+                CARD_TEMPLATE, {'post': post}
+            )
+        post.card = mark_safe(cards[key])
+    cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+    cache_result('card', hits=len(keys) - len(missing), misses=len(missing))
+    return page_obj
@@ -0,0 +1,59 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import sharding
+from .models import Post
+
+STATE_FIELDS = (
+    'updated_at',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'author__profile__posts_count',
+    'group__slug',
+    'group__title',
+)
+
+
+def post_state(post_id):
+    return sharding.find_post(
+        post_id,
+        lambda alias: Post.objects.using(alias).filter(
+            id=post_id
+        ).values_list(*STATE_FIELDS).first(),
+    )
+
+
+def conditional_post(view):
+    """ETag/Last-Modified для страницы поста до рендера шаблона.
+
+    ETag учитывает правку поста, смену группы и имени автора, счётчик
+    постов автора и текущего пользователя (в шапке персональные блоки).
+    Last-Modified берётся из updated_at.
+    """
+    @wraps(view)
+    def wrapper(request, post_id):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, post_id)
+        state = post_state(post_id)
+        if state is None:
+            return view(request, post_id)
+        updated_at = state[0]
+        etag = quote_etag(hashlib.md5(repr((
+            updated_at.isoformat(), state[1:], request.user.pk,
+        )).encode()).hexdigest())
+        last_modified = int(updated_at.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view(request, post_id)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+    return wrapper
@@ -0,0 +1,103 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Profile
+
+from . import sharding
+from .lookups import GROUPS, USERS
+from .models import Group, Post, User
+
+
+def _change_count(queryset, delta):
+    if delta < 0:
+        queryset = queryset.filter(posts_count__gte=-delta)
+    return queryset.update(posts_count=F('posts_count') + delta)
+
+
+def change_author_count(author_id, delta):
+    profiles = Profile.objects.filter(user_id=author_id)
+    updated = _change_count(profiles, delta)
+    if not updated and delta > 0:
+        Profile.objects.get_or_create(
+            user_id=author_id,
+            defaults={
+                'posts_count': Post.objects.using(
+                    sharding.shard_for(author_id)
+                ).filter(author_id=author_id).count(),
+            },
+        )
+    if sharding.enabled():
+        # Счетчик показывает страница поста, а она читает шард автора.
+        sharding.replicate(
+            Profile, profiles, [sharding.shard_for(author_id)]
+        )
+    # Счетчик показывает страница автора, а профиль берется из кеша.
+    USERS.forget(pk=author_id)
+
+
+def change_group_count(group_id, delta):
+    if group_id is not None:
+        _change_count(Group.objects.filter(id=group_id), delta)
+        # Счетчик показывает страница группы, а группа берется из кеша.
+        GROUPS.forget(pk=group_id)
+
+
+def _posts_total(field, outer_field):
+    totals = Post.objects.filter(**{field: OuterRef(outer_field)}).order_by()
+    totals = totals.values(field).annotate(total=Count('pk'))
+    return Coalesce(Subquery(totals.values('total')), 0)
+
+
+def _recount_sharded():
+    fixed = 0
+    for model, key, field in (
+        (Profile, 'user_id', 'author_id'),
+        (Group, 'pk', 'group_id'),
+    ):
+        totals = Counter()
+        for posts in sharding.post_querysets():
+            totals.update(dict(
+                posts.order_by().values_list(field).annotate(total=Count('pk'))
+            ))
+        drift = [
+            pk for pk, count in model.objects.values_list(key, 'posts_count')
+            if count != totals[pk]
+        ]
+        for pk in drift:
+            model.objects.filter(**{key: pk}).update(posts_count=totals[pk])
+        if model is Profile:
+            sharding.replicate(
+                Profile, Profile.objects.filter(user_id__in=drift)
+            )
+        else:
+            for pk in drift:
+                GROUPS.forget(pk=pk)
+        fixed += len(drift)
+    return fixed
+
+
+def recount_posts():
+    """Сверяет счетчики постов с таблицей. Возвращает число исправлений."""
+    missing = User.objects.filter(profile__isnull=True)
+    Profile.objects.bulk_create(
+        Profile(user_id=user_id)
+        for user_id in missing.values_list('id', flat=True).iterator()
+    )
+    if sharding.enabled():
+        return _recount_sharded()
+    fixed = 0
+    for queryset, total in (
+        (Profile.objects.all(), _posts_total('author', 'user_id')),
+        (Group.objects.all(), _posts_total('group', 'pk')),
+    ):
+        drift = queryset.annotate(actual=total)
+        drift = list(drift.exclude(
+            posts_count=F('actual')
+        ).values_list('pk', flat=True))
+        fixed += queryset.filter(pk__in=drift).update(posts_count=total)
+        if queryset.model is Group:
+            for pk in drift:
+                GROUPS.forget(pk=pk)
+    return fixed
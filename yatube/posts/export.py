@@ -0,0 +1,79 @@
+import csv
+import heapq
+import io
+import json
+import zlib
+
+from django.conf import settings
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FIELDS = ('id', 'text', 'author', 'group', 'pub_date')
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_rows(posts):
+    """Строки выгрузки по возрастанию id.
+
+    Лента шардов (sharding.MergedPosts) выгружается сливанием строк
+    шардов по id.
+    """
+    return heapq.merge(*(
+        iter_queryset_rows(queryset)
+        for queryset in getattr(posts, 'querysets', [posts])
+    ))
+
+
+def iter_queryset_rows(queryset):
+    """Читает посты короткими запросами по id, не держа длинное чтение."""
+    queryset = queryset.order_by('id').values_list(
+        'id', 'text', 'author__username', 'group__slug', 'pub_date'
+    )
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)[:settings.EXPORT_BATCH_SIZE]
+        )
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def iter_lines(rows, file_format):
+    if file_format == 'jsonl':
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record['pub_date'] = record['pub_date'].isoformat()
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row[:-1] + (row[-1].isoformat(),))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_posts(queryset, file_format='jsonl', compress=False):
+    """Отдает выгрузку постов кусками байтов, по желанию в gzip."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    chunk = []
+    size = 0
+    for line in iter_lines(iter_rows(queryset), file_format):
+        data = line.encode()
+        chunk.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            data = b''.join(chunk)
+            chunk, size = [], 0
+            yield compressor.compress(data) if compressor else data
+    data = b''.join(chunk)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,176 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date, quote_etag
+
+from core.cache import Namespace, get_or_compute
+from core.replicas import replica_reads
+
+from . import sharding
+from .lookups import GROUPS, USERS, attach_related
+
+# Версия имен авторов и названий групп, которые выводят ленты.
+FEED_RELATIONS = Namespace('posts:feed:relations')
+
+
+class LatestPostsFeed(Feed):
+    title = 'Yatube: последние записи'
+    description = 'Последние обновления на сайте'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def items(self):
+        return attach_related(sharding.all_posts()[:settings.FEED_ITEMS])
+
+    def item_title(self, item):
+        return str(item)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=(item.pk,))
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+
+class GroupPostsFeed(LatestPostsFeed):
+    def get_object(self, request, slug):
+        return GROUPS.get_or_404(slug)
+
+    def title(self, group):
+        return 'Yatube: %s' % group.title
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=(group.slug,))
+
+    def items(self, group):
+        return attach_related(
+            sharding.group_posts(group)[:settings.FEED_ITEMS]
+        )
+
+
+class AuthorPostsFeed(LatestPostsFeed):
+    def get_object(self, request, username):
+        return USERS.get_or_404(username)
+
+    def title(self, author):
+        return 'Yatube: %s' % (author.get_full_name() or author.username)
+
+    def description(self, author):
+        return 'Посты пользователя %s' % author.username
+
+    def link(self, author):
+        return reverse('posts:profile', args=(author.username,))
+
+    def items(self, author):
+        return attach_related(
+            sharding.author_posts(author)[:settings.FEED_ITEMS]
+        )
+
+
+def atom(feed_class):
+    return type(
+        'Atom' + feed_class.__name__,
+        (feed_class,),
+        {'feed_type': Atom1Feed, 'subtitle': feed_class.description},
+    )
+
+
+def feed_state(**scope):
+    """Состояние ленты для ETag: первые FEED_ITEMS постов по ее индексу.
+
+    (pub_date, id, updated_at) постов, попадающих в ленту, — новый пост,
+    правка и удаление поста из ленты меняют этот набор, а правки старых
+    постов за ее пределами — нет. None, если лента пуста.
+    """
+    filters = {}
+    for name, objects, field in (
+        ('slug', GROUPS, 'group_id'), ('username', USERS, 'author_id'),
+    ):
+        if name in scope:
+            obj = objects.get(scope[name])
+            if obj is None:
+                return None
+            filters[field] = obj.pk
+    rows = sorted(
+        (
+            row
+            for posts in sharding.post_querysets(**filters)
+            for row in posts.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id', 'updated_at'
+            )[:settings.FEED_ITEMS]
+        ),
+        reverse=True,
+    )[:settings.FEED_ITEMS]
+    return rows or None
+
+
+def conditional_feed(feed_classes):
+    """Лента с ETag/Last-Modified и кешированным телом.
+
+    ETag строится из самой новой даты публикации, самой поздней правки,
+    числа постов ленты, id последнего из них и версии FEED_RELATIONS,
+    которую меняет правка пользователя или группы. На повторный опрос без
+    изменений отвечает 304 после одного запроса по индексу ленты.
+    """
+    feeds = {kind: feed_class() for kind, feed_class in feed_classes.items()}
+
+    @replica_reads
+    def view(request, kind, **scope):
+        if kind not in feeds:
+            raise Http404
+        rows = feed_state(**scope)
+        if rows is None:
+            return feeds[kind](request, **scope)
+        newest = rows[0][0]
+        updated = max(max(row[2] for row in rows), newest)
+        etag = quote_etag(hashlib.md5(repr((
+            request.path, newest.isoformat(), updated.isoformat(),
+            len(rows), rows[-1][1], FEED_RELATIONS.version(),
+        )).encode()).hexdigest())
+        last_modified = int(updated.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            def render():
+                response = feeds[kind](request, **scope)
+                return response['Content-Type'], response.content
+
+            content_type, content = get_or_compute(
+                'posts:feed:%s' % etag, render, settings.FEED_CACHE_TIMEOUT,
+                name='feed',
+            )
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+    return view
+
+
+index_feed = conditional_feed({
+    'rss': LatestPostsFeed,
+    'atom': atom(LatestPostsFeed),
+})
+group_feed = conditional_feed({
+    'rss': GroupPostsFeed,
+    'atom': atom(GroupPostsFeed),
+})
+profile_feed = conditional_feed({
+    'rss': AuthorPostsFeed,
+    'atom': atom(AuthorPostsFeed),
+})
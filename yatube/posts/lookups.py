@@ -0,0 +1,135 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from core.metrics import cache_result
+
+from .models import Group, Post, User
+
+# Ответ «такого нет» в ключе по полю, 0 не бывает id.
+MISSING = 0
+
+
+class ObjectCache:
+    """Кеш объектов model по id и по уникальному полю field.
+
+    Ключ по полю хранит id объекта или MISSING: повторные запросы к
+    несуществующим адресам не доходят до базы. Записи сбрасывает forget()
+    из сигналов сохранения и удаления. Ключ по старому значению поля после
+    переименования остается, но ведет к объекту с другим значением и
+    считается промахом. fields — поля, которые попадают в кеш, related —
+    связанные объекты, которые кешируются вместе с объектом.
+    """
+
+    def __init__(self, name, model, field, fields=None, related=()):
+        self.name = name
+        self.model = model
+        self.field = field
+        self.fields = fields
+        self.related = related
+
+    def id_key(self, pk):
+        return 'objects:%s:id:%s' % (self.name, pk)
+
+    def field_key(self, value):
+        # В ключе memcached нельзя пробелы и не-ASCII, а slug бывает
+        # кириллическим.
+        value = hashlib.md5(str(value).encode()).hexdigest()
+        return 'objects:%s:%s:%s' % (self.name, self.field, value)
+
+    def queryset(self):
+        queryset = self.model.objects.select_related(*self.related)
+        if self.fields:
+            queryset = queryset.only(*self.fields)
+        return queryset
+
+    def _get_many(self, pks):
+        keys = {self.id_key(pk): pk for pk in pks}
+        found = {
+            keys[key]: obj for key, obj in cache.get_many(keys).items()
+        }
+        missing = [pk for pk in keys.values() if pk not in found]
+        if missing:
+            loaded = self.queryset().in_bulk(missing)
+            cache.set_many({
+                self.id_key(pk): obj for pk, obj in loaded.items()
+            }, settings.OBJECT_CACHE_TIMEOUT)
+            found.update(loaded)
+        return found, len(missing)
+
+    def get_many(self, pks):
+        """{id: объект} для существующих из pks."""
+        found, missing = self._get_many(set(pks))
+        cache_result(self.name, hits=len(found) - missing, misses=missing)
+        return found
+
+    def get(self, value):
+        """Объект с field=value или None."""
+        key = self.field_key(value)
+        pk = cache.get(key)
+        if pk == MISSING:
+            cache_result(self.name, hits=1)
+            return None
+        if pk is not None:
+            obj = self._get_many([pk])[0].get(pk)
+            if obj is not None and getattr(obj, self.field) == value:
+                cache_result(self.name, hits=1)
+                return obj
+        cache_result(self.name, misses=1)
+        obj = self.queryset().filter(**{self.field: value}).first()
+        if obj is None:
+            cache.set(key, MISSING, settings.OBJECT_CACHE_MISS_TIMEOUT)
+        else:
+            cache.set_many(
+                {key: obj.pk, self.id_key(obj.pk): obj},
+                settings.OBJECT_CACHE_TIMEOUT,
+            )
+        return obj
+
+    def get_or_404(self, value):
+        obj = self.get(value)
+        if obj is None:
+            raise Http404('No %s matches the given query.' % (
+                self.model._meta.object_name
+            ))
+        return obj
+
+    def forget(self, obj=None, pk=None):
+        """Сбрасывает объект; по одному pk — без ключа по полю."""
+        keys = [self.id_key(obj.pk if obj is not None else pk)]
+        if obj is not None:
+            keys.append(self.field_key(getattr(obj, self.field)))
+        cache.delete_many(keys)
+
+
+GROUPS = ObjectCache('group', Group, 'slug')
+# Хеш пароля и прочие поля учетной записи в кеш не кладутся. Счетчик
+# постов из профиля нужен странице автора; его сбрасывает
+# change_author_count.
+USERS = ObjectCache(
+    'user', User, 'username',
+    ('id', 'username', 'first_name', 'last_name', 'profile__posts_count'),
+    related=('profile',),
+)
+
+
+def attach_related(posts):
+    """Посты с авторами и группами из кеша вместо select_related."""
+    posts = list(posts)
+    authors = USERS.get_many(post.author_id for post in posts)
+    groups = GROUPS.get_many(
+        post.group_id for post in posts if post.group_id is not None
+    )
+    for post in posts:
+        if post.author_id in authors:
+            Post.author.field.set_cached_value(post, authors[post.author_id])
+        if post.group_id in groups:
+            Post.group.field.set_cached_value(post, groups[post.group_id])
+    return posts
+
+
+def attach_page(page_obj):
+    page_obj.object_list = attach_related(page_obj.object_list)
+    return page_obj
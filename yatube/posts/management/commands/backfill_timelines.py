@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Follow
+from posts.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Читатели; по умолчанию все, у кого есть подписки.',
+        )
+
+    def handle(self, *args, **options):
+        readers = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+        if options['usernames']:
+            readers = readers.filter(user__username__in=options['usernames'])
+        rebuilt = 0
+        entries = 0
+        for user_id in list(readers):
+            entries += rebuild_timeline(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            'Собрано лент: %s, записей: %s' % (rebuilt, entries)
+        ))
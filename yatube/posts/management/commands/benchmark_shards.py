@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+from argparse import ArgumentTypeError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import temporary_database
+from posts.benchmark import ShardBenchmark, save_database
+from posts.seeding import SeedPlan, seed
+
+
+def counts(value):
+    try:
+        chosen = [int(count) for count in value.split(',')]
+    except ValueError:
+        raise CommandError('Ожидаются числа через запятую, например 1,2,4.')
+    if min(chosen) < 1:
+        raise CommandError('Число шардов должно быть положительным.')
+    return chosen
+
+
+def positive(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError('Ожидается целое число от 1.')
+    return number
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет задержку слитых лент главной и групп при разном числе '
+        'шардов на файловых копиях засеянной базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--shards', type=counts, default=[1, 2, 4, 8])
+        parser.add_argument('--repeat', type=positive, default=50)
+        parser.add_argument(
+            '--deep-page', type=positive, default=50,
+            help='Номер глубокой страницы главной.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'source.sqlite3')
+            with temporary_database():
+                seed(SeedPlan(options['posts'], seed=options['seed']))
+                save_database(source)
+                benchmark = ShardBenchmark(
+                    source, options['repeat'], options['deep_page']
+                )
+            for count in options['shards']:
+                results[count] = benchmark.run(count, directory)
+                self.report(count, results[count])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def report(self, count, result):
+        self.stdout.write('Шардов: %s' % count)
+        for name, stats in result.items():
+            self.stdout.write(
+                '  {name}: p50={p50:.2f} мс p95={p95:.2f} мс '
+                'p99={p99:.2f} мс'.format(name=name, **stats)
+            )
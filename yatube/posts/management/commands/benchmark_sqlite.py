@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import temporary_database
+from posts.benchmark import SQLITE_MODES, SQLiteBenchmark, save_database
+from posts.seeding import SeedPlan, seed
+
+
+def modes(value):
+    chosen = value.split(',')
+    unknown = set(chosen) - SQLITE_MODES.keys()
+    if unknown:
+        raise CommandError('Неизвестные режимы: %s' % ', '.join(unknown))
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи SQLite в '
+        'исходном режиме и в core.backends.sqlite3 на файловых копиях '
+        'засеянной базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5)
+        parser.add_argument(
+            '--modes', type=modes, default=list(SQLITE_MODES),
+            help='Через запятую из: %s.' % ', '.join(SQLITE_MODES),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'source.sqlite3')
+            with temporary_database():
+                seed(SeedPlan(options['posts'], seed=options['seed']))
+                save_database(source)
+                benchmark = SQLiteBenchmark(
+                    source, options['readers'], options['writers'],
+                    options['duration'],
+                )
+            for mode in options['modes']:
+                results[mode] = benchmark.run(mode, directory)
+                self.report(mode, results[mode])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def report(self, mode, result):
+        self.stdout.write(mode)
+        for kind, stats in result.items():
+            self.stdout.write(
+                '  {kind}: {ops} операций, {per_second:.1f}/с, '
+                'p50={p50:.2f} мс p95={p95:.2f} мс p99={p99:.2f} мс, '
+                'ошибок {errors}'.format(kind=kind, **stats)
+            )
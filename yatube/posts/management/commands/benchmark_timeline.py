@@ -0,0 +1,117 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.benchmark import measure, summary, temporary_database
+from posts.models import Follow, Post, User
+from posts.timeline import (
+    attach_posts, fan_out, pull_timeline, rebuild_timeline, timeline
+)
+
+
+class Page:
+    def __init__(self, object_list):
+        self.object_list = object_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает материализованную ленту подписок с чтением '
+        'при показе на временной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=200)
+        parser.add_argument('--readers', type=int, default=500)
+        parser.add_argument('--follows', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            readers = self.seed(options)
+            self.report('Сборка ленты', measure(
+                lambda: rebuild_timeline(random.choice(readers)),
+                min(options['repeat'], len(readers)),
+            ))
+            for user_id in readers:
+                rebuild_timeline(user_id)
+            self.compare(readers, options['repeat'])
+            posts = iter(self.fresh_posts(
+                readers, options['repeat'] // 10 or 1
+            ))
+            self.report('Раскладка поста', measure(
+                lambda: fan_out(next(posts)), options['repeat'] // 10 or 1
+            ))
+
+    def seed(self, options):
+        random.seed(options['seed'])
+        User.objects.bulk_create(
+            User(username='author%s' % number)
+            for number in range(options['authors'])
+        )
+        User.objects.bulk_create(
+            User(username='reader%s' % number)
+            for number in range(options['readers'])
+        )
+        authors = list(User.objects.filter(
+            username__startswith='author'
+        ).values_list('id', flat=True))
+        readers = list(User.objects.filter(
+            username__startswith='reader'
+        ).values_list('id', flat=True))
+        Follow.objects.bulk_create(
+            Follow(user_id=reader, author_id=author)
+            for reader in readers
+            for author in random.sample(
+                authors, min(options['follows'], len(authors))
+            )
+        )
+        Post.objects.bulk_create(
+            (
+                Post(author_id=random.choice(authors), text='Пост %s' % number)
+                for number in range(options['posts'])
+            ),
+            batch_size=500,
+        )
+        return readers
+
+    def fresh_posts(self, readers, count):
+        """Новые посты автора, которые еще не разложены по лентам.
+
+        Повторная раскладка одного поста меряет только ignore_conflicts.
+        bulk_create не шлет сигналов, так что посты не раскладываются
+        при создании.
+        """
+        author = User.objects.exclude(id__in=readers).first()
+        Post.objects.bulk_create(
+            Post(author=author, text='Раскладка %s' % number)
+            for number in range(count)
+        )
+        return list(
+            Post.objects.filter(author=author, text__startswith='Раскладка ')
+            .order_by('id')
+        )
+
+    def compare(self, readers, repeat):
+        per_page = settings.NUMBER_OBJECTS
+        users = {user.pk: user for user in User.objects.filter(id__in=readers)}
+
+        def materialized():
+            user = users[random.choice(readers)]
+            attach_posts(Page(list(timeline(user)[:per_page])))
+
+        def pulled():
+            user = users[random.choice(readers)]
+            attach_posts(Page(list(pull_timeline(user)[:per_page])))
+
+        self.report('Материализованная лента', measure(materialized, repeat))
+        self.report('Чтение при показе', measure(pulled, repeat))
+
+    def report(self, title, samples):
+        self.stdout.write(
+            '{title}: p50={p50:.2f} мс p95={p95:.2f} мс p99={p99:.2f} мс'
+            .format(title=title, **summary(samples))
+        )
@@ -0,0 +1,83 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import temporary_database
+from posts.benchmark import ViewBenchmark, compare
+from posts.seeding import SeedPlan, seed
+
+
+def scales(value):
+    try:
+        return sorted({int(scale) for scale in value.split(',')})
+    except ValueError:
+        raise CommandError(
+            'Масштабы перечисляются через запятую: 10000,100000'
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные страницы на временной базе нескольких '
+        'масштабов и сравнивает результат с baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=scales, default=[10000])
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Процессы для генерации данных, см. seed.',
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кеш между запросами.',
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument('--baseline', help='JSON прошлого запуска.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95, доля.',
+        )
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)['results']
+        results = {}
+        benchmark = ViewBenchmark(options['repeat'], warm=options['warm'])
+        for scale in options['scales']:
+            with temporary_database():
+                seed(SeedPlan(scale, seed=options['seed']), options['workers'])
+                results[str(scale)] = benchmark.run()
+            self.report(scale, results[str(scale)])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({
+                    'meta': {
+                        'seed': options['seed'],
+                        'repeat': options['repeat'],
+                        'warm': options['warm'],
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                    },
+                    'results': results,
+                }, output, ensure_ascii=False, indent=2)
+        regressions = compare(results, baseline, options['tolerance'])
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError('Регрессий: %s' % len(regressions))
+
+    def report(self, scale, views):
+        self.stdout.write('Постов: %s' % scale)
+        for view, result in views.items():
+            self.stdout.write(
+                '  {view}: p50={p50:.2f} мс p95={p95:.2f} мс '
+                'p99={p99:.2f} мс, запросов {queries}, {bytes} байт'
+                .format(view=view, **result)
+            )
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core.benchmark import temporary_database
+from core.query_plans import shape_changes
+from posts.query_plans import (
+    SNAPSHOT, collect, load_snapshot, regressions, seed_database,
+    write_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает планы запросов всех страниц на временной засеянной базе '
+        'и перезаписывает снимок, с которым сверяются тесты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=SNAPSHOT)
+
+    def handle(self, *args, **options):
+        # Сценарии очищают кеш перед каждым шагом, общий не трогаем.
+        with temporary_database(), override_settings(
+                CACHES=settings.TEST_CACHES):
+            seed_database()
+            plans = collect()
+        snapshot = load_snapshot(options['path'])
+        for line in regressions(plans, snapshot):
+            self.stdout.write('Принято: %s' % line)
+        for line in shape_changes(plans, snapshot):
+            self.stdout.write('Изменено: %s' % line)
+        write_snapshot(plans, options['path'])
+        self.stdout.write('Снимок записан: %s' % options['path'])
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.export import FORMATS, export_posts
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты автора, группы или все в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group()
+        scope.add_argument('--author', help='Username автора.')
+        scope.add_argument('--group', help='Slug группы.')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument(
+            '--output', default='-', help='Путь к файлу или - для stdout.'
+        )
+
+    def handle(self, *args, **options):
+        posts = sharding.all_posts()
+        if options['author']:
+            posts = posts.filter(author__username=options['author'])
+        if options['group']:
+            posts = posts.filter(group__slug=options['group'])
+        chunks = export_posts(posts, options['format'], options['gzip'])
+        if options['output'] == '-':
+            self.write(sys.stdout.buffer, chunks)
+            return
+        with open(options['output'], 'wb') as output:
+            self.write(output, chunks)
+
+    def write(self, output, chunks):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
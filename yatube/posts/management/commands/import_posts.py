@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import sharding
+from posts.bulk import RelationMap, insert_posts, refresh_after_import
+from posts.models import Post
+
+FORMATS = ('jsonl', 'csv')
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def parse_pub_date(value):
+    """datetime из ISO 8601 или None, если дата не разбирается."""
+    try:
+        return parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты из JSONL или CSV (файл или stdin). Поля записи: '
+        'text, author, group (slug), pub_date (ISO 8601).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Путь к файлу или - для stdin.')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с числом загруженных записей для продолжения.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на checkpoint.',
+        )
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            raise CommandError(
+                'import_posts пишет посты прямо в default. Загрузите их '
+                'без POST_SHARDS и разложите командой '
+                'rebalance_shards --from-default.'
+            )
+        source = options['source']
+        file_format = options['format'] or os.path.splitext(
+            source
+        )[1].lstrip('.')
+        if file_format not in FORMATS:
+            raise CommandError('Укажите --format: jsonl или csv.')
+        checkpoint = options['checkpoint']
+        if checkpoint is None and source != '-':
+            checkpoint = source + '.checkpoint'
+        done = 0
+        if checkpoint and not options['restart']:
+            done = self.read_checkpoint(checkpoint)
+        if source == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            stream = open(source, encoding='utf-8', newline='')
+        with stream:
+            reader = read_jsonl if file_format == 'jsonl' else read_csv
+            records = islice(reader(stream), done, None)
+            self.load(records, done, options['batch_size'], checkpoint)
+
+    def load(self, records, done, batch_size, checkpoint):
+        relations = RelationMap()
+        started = time.monotonic()
+        loaded = skipped = 0
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            valid = [record for record in batch if self.is_valid(record)]
+            skipped += len(batch) - len(valid)
+            relations.resolve(
+                (record['author'] for record in valid),
+                (record.get('group') or None for record in valid),
+            )
+            insert_posts([
+                self.build_post(record, relations) for record in valid
+            ])
+            done += len(batch)
+            loaded += len(valid)
+            if checkpoint:
+                self.write_checkpoint(checkpoint, done)
+            self.report(loaded, started)
+        refresh_after_import(relations)
+        self.stdout.write(self.style.SUCCESS(
+            'Загружено постов: %s, пропущено записей: %s' % (loaded, skipped)
+        ))
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def is_valid(self, record):
+        if not (record.get('text') and record.get('author')):
+            return False
+        pub_date = record.get('pub_date')
+        return not pub_date or parse_pub_date(pub_date) is not None
+
+    def build_post(self, record, relations):
+        pub_date = record.get('pub_date')
+        pub_date = parse_pub_date(pub_date) if pub_date else None
+        if pub_date is None:
+            pub_date = timezone.now()
+        elif timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date)
+        group = record.get('group') or None
+        return Post(
+            text=record['text'],
+            author_id=relations.authors[record['author']],
+            group_id=relations.groups[group] if group else None,
+            pub_date=pub_date,
+        )
+
+    def report(self, loaded, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write('Загружено %s постов, %.0f в секунду' % (
+            loaded, loaded / elapsed if elapsed else 0,
+        ))
+
+    def read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    def write_checkpoint(self, path, done):
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            checkpoint.write(str(done))
+        os.replace(temporary, path)
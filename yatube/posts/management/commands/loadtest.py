@@ -0,0 +1,220 @@
+import json
+import os
+import random
+import secrets
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.urls import reverse
+
+from core.loadtest import LoadUser, has_wsgi_server, local_server, run_load
+from posts.models import Group, Post, User
+
+DEFAULT_MIX = 'index=40,group=15,profile=10,feed=10,detail=20,login=2,create=3'
+TARGETS = {'group': 'groups', 'profile': 'authors'}
+LOADTEST_USERNAME = 'loadtest'
+
+
+def parse_mix(value):
+    try:
+        mix = {
+            route: float(weight)
+            for route, weight in (
+                part.split('=') for part in value.split(',')
+            )
+        }
+    except ValueError:
+        raise CommandError('Смесь задается так: %s' % DEFAULT_MIX)
+    unknown = mix.keys() - PostsUser.ROUTES.keys()
+    if unknown:
+        raise CommandError('Неизвестные маршруты: %s' % ', '.join(unknown))
+    return mix
+
+
+class PostsUser(LoadUser):
+    ROUTES = {
+        'index': 'index',
+        'group': 'group',
+        'profile': 'profile',
+        'feed': 'feed',
+        'detail': 'detail',
+        'login': 'login',
+        'create': 'create',
+    }
+
+    def __init__(self, base_url, rng, targets, writes, password):
+        super().__init__(base_url, rng)
+        self.targets = targets
+        self.writes = writes
+        self.password = password
+
+    def setup(self):
+        if self.writes and self.log_in(self.session).status_code != 302:
+            raise RuntimeError(
+                'Не удалось войти как %s' % LOADTEST_USERNAME
+            )
+
+    def page(self):
+        # Первые страницы популярнее: так видно влияние кеша страниц.
+        return {'page': min(int(self.rng.paretovariate(1.5)), 50)}
+
+    def index(self):
+        return self.request('GET', reverse('posts:index'), params=self.page())
+
+    def group(self):
+        slug = self.rng.choice(self.targets['groups'])
+        return self.request(
+            'GET', reverse('posts:group_list', args=(slug,)),
+            params=self.page(),
+        )
+
+    def profile(self):
+        username = self.rng.choice(self.targets['authors'])
+        return self.request(
+            'GET', reverse('posts:profile', args=(username,)),
+            params=self.page(),
+        )
+
+    def feed(self):
+        return self.request('GET', reverse('posts:index_feed', args=('rss',)))
+
+    def detail(self):
+        post_id = self.rng.choice(self.targets['posts'])
+        return self.request(
+            'GET', reverse('posts:post_detail', args=(post_id,))
+        )
+
+    def login(self):
+        return self.log_in(requests.Session())
+
+    def log_in(self, session):
+        url = self.base_url + reverse('users:login')
+        session.get(url, timeout=30)
+        return session.post(url, data={
+            'username': LOADTEST_USERNAME,
+            'password': self.password,
+            'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+        }, allow_redirects=False, timeout=30)
+
+    def create(self):
+        return self.request('POST', reverse('posts:post_create'), data={
+            'text': 'Пост нагрузочного теста %s' % self.rng.random(),
+            'group': self.rng.choice(self.targets['group_ids']),
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        })
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: поднимает gunicorn на yatube.wsgi и '
+        'гоняет смесь чтений, входов и публикаций из пула потоков. '
+        'Пишет в настроенную базу и заводит пользователя loadtest, '
+        'поэтому работает только с DEBUG = True: на копии или на базе '
+        'после seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+            help='Веса маршрутов, по умолчанию %s.' % DEFAULT_MIX,
+        )
+        parser.add_argument(
+            '--url', help='Адрес уже запущенного сервера на той же базе.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Процессы gunicorn, если --url не задан.',
+        )
+        parser.add_argument(
+            '--password', default=os.environ.get('LOADTEST_PASSWORD'),
+            help=(
+                'Пароль пользователя loadtest, по умолчанию из переменной '
+                'LOADTEST_PASSWORD или случайный.'
+            ),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError(
+                'Нагрузочный тест пишет в базу и запускается только '
+                'с DEBUG = True.'
+            )
+        if not options['url'] and not has_wsgi_server():
+            raise CommandError(
+                'Установите gunicorn или укажите --url запущенного сервера.'
+            )
+        password = options['password'] or secrets.token_urlsafe(16)
+        targets = self.targets(options['seed'], password)
+        mix = {
+            route: weight for route, weight in options['mix'].items()
+            if targets.get(TARGETS.get(route), True)
+        }
+
+        def make_user(number):
+            return PostsUser(
+                base_url,
+                random.Random('%s:%s' % (options['seed'], number)),
+                targets,
+                writes=mix.get('create', 0) > 0,
+                password=password,
+            )
+
+        if options['url']:
+            base_url = options['url'].rstrip('/')
+            report = run_load(
+                make_user, mix, options['concurrency'], options['duration']
+            )
+        else:
+            with local_server(
+                options['workers'], options['concurrency']
+            ) as base_url:
+                report = run_load(
+                    make_user, mix, options['concurrency'],
+                    options['duration'],
+                )
+        self.report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+    def targets(self, seed, password):
+        if not Post.objects.exists():
+            raise CommandError('Нет постов, сначала запустите seed.')
+        user, _ = User.objects.get_or_create(username=LOADTEST_USERNAME)
+        user.set_password(password)
+        user.save()
+        rng = random.Random(seed)
+        last = Post.objects.aggregate(last=Max('id'))['last']
+        posts = list(Post.objects.filter(
+            id__in=rng.sample(range(1, last + 1), min(last, 2000))
+        ).values_list('id', flat=True))
+        groups = list(Group.objects.order_by('-posts_count').values_list(
+            'id', 'slug'
+        )[:100])
+        return {
+            'posts': posts or [Post.objects.values_list('id', flat=True)[0]],
+            'groups': [slug for _, slug in groups],
+            'group_ids': [group_id for group_id, _ in groups] or [''],
+            'authors': list(User.objects.filter(
+                profile__posts_count__gt=0
+            ).order_by('-profile__posts_count').values_list(
+                'username', flat=True
+            )[:200]),
+        }
+
+    def report(self, report):
+        total = sum(route['requests'] for route in report.values())
+        rps = sum(route['rps'] for route in report.values())
+        self.stdout.write('Всего запросов: %s, %.1f в секунду' % (total, rps))
+        for route, result in report.items():
+            self.stdout.write(
+                '  {route}: {requests} запросов, {rps:.1f}/с, '
+                'p50={p50:.1f} мс p95={p95:.1f} мс p99={p99:.1f} мс, '
+                'ошибок {error_rate:.1%}'.format(route=route, **result)
+            )
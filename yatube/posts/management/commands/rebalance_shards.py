@@ -0,0 +1,95 @@
+from argparse import ArgumentTypeError
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from posts import sharding
+from posts.models import Post
+
+
+def move(value):
+    author_id, _, alias = value.partition(':')
+    if not author_id.isdigit() or not alias:
+        raise ArgumentTypeError('Ожидается АВТОР:ШАРД, например 42:shard1.')
+    return int(author_id), alias
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов между шардами без остановки записи. Без '
+        '--move выравнивает шарды по числу постов, с --from-default '
+        'раскладывает по шардам посты, оставшиеся в default.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--move', type=move, action='append', dest='moves', default=[],
+            help='АВТОР:ШАРД, можно несколько раз.',
+        )
+        parser.add_argument('--from-default', action='store_true')
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Сколько авторов переносить при выравнивании.',
+        )
+        parser.add_argument(
+            '--grace', type=float,
+            help='Сколько ждать после переключения справочника, секунд. '
+                 'По умолчанию SHARD_DIRECTORY_TIMEOUT, для --from-default 0: '
+                 'в default посты уже не пишутся.',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Шарды не настроены, см. SHARD_COUNT.')
+        grace = options['grace']
+        if options['from_default']:
+            moves = self.from_default()
+            if grace is None:
+                grace = 0
+        elif options['moves']:
+            moves = self.explicit(options['moves'])
+        else:
+            moves = sharding.plan_moves(
+                sharding.shard_loads(), options['limit']
+            )
+        if not moves:
+            self.stdout.write('Переносить нечего.')
+            return
+        for author_id, source, target, posts in moves:
+            self.stdout.write('Автор %s: %s -> %s, постов %s' % (
+                author_id, source, target, posts
+            ))
+        if options['dry_run']:
+            return
+        moved = sharding.move_authors(
+            [(author_id, source, target) for author_id, source, target, _
+             in moves],
+            grace,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Перенесено постов: %s' % sum(moved.values())
+        ))
+
+    def from_default(self):
+        authors = Post.objects.using('default').order_by().values_list(
+            'author_id'
+        ).annotate(total=Count('pk'))
+        return [
+            (author_id, 'default', sharding.shard_for(author_id), total)
+            for author_id, total in authors
+        ]
+
+    def explicit(self, moves):
+        unknown = {alias for _, alias in moves} - set(sharding.shards())
+        if unknown:
+            raise CommandError('Неизвестные шарды: %s' % ', '.join(unknown))
+        return [
+            (
+                author_id, sharding.shard_for(author_id), alias,
+                Post.objects.using(sharding.shard_for(author_id)).filter(
+                    author_id=author_id
+                ).count(),
+            )
+            for author_id, alias in moves
+        ]
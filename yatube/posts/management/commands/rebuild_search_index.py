@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import (
+    has_search_index, install_search_index, rebuild_search_index
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not has_search_index(using):
+            raise CommandError('Полнотекстовый индекс есть только в SQLite.')
+        if not install_search_index(using):
+            rebuild_search_index(using)
+        self.stdout.write(self.style.SUCCESS('Индекс пересобран.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_posts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики постов авторов и групп с таблицей постов.'
+
+    def handle(self, *args, **options):
+        fixed = recount_posts()
+        self.stdout.write(self.style.SUCCESS(
+            'Исправлено счетчиков: %s' % fixed
+        ))
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import sharding
+from posts.models import Group, User
+from posts.seeding import SeedPlan, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу детерминированными данными: авторы и группы '
+        'по закону Ципфа, разная длина текстов и даты публикации.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--authors', type=int, help='По умолчанию постов / 50.'
+        )
+        parser.add_argument(
+            '--groups', type=int, help='По умолчанию постов / 5000.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1, help='Показатель Ципфа.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=3 * 365,
+            help='За сколько дней распределены даты постов.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Процессы для генерации пачек; пишет основной процесс.',
+        )
+
+    def handle(self, *args, **options):
+        if options['posts'] < 1:
+            raise CommandError('Нужен хотя бы один пост.')
+        if sharding.enabled():
+            raise CommandError(
+                'seed пишет посты прямо в default. Заполните базу без '
+                'POST_SHARDS и разложите посты командой '
+                'rebalance_shards --from-default.'
+            )
+        if (User.objects.filter(username='author0').exists()
+                or Group.objects.filter(slug='group-0').exists()):
+            raise CommandError('База уже заполнена командой seed.')
+        plan = SeedPlan(
+            options['posts'],
+            authors=options['authors'],
+            groups=options['groups'],
+            seed=options['seed'],
+            exponent=options['zipf'],
+            days=options['days'],
+        )
+        started = time.perf_counter()
+        seed(plan, options['workers'], progress=self.progress)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Постов: %s, авторов: %s, групп: %s за %.1f с (%.0f строк/с)' % (
+                plan.posts, plan.authors, plan.groups, elapsed,
+                plan.posts / elapsed,
+            )
+        ))
+
+    def progress(self, written):
+        self.stdout.write('Записано постов: %s' % written)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует пользователей, группы и профили из default во все шарды '
+        'POST_SHARDS и удаляет с шардов строки, которых в default нет. '
+        'Нужна после подключения нового шарда.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Шарды не настроены, см. SHARD_COUNT.')
+        removed = sharding.sync_references(options['batch_size'])
+        for model, total in removed.items():
+            self.stdout.write('%s: удалено %s' % (
+                model._meta.verbose_name_plural, total
+            ))
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_group_counts(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    totals = Post.objects.filter(group=OuterRef('pk')).order_by()
+    totals = totals.values('group').annotate(total=Count('pk'))
+    Group.objects.update(
+        posts_count=Coalesce(Subquery(totals.values('total')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число постов'),
+        ),
+        migrations.RunPython(fill_group_counts, migrations.RunPython.noop),
+    ]
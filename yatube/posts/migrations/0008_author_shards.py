@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('shard', models.CharField(max_length=100, verbose_name='Шард')),
+            ],
+            options={
+                'verbose_name': 'Шард автора',
+                'verbose_name_plural': 'Шарды авторов',
+            },
+        ),
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Название')),
+                ('next_id', models.BigIntegerField(verbose_name='Следующий id')),
+            ],
+            options={
+                'verbose_name': 'Последовательность id',
+                'verbose_name_plural': 'Последовательности id',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_shard_data(apps, schema_editor):
+    """Шаги 0005 и 0007 для базы шарда, в которой идет миграция."""
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    db_alias = schema_editor.connection.alias
+    posts = Post.objects.using(db_alias)
+    totals = posts.filter(group=OuterRef('pk')).order_by()
+    totals = totals.values('group').annotate(total=Count('pk'))
+    Group.objects.using(db_alias).update(
+        posts_count=Coalesce(Subquery(totals.values('total')), 0)
+    )
+    posts.update(updated_at=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_author_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fill_shard_data, migrations.RunPython.noop,
+            hints={'shards': True},
+        ),
+    ]
@@ -10,21 +10,38 @@ class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     slug = models.SlugField(unique=True, verbose_name='индекс')
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов',
+    )
 
     def __str__(self):
-        return(self.title)
+        return self.title
 
     class Meta:
         verbose_name = 'Группа'
         verbose_name_plural = 'Группы'
 
 
+class PostQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Шард поста зависит от автора: базу выбирает роутер по объекту.
+        post = self.model(**kwargs)
+        self._for_write = True
+        post.save(force_insert=True, using=self._db)
+        return post
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст')
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -40,10 +57,137 @@ class Post(models.Model):
         related_name='posts',
     )
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
-        return(self.text[:MAX_LENGTH])
+        return self.text[:MAX_LENGTH]
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        # С шардами id нового поста назначает pre_save, и без force_insert
+        # Django сначала пробует UPDATE по этому id.
+        if self.pk is None and not force_update and not update_fields:
+            force_insert = True
+        super().save(force_insert, force_update, using, update_fields)
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_pub_date_idx',
+            ),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+
+
+class Follow(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='follower',
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='following',
+    )
+
+    def __str__(self):
+        return f'{self.user} -> {self.author}'
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx',
+            ),
+        )
+        verbose_name = 'Подписка'
+        verbose_name_plural = 'Подписки'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    def __str__(self):
+        return f'{self.user}: {self.post_id}'
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx',
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+
+class AuthorShard(models.Model):
+    author = models.OneToOneField(
+        User,
+        primary_key=True,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    shard = models.CharField(max_length=100, verbose_name='Шард')
+
+    def __str__(self):
+        return f'{self.author_id} -> {self.shard}'
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+
+class IdSequence(models.Model):
+    name = models.CharField(
+        max_length=100,
+        primary_key=True,
+        verbose_name='Название',
+    )
+    next_id = models.BigIntegerField(verbose_name='Следующий id')
+
+    def __str__(self):
+        return f'{self.name}: {self.next_id}'
+
+    class Meta:
+        verbose_name = 'Последовательность id'
+        verbose_name_plural = 'Последовательности id'
@@ -0,0 +1,117 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+
+from core.query_plans import capture_plans, plan_regressions
+
+from .models import Group, Post, User
+from .seeding import SeedPlan, seed
+
+SNAPSHOT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'tests', 'query_plans.json'
+)
+WATCHED_TABLES = ('posts_post',)
+SEED_POSTS = 2000
+
+
+def seed_database():
+    """Набор, на котором снимаются планы и в тестах, и при bless."""
+    seed(SeedPlan(SEED_POSTS))
+
+
+def scenarios():
+    """Автор для входа и сценарии (имя, метод, адрес, данные).
+
+    Имена совпадают с именами маршрутов posts, кроме index_deep —
+    глубокой страницы главной. Подписка идет раньше ленты подписок,
+    отписка — после, чтобы лента была не пустой.
+    """
+    authors = User.objects.order_by('-profile__posts_count', 'id')
+    author, followed = authors[:2]
+    group = Group.objects.order_by('-posts_count', 'id').first()
+    middle = Post.objects.aggregate(last=Max('id'))['last'] // 2
+    post = Post.objects.filter(id__gte=middle).order_by('id').first()
+    own_post = Post.objects.filter(author=author).order_by('-id').first()
+    pages = Post.objects.count() // settings.NUMBER_OBJECTS or 1
+    return author, (
+        ('index', 'get', reverse('posts:index'), None),
+        ('index_deep', 'get', reverse('posts:index'), {'page': pages // 2}),
+        ('index_feed', 'get', reverse('posts:index_feed', args=('rss',)),
+         None),
+        ('group_list', 'get', reverse(
+            'posts:group_list', args=(group.slug,)
+        ), None),
+        ('group_feed', 'get', reverse(
+            'posts:group_feed', args=(group.slug, 'rss')
+        ), None),
+        ('profile', 'get', reverse(
+            'posts:profile', args=(author.username,)
+        ), None),
+        ('profile_export', 'get', reverse(
+            'posts:profile_export', args=(author.username,)
+        ), None),
+        ('profile_feed', 'get', reverse(
+            'posts:profile_feed', args=(author.username, 'rss')
+        ), None),
+        ('post_detail', 'get', reverse(
+            'posts:post_detail', args=(post.pk,)
+        ), None),
+        ('post_create', 'post', reverse('posts:post_create'), {
+            'text': 'Пост для снимка планов', 'group': group.pk,
+        }),
+        ('post_edit', 'post', reverse(
+            'posts:post_edit', args=(own_post.pk,)
+        ), {'text': 'Правка для снимка планов', 'group': group.pk}),
+        ('search', 'get', reverse('posts:search'), {
+            'q': post.text.split()[0],
+        }),
+        ('profile_follow', 'get', reverse(
+            'posts:profile_follow', args=(followed.username,)
+        ), None),
+        ('follow_index', 'get', reverse('posts:follow_index'), None),
+        ('profile_unfollow', 'get', reverse(
+            'posts:profile_unfollow', args=(followed.username,)
+        ), None),
+    )
+
+
+def collect():
+    """Сценарий -> {форма запроса: план} для всех сценариев.
+
+    Кеш очищается перед каждым запросом, иначе часть запросов не дойдет
+    до базы.
+    """
+    author, steps = scenarios()
+    client = Client()
+    client.force_login(author)
+    plans = {}
+    for name, method, url, data in steps:
+        cache.clear()
+        with capture_plans() as capture:
+            response = getattr(client, method)(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        plans[name] = capture.plans()
+    return plans
+
+
+def load_snapshot(path=SNAPSHOT):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def write_snapshot(plans, path=SNAPSHOT):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(plans, output, ensure_ascii=False, indent=2, sort_keys=True)
+        output.write('\n')
+
+
+def regressions(current, snapshot):
+    return plan_regressions(current, snapshot, WATCHED_TABLES)
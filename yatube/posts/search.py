@@ -0,0 +1,179 @@
+import heapq
+import re
+from itertools import islice
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from . import sharding
+from .models import Post
+
+SEARCH_TABLE = 'posts_post_fts'
+SEARCH_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert "
+    "AFTER INSERT ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete "
+    "AFTER DELETE ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS posts_post_fts_update "
+    "AFTER UPDATE OF text ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+    "END",
+)
+SEARCH_TRIGGERS = (
+    'posts_post_fts_insert',
+    'posts_post_fts_delete',
+    'posts_post_fts_update',
+)
+MATCH_SQL = 'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s'
+# rank — это bm25, но по нему FTS5 сортирует сам, без временного B-дерева.
+RANKED_SQL = (
+    'SELECT rank, rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+    'ORDER BY rank LIMIT %s OFFSET %s'
+)
+
+
+def has_search_index(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def install_search_index(using='default'):
+    """Создает индекс и триггеры, если их нет. True — индекс новый."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if Post._meta.db_table not in tables:
+            return False
+        created = SEARCH_TABLE not in tables
+        for statement in SEARCH_SCHEMA:
+            cursor.execute(statement)
+    if created:
+        rebuild_search_index(using)
+    return created
+
+
+def rebuild_search_index(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('optimize')"
+        )
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в безопасный запрос FTS5."""
+    return ' '.join('"%s"*' % term for term in re.findall(r'\w+', query))
+
+
+class SearchResults:
+    """Найденные посты по убыванию bm25, нарезаются как QuerySet."""
+
+    def __init__(self, query, using='default'):
+        self.expression = match_expression(query)
+        self.using = using
+
+    def _execute(self, sql, params):
+        if not self.expression:
+            return []
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, [self.expression] + params)
+            return cursor.fetchall()
+
+    def count(self):
+        rows = self._execute(
+            'SELECT COUNT(*) FROM (%s)' % MATCH_SQL, []
+        )
+        return rows[0][0] if rows else 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        limit = -1 if key.stop is None else key.stop - start
+        return self.load([pk for _, pk in self.ranked(limit, start)])
+
+    def ranked(self, limit, offset=0):
+        """(bm25, id) найденных постов, лучшие первыми."""
+        return self._execute(RANKED_SQL, [limit, offset])
+
+    def load(self, ids):
+        posts = Post.objects.using(self.using).select_related(
+            'author', 'group'
+        ).in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+class MergedSearchResults:
+    """Поиск по индексам всех шардов, выдачи слиты по bm25.
+
+    Срез [start:stop] берет с каждого шарда первые stop результатов.
+    Статистика слов у каждого шарда своя, так что оценки разных шардов
+    сравнимы приблизительно.
+    """
+
+    def __init__(self, query, aliases):
+        self.parts = [SearchResults(query, alias) for alias in aliases]
+
+    def count(self):
+        return sum(part.count() for part in self.parts)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        found = list(islice(heapq.merge(*(
+            [(rank, pk, number) for rank, pk in part.ranked(
+                -1 if stop is None else stop
+            )]
+            for number, part in enumerate(self.parts)
+        )), start, stop))
+        posts = {}
+        for number, part in enumerate(self.parts):
+            ids = [pk for _, pk, shard in found if shard == number]
+            if ids:
+                posts.update((post.pk, post) for post in part.load(ids))
+        return [posts[pk] for _, pk, _ in found if pk in posts]
+
+
+def search_posts(query, using='default'):
+    """Найденные посты; с шардами — по индексам всех шардов."""
+    aliases = sharding.shards() if sharding.enabled() else [using]
+    if all(has_search_index(alias) for alias in aliases):
+        if len(aliases) == 1:
+            return SearchResults(query, aliases[0])
+        return MergedSearchResults(query, aliases)
+    if not query.strip():
+        return Post.objects.none()
+    if sharding.enabled():
+        posts = sharding.all_posts(text__icontains=query)
+    else:
+        posts = Post.objects.using(using).filter(text__icontains=query)
+    return posts.select_related('author', 'group')
+
+
+def filter_by_search(queryset, query):
+    """Фильтр QuerySet постов по полнотекстовому индексу."""
+    if not has_search_index(queryset.db):
+        return queryset.filter(text__icontains=query)
+    if not match_expression(query):
+        return queryset.none()
+    return queryset.filter(
+        id__in=RawSQL(MATCH_SQL, [match_expression(query)])
+    )
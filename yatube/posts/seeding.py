@@ -0,0 +1,216 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from faker.providers.lorem.ru_RU import Provider as LoremProvider
+from faker.providers.person.ru_RU import Provider as PersonProvider
+
+from users.models import Profile
+
+from .bulk import insert_sql
+from .models import Group, User
+from .search import has_search_index, rebuild_search_index
+
+CHUNK_SIZE = 20000
+BATCH_SIZE = 500
+MAX_WORDS = 400
+END = datetime(2024, 1, 1, tzinfo=timezone.utc)
+WORDS = LoremProvider.word_list
+LOAD_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -256 * 1024}
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса рангов 1..size по закону Ципфа."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class SeedPlan:
+    """Параметры набора данных.
+
+    Каждая пачка постов строится только по плану и своему номеру, поэтому
+    результат не зависит от числа процессов. Посты идут по возрастанию
+    pub_date, и id совпадает с хронологическим порядком. Строки пачки
+    сразу готовы для INSERT, чтобы основной процесс только писал.
+    """
+
+    def __init__(self, posts, authors=None, groups=None, seed=0,
+                 exponent=1.1, days=3 * 365, without_group=0.3):
+        self.posts = posts
+        self.authors = authors or max(1, posts // 50)
+        self.groups = groups or max(1, posts // 5000)
+        self.seed = seed
+        self.exponent = exponent
+        self.without_group = without_group
+        self.start = timezone.make_naive(
+            END - timedelta(days=days), timezone.utc
+        )
+        self.step = days * 24 * 60 * 60 / posts
+        self.author_weights = zipf_weights(self.authors, exponent)
+        self.group_weights = zipf_weights(self.groups, exponent)
+        self.author_ids = []
+        self.group_ids = []
+
+    def random(self, name):
+        return random.Random('%s:%s' % (self.seed, name))
+
+    def starts(self):
+        return range(0, self.posts, CHUNK_SIZE)
+
+    def rows(self, start):
+        """Пачка строк (text, author_id, group_id, pub_date, updated_at).
+
+        Даты уже в UTC и в строковом виде, как их хранит бэкенд SQLite.
+        """
+        rng = self.random(start)
+        size = min(CHUNK_SIZE, self.posts - start)
+        authors = rng.choices(
+            self.author_ids, cum_weights=self.author_weights, k=size
+        )
+        groups = rng.choices(
+            self.group_ids, cum_weights=self.group_weights, k=size
+        )
+        rows = []
+        for offset in range(size):
+            words = min(MAX_WORDS, int(rng.paretovariate(1.2) * 4))
+            group = groups[offset]
+            if rng.random() < self.without_group:
+                group = None
+            pub_date = str(self.start + timedelta(
+                seconds=(start + offset + rng.random()) * self.step
+            ))
+            rows.append((
+                ' '.join(rng.choices(WORDS, k=words)).capitalize(),
+                authors[offset],
+                group,
+                pub_date,
+                pub_date,
+            ))
+        return rows
+
+
+_plan = None
+
+
+def _init_worker(plan):
+    global _plan
+    _plan = plan
+
+
+def _rows(start):
+    return _plan.rows(start)
+
+
+def generate(plan, workers=0):
+    """Пачки строк по порядку; с workers строятся в отдельных процессах."""
+    if not workers:
+        for start in plan.starts():
+            yield plan.rows(start)
+        return
+    with Pool(workers, initializer=_init_worker, initargs=(plan,)) as pool:
+        yield from pool.imap(_rows, plan.starts())
+
+
+def create_authors(plan):
+    rng = plan.random('authors')
+    password = make_password(None)
+    User.objects.bulk_create(
+        (
+            User(
+                username='author%s' % number,
+                first_name=rng.choice(PersonProvider.first_names_male),
+                last_name=rng.choice(PersonProvider.last_names_male),
+                password=password,
+            )
+            for number in range(plan.authors)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    usernames = dict(User.objects.filter(
+        username__startswith='author'
+    ).values_list('username', 'id'))
+    return [usernames['author%s' % number] for number in range(plan.authors)]
+
+
+def create_groups(plan):
+    rng = plan.random('groups')
+    Group.objects.bulk_create(
+        (
+            Group(
+                slug='group-%s' % number,
+                title=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                description=' '.join(rng.choices(WORDS, k=20)).capitalize(),
+            )
+            for number in range(plan.groups)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    slugs = dict(Group.objects.filter(
+        slug__startswith='group-'
+    ).values_list('slug', 'id'))
+    return [slugs['group-%s' % number] for number in range(plan.groups)]
+
+
+@contextmanager
+def bulk_load():
+    """Ослабляет fsync и увеличивает кеш страниц SQLite на время загрузки."""
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        saved = {}
+        for pragma, value in LOAD_PRAGMAS.items():
+            cursor.execute('PRAGMA %s' % pragma)
+            saved[pragma] = cursor.fetchone()[0]
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        try:
+            yield
+        finally:
+            for pragma, value in saved.items():
+                cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+def seed(plan, workers=0, progress=None):
+    """Заполняет базу по плану.
+
+    Посты пишутся через executemany пачками по CHUNK_SIZE: построение
+    моделей для bulk_create обходится дороже самой вставки. Счетчики и
+    профили пишутся один раз в конце. Поисковый индекс ведут триггеры,
+    так что он цел и после обрыва загрузки; в конце он перестраивается
+    одним rebuild, чтобы слить сегменты, набранные построчно.
+    """
+    plan.author_ids = create_authors(plan)
+    plan.group_ids = create_groups(plan)
+    sql = insert_sql()
+    author_totals = Counter()
+    group_totals = Counter()
+    written = 0
+    with bulk_load():
+        for rows in generate(plan, workers):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            author_totals.update(row[1] for row in rows)
+            group_totals.update(row[2] for row in rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    group_totals.pop(None, None)
+    with transaction.atomic():
+        Profile.objects.bulk_create(
+            (
+                Profile(user_id=user_id, posts_count=author_totals[user_id])
+                for user_id in plan.author_ids
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        for group_id, total in group_totals.items():
+            Group.objects.filter(id=group_id).update(posts_count=total)
+    if has_search_index():
+        rebuild_search_index()
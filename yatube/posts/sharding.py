@@ -0,0 +1,496 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, F, Max
+from django.http import Http404
+from django.utils import timezone
+
+from core.cache import max_age
+from core.replicas import record_write
+from core.transactions import atomic_write
+
+from users.models import Profile
+
+from .models import (
+    AuthorShard, Group, IdSequence, Post, TimelineEntry, User,
+)
+
+AUTHOR_KEY = 'posts:shard:author:%s'
+POST_KEY = 'posts:shard:post:%s'
+POST_SEQUENCE = 'posts_post'
+ORDERING = ('-pub_date', '-id')
+REVERSED = ('pub_date', 'id')
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def shards():
+    return list(settings.POST_SHARDS)
+
+
+def hashed_shard(author_id):
+    return settings.POST_SHARDS[author_id % len(settings.POST_SHARDS)]
+
+
+def shard_for(author_id):
+    """Шард с постами автора: из справочника AuthorShard или по хешу.
+
+    Справочник кешируется на SHARD_DIRECTORY_TIMEOUT, поэтому перенос
+    автора ждет столько же, прежде чем удалить старые копии. Без шардов
+    возвращает None, и запрос идет по роутерам как обычно.
+    """
+    if not enabled():
+        return None
+    key = AUTHOR_KEY % author_id
+    alias = cache.get(key)
+    if alias is None:
+        alias = AuthorShard.objects.using('default').filter(
+            author_id=author_id
+        ).values_list('shard', flat=True).first()
+        if alias is None:
+            alias = hashed_shard(author_id)
+        cache.set(key, alias, settings.SHARD_DIRECTORY_TIMEOUT)
+    return alias
+
+
+def max_post_id():
+    return max(
+        Post.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+        for alias in ['default'] + shards()
+    )
+
+
+def reserve_ids(name, size):
+    """Забирает из IdSequence блок [start, start + size).
+
+    Сдвиг счетчика — один UPDATE next_id = next_id + size под BEGIN
+    IMMEDIATE: в SQLite нет SELECT ... FOR UPDATE, а блокировка записи
+    на всю транзакцию не дает двум процессам прочитать одно значение.
+    """
+    sequences = IdSequence.objects.using('default').filter(name=name)
+    with atomic_write(using='default'):
+        if not sequences.update(next_id=F('next_id') + size):
+            start = max_post_id() + 1
+            sequences.create(name=name, next_id=start + size)
+            return start, start + size
+        end = sequences.values_list('next_id', flat=True).get()
+    return end - size, end
+
+
+class IdAllocator:
+    """Сквозные id постов для всех шардов.
+
+    Автоинкремент шарда не годится: посты переезжают между шардами, а id
+    есть в адресах страниц. Процесс берет id блоками по SHARD_ID_BLOCK,
+    чтобы ходить в default не на каждый пост.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.next_id = self.end = 0
+
+    def allocate(self):
+        with self.lock:
+            if self.next_id >= self.end:
+                self.next_id, self.end = reserve_ids(
+                    self.name, settings.SHARD_ID_BLOCK
+                )
+            self.next_id += 1
+            return self.next_id - 1
+
+
+post_ids = IdAllocator(POST_SEQUENCE)
+
+
+class ShardRouter:
+    """Запись поста — в шард его автора, остальное решают другие роутеры."""
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if isinstance(instance, Post) and enabled():
+            record_write()
+            return shard_for(instance.author_id)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Шаги миграций с данными — в default, с подсказкой shards — в шарды.
+
+        Старые шаги с данными пишут через роутеры, то есть в default, и в
+        базах шардов не выполняются. Их варианты для шардов вынесены в
+        отдельные миграции с RunPython(hints={'shards': True}).
+        """
+        if hints.get('shards'):
+            return db != 'default'
+        if model_name is None and db != 'default':
+            return False
+        return None
+
+
+def replicate(model, rows, aliases=None):
+    """Копирует строки справочника из default в шарды aliases.
+
+    Пользователи, группы и профили нужны шардам для внешних ключей и
+    select_related постов. Без aliases копирует во все шарды.
+    """
+    fields = model._meta.concrete_fields
+    rows = [
+        model(**{field.attname: getattr(row, field.attname)
+                 for field in fields})
+        for row in rows
+    ]
+    if not rows:
+        return
+    for alias in shards() if aliases is None else aliases:
+        manager = model._base_manager.db_manager(alias)
+        present = set(manager.filter(
+            pk__in=[row.pk for row in rows]
+        ).values_list('pk', flat=True))
+        for row in rows:
+            if row.pk in present:
+                manager.filter(pk=row.pk).update(**{
+                    field.attname: getattr(row, field.attname)
+                    for field in fields if not field.primary_key
+                })
+        manager.bulk_create(row for row in rows if row.pk not in present)
+
+
+def unreplicate(model, pks):
+    for alias in shards():
+        model._base_manager.db_manager(alias).filter(pk__in=pks).delete()
+
+
+def replicate_instance(instance):
+    if isinstance(instance, Profile):
+        replicate(User, User.objects.filter(pk=instance.user_id))
+    replicate(type(instance), [instance])
+
+
+def sync_references(batch_size=500):
+    """Сверяет справочники шардов с default.
+
+    Докопирует и обновляет все строки и удаляет с шардов те, которых
+    в default уже нет. Возвращает {модель: число удаленных строк}.
+    """
+    removed = {}
+    for model in (User, Group, Profile):
+        rows = model._base_manager.using('default').order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not chunk:
+                break
+            replicate(model, chunk)
+            last_pk = chunk[-1].pk
+        known = set(rows.values_list('pk', flat=True))
+        stale = set()
+        for alias in shards():
+            stale.update(set(
+                model._base_manager.using(alias).values_list('pk', flat=True)
+            ) - known)
+        unreplicate(model, list(stale))
+        removed[model] = len(stale)
+    return removed
+
+
+def post_querysets(**filters):
+    if not enabled():
+        return [Post.objects.filter(**filters)]
+    return [Post.objects.using(alias).filter(**filters) for alias in shards()]
+
+
+def all_posts(**filters):
+    """Посты со всех шардов; без шардирования — обычный QuerySet."""
+    if not enabled():
+        return Post.objects.filter(**filters)
+    return MergedPosts(post_querysets(**filters))
+
+
+def group_posts(group):
+    """Посты группы со всех шардов, у постов уже проставлена group."""
+    if not enabled():
+        return group.posts.all()
+    return MergedPosts([group.posts.using(alias) for alias in shards()])
+
+
+def author_posts(author):
+    """Посты автора одним запросом к его шарду."""
+    return author.posts.using(shard_for(author.pk))
+
+
+def merge_key(post):
+    return post.pub_date, post.pk
+
+
+class MergedPosts:
+    """Посты нескольких шардов одной лентой по (pub_date, id).
+
+    Умеет то, что нужно пагинаторам и лентам: фильтры, select_related,
+    срезы, count и обратный порядок. Срез [start:stop] берет с каждого
+    шарда первые stop ключей (pub_date, id), сливает отсортированные
+    потоки через heapq.merge и читает посты только самой страницы.
+    """
+
+    ordered = True
+    model = Post
+
+    def __init__(self, querysets, ascending=False):
+        self.ascending = ascending
+        ordering = REVERSED if ascending else ORDERING
+        self.querysets = [posts.order_by(*ordering) for posts in querysets]
+
+    def __repr__(self):
+        return '<MergedPosts over %s shards>' % len(self.querysets)
+
+    def _chain(self, method, *args, **kwargs):
+        return MergedPosts(
+            [
+                getattr(posts, method)(*args, **kwargs)
+                for posts in self.querysets
+            ],
+            self.ascending,
+        )
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def order_by(self, *fields):
+        if fields not in (ORDERING, REVERSED):
+            raise ValueError(
+                'Ленту шардов можно сортировать только по (pub_date, id).'
+            )
+        return MergedPosts(self.querysets, fields == REVERSED)
+
+    def reverse(self):
+        return MergedPosts(self.querysets, not self.ascending)
+
+    def count(self):
+        return sum(posts.count() for posts in self.querysets)
+
+    def exists(self):
+        return any(posts.exists() for posts in self.querysets)
+
+    def __iter__(self):
+        return self._merge(posts.iterator() for posts in self.querysets)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key < 0:
+                raise ValueError('Отрицательные индексы не поддерживаются.')
+            posts = self[key:key + 1]
+            if not posts:
+                raise IndexError(key)
+            return posts[0]
+        start, stop = key.start or 0, key.stop
+        if start < 0 or (stop is not None and stop < 0) or key.step:
+            raise ValueError('Поддерживаются только срезы [start:stop].')
+        if stop is None:
+            return list(islice(self, start, None))
+        if not start:
+            return list(islice(self._merge(
+                list(posts[:stop]) for posts in self.querysets
+            ), stop))
+        # Глубокая страница: сначала сливаются только ключи из индекса
+        # ленты, потом читаются посты самой страницы.
+        keys = list(islice(self._merge(
+            (
+                [(pub_date, pk, number) for pub_date, pk in
+                 posts.values_list('pub_date', 'id')[:stop]]
+                for number, posts in enumerate(self.querysets)
+            ),
+            key=itemgetter(0, 1),
+        ), start, stop))
+        ids = defaultdict(list)
+        for _, pk, number in keys:
+            ids[number].append(pk)
+        found = {}
+        for number, shard_ids in ids.items():
+            found.update(self.querysets[number].in_bulk(shard_ids))
+        return [found[pk] for _, pk, _ in keys if pk in found]
+
+    def _merge(self, streams, key=merge_key):
+        # Во время переноса автора пост бывает сразу на двух шардах.
+        previous = None
+        for item in heapq.merge(
+                *streams, key=key, reverse=not self.ascending):
+            pk = key(item)[1]
+            if pk != previous:
+                previous = pk
+                yield item
+
+
+def find_post(post_id, fetch):
+    """fetch(alias) на шарде с постом post_id или None, если поста нет.
+
+    Шард поста запоминается в кеше; после переноса автора запись
+    устаревает, и пост ищется по всем шардам заново.
+    """
+    if not enabled():
+        return fetch(None)
+    key = POST_KEY % post_id
+    located = cache.get(key)
+    aliases = shards()
+    if located in aliases:
+        aliases.remove(located)
+        aliases.insert(0, located)
+    for alias in aliases:
+        result = fetch(alias)
+        if result is not None:
+            if alias != located:
+                cache.set(key, alias, settings.SHARD_DIRECTORY_TIMEOUT)
+            return result
+    return None
+
+
+def get_post_or_404(queryset, post_id):
+    def fetch(alias):
+        try:
+            return queryset.using(alias).get(id=post_id)
+        except Post.DoesNotExist:
+            return None
+
+    post = find_post(post_id, fetch)
+    if post is None:
+        raise Http404('Пост %s не найден.' % post_id)
+    return post
+
+
+def shard_loads():
+    """Шард -> {id автора: число его постов на шарде}."""
+    return {
+        alias: dict(
+            Post.objects.using(alias).order_by().values_list(
+                'author_id'
+            ).annotate(total=Count('pk'))
+        )
+        for alias in shards()
+    }
+
+
+def plan_moves(loads, limit):
+    """Жадный план переноса авторов с самого нагруженного шарда.
+
+    Каждый шаг переносит на самый легкий шард крупнейшего автора, чей
+    перенос сокращает разрыв между ними. Возвращает список
+    (id автора, откуда, куда, постов).
+    """
+    loads = {alias: dict(authors) for alias, authors in loads.items()}
+    totals = {alias: sum(authors.values()) for alias, authors in loads.items()}
+    moves = []
+    while len(moves) < limit and len(totals) > 1:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        candidates = [
+            (posts, author_id)
+            for author_id, posts in loads[heaviest].items()
+            if 0 < posts < gap
+        ]
+        if not candidates:
+            break
+        posts, author_id = max(candidates)
+        del loads[heaviest][author_id]
+        loads[lightest][author_id] = posts
+        totals[heaviest] -= posts
+        totals[lightest] += posts
+        moves.append((author_id, heaviest, lightest, posts))
+    return moves
+
+
+def copy_posts(posts, target):
+    """Пишет посты в target как есть: с id, датами и без сигналов."""
+    copied = 0
+    with transaction.atomic(using=target):
+        for post in posts.iterator():
+            post.save_base(raw=True, using=target)
+            copied += 1
+    return copied
+
+
+def delete_posts(alias, author_id, ids=None):
+    """Удаляет посты автора с шарда мимо сигналов: счетчики не меняются."""
+    entries = TimelineEntry.objects.using(alias).filter(
+        post__author_id=author_id
+    )
+    where, params = 'author_id = %s', [author_id]
+    if ids is not None:
+        if not ids:
+            return 0
+        entries = entries.filter(post_id__in=ids)
+        where += ' AND id IN (%s)' % ', '.join(['%s'] * len(ids))
+        params += list(ids)
+    entries.delete()
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM %s WHERE %s' % (Post._meta.db_table, where), params
+        )
+        return cursor.rowcount
+
+
+def move_authors(moves, grace=None, sleep=time.sleep):
+    """Переносит посты авторов между шардами без остановки записи.
+
+    moves — тройки (id автора, откуда, куда). Для каждого автора:
+    1. копирует посты, пока автор продолжает писать в старый шард;
+    2. под блокировкой записи старого шарда (BEGIN IMMEDIATE) докопирует
+       измененное с начала копии, убирает удаленное и переключает
+       справочник AuthorShard;
+    3. ждет grace секунд (срок кеша справочника, см. max_age) —
+       процессы со старой записью еще пишут в старый шард — и
+       докопирует их посты;
+    4. удаляет посты автора со старого шарда.
+    Возвращает {id автора: число перенесенных постов}.
+    """
+    if grace is None:
+        grace = max_age(settings.SHARD_DIRECTORY_TIMEOUT)
+    flipped = []
+    for author_id, source, target in moves:
+        if source == target:
+            continue
+        started = timezone.now()
+        posts = Post.objects.using(source).filter(author_id=author_id)
+        copy_posts(posts.order_by(), target)
+        with atomic_write(using=source):
+            copy_posts(posts.filter(updated_at__gte=started), target)
+            kept = set(posts.values_list('id', flat=True))
+            delete_posts(target, author_id, [
+                pk for pk in Post.objects.using(target).filter(
+                    author_id=author_id
+                ).values_list('id', flat=True)
+                if pk not in kept
+            ])
+            AuthorShard.objects.using('default').update_or_create(
+                author_id=author_id, defaults={'shard': target}
+            )
+            cache.delete(AUTHOR_KEY % author_id)
+            flipped.append((author_id, source, target, timezone.now()))
+        replicate(Profile, Profile.objects.filter(user_id=author_id), [target])
+    if flipped and grace:
+        sleep(grace)
+    moved = {}
+    for author_id, source, target, flipped_at in flipped:
+        posts = Post.objects.using(source).filter(author_id=author_id)
+        copy_posts(posts.filter(updated_at__gte=flipped_at), target)
+        moved[author_id] = delete_posts(source, author_id)
+    return moved
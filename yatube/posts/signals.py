@@ -0,0 +1,147 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.urls import NoReverseMatch, reverse
+
+from core.page_cache import purge_page, purge_path
+
+from users.models import Profile
+
+from . import sharding
+from .counters import change_author_count, change_group_count
+from .feeds import FEED_RELATIONS
+from .lookups import GROUPS, USERS
+from .models import Group, Post, User
+from .search import has_search_index, install_search_index
+from .timeline import fan_out
+from .utils import invalidate_counts
+
+
+def purge_view(view_name, arg):
+    try:
+        purge_path(reverse(view_name, args=(arg,)))
+    except NoReverseMatch:
+        pass
+
+
+def purge_post_pages(post, author_ids, group_ids):
+    """Сбрасывает страницы, на которых виден или был виден пост."""
+    purge_view('posts:post_detail', post.pk)
+    purge_page(reverse('posts:index'))
+    for author in USERS.get_many(author_ids).values():
+        purge_view('posts:profile', author.username)
+    for group in GROUPS.get_many(set(group_ids) - {None}).values():
+        purge_view('posts:group_list', group.slug)
+
+
+@receiver(pre_save, sender=Post)
+def remember_relations(sender, instance, raw=False, using=None,
+                       update_fields=None, **kwargs):
+    """Запоминает автора и группу поста в базе до сохранения.
+
+    Читает их одним запросом по pk и только при правке, которая может
+    их поменять.
+    """
+    instance._loaded_author_id = instance.author_id
+    instance._loaded_group_id = instance.group_id
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & {
+            'author', 'author_id', 'group', 'group_id'}:
+        return
+    stored = Post.objects.using(using).filter(pk=instance.pk).order_by()
+    for author_id, group_id in stored.values_list(
+            'author_id', 'group_id')[:1]:
+        instance._loaded_author_id = author_id
+        instance._loaded_group_id = group_id
+
+
+@receiver(pre_save, sender=Post)
+def assign_post_id(sender, instance, raw=False, **kwargs):
+    if instance.pk is None and not raw and sharding.enabled():
+        instance.pk = sharding.post_ids.allocate()
+
+
+@receiver(post_save, sender=Post)
+def update_post_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    author_ids = {instance.author_id, instance._loaded_author_id}
+    group_ids = {instance.group_id, instance._loaded_group_id}
+    if created:
+        change_author_count(instance.author_id, 1)
+        change_group_count(instance.group_id, 1)
+        fan_out(instance)
+    else:
+        if instance.author_id != instance._loaded_author_id:
+            change_author_count(instance._loaded_author_id, -1)
+            change_author_count(instance.author_id, 1)
+        if instance.group_id != instance._loaded_group_id:
+            change_group_count(instance._loaded_group_id, -1)
+            change_group_count(instance.group_id, 1)
+    if created or len(author_ids) > 1 or len(group_ids) > 1:
+        # Правка текста не меняет число постов ни в одной ленте.
+        invalidate_counts(author_ids, group_ids)
+    purge_post_pages(instance, author_ids, group_ids)
+
+
+@receiver(post_delete, sender=Post)
+def update_post_on_delete(sender, instance, **kwargs):
+    change_author_count(instance.author_id, -1)
+    change_group_count(instance.group_id, -1)
+    invalidate_counts([instance.author_id], [instance.group_id])
+    purge_post_pages(
+        instance, [instance.author_id], [instance.group_id]
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    GROUPS.forget(instance)
+    purge_view('posts:group_list', instance.slug)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def purge_profile_pages(sender, instance, **kwargs):
+    USERS.forget(instance)
+    purge_view('posts:profile', instance.username)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, instance, update_fields=None, **kwargs):
+    # Ленты выводят имя автора и название группы; вход меняет только
+    # last_login.
+    if update_fields != {'last_login'}:
+        FEED_RELATIONS.invalidate()
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_profile(sender, instance, **kwargs):
+    # Профиль кешируется вместе с пользователем.
+    USERS.forget(pk=instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Profile)
+def replicate_reference(sender, instance, using='default', **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.replicate_instance(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Profile)
+def unreplicate_reference(sender, instance, using='default', **kwargs):
+    if using == 'default' and sharding.enabled():
+        sharding.unreplicate(sender, [instance.pk])
+
+
+def install_search(sender, using='default', **kwargs):
+    if has_search_index(using):
+        install_search_index(using)
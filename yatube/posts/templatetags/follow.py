@@ -0,0 +1,13 @@
+from django import template
+
+from posts.models import Follow
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    user = context.get('user')
+    if user is None or not user.is_authenticated:
+        return False
+    return Follow.objects.filter(user=user, author_id=author_id).exists()
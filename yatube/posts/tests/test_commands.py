@@ -0,0 +1,334 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+
+import requests
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.loadtest import LoadStats, LoadUser
+
+from ..benchmark import (
+    ShardBenchmark, SQLiteBenchmark, ViewBenchmark, compare, save_database,
+)
+from ..management.commands.loadtest import parse_mix
+from ..lookups import USERS
+from ..models import Follow, Group, Post, TimelineEntry, User
+from ..search import search_posts
+
+
+class ImportPostsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def test_import_jsonl(self):
+        """JSONL загружается с авторами, группами и датами."""
+        records = [
+            {'text': 'Первый', 'author': 'auth', 'group': 'test-slug',
+             'pub_date': '2020-01-02T03:04:05+00:00'},
+            {'text': 'Второй', 'author': 'auth'},
+            {'text': '', 'author': 'auth'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        call_command('import_posts', path, batch_size=1, stdout=StringIO())
+        author = User.objects.get(username='auth')
+        group = Group.objects.get(slug='test-slug')
+        post = Post.objects.get(text='Первый')
+        self.assertEqual(post.author, author)
+        self.assertEqual(post.group, group)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(author.profile.posts_count, 2)
+        group.refresh_from_db()
+        self.assertEqual(group.posts_count, 1)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_import_refreshes_caches_and_timelines(self):
+        """После загрузки новые авторы видны, а посты попадают в ленты."""
+        cache.clear()
+        known = User.objects.create_user(username='known')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=known)
+        self.assertIsNone(USERS.get('new'))
+        records = [
+            {'text': 'Известный', 'author': 'known'},
+            {'text': 'Новый', 'author': 'new'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(USERS.get('new').pk, User.objects.get(
+            username='new'
+        ).pk)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=reader).values_list(
+                'post__text', flat=True
+            )),
+            ['Известный'],
+        )
+
+    def test_malformed_pub_date_is_skipped(self):
+        """Запись с неверной датой пропускается, остальные загружаются."""
+        records = [
+            {'text': 'Неверная дата', 'author': 'auth',
+             'pub_date': '2020-13-45T00:00:00'},
+            {'text': 'Не дата', 'author': 'auth', 'pub_date': 'вчера'},
+            {'text': 'Верная дата', 'author': 'auth',
+             'pub_date': '2020-01-02T03:04:05'},
+        ]
+        path = self.write('posts.jsonl', '\n'.join(map(json.dumps, records)))
+        output = StringIO()
+        call_command('import_posts', path, stdout=output)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)),
+            ['Верная дата'],
+        )
+        self.assertIn('пропущено записей: 2', output.getvalue())
+
+    def test_import_resumes_from_checkpoint(self):
+        """Прерванная загрузка CSV продолжается с сохраненного места."""
+        path = self.write(
+            'posts.csv', 'text,author,group\nПервый,auth,\nВторой,auth,\n'
+        )
+        self.write('posts.csv.checkpoint', '1')
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Второй']
+        )
+
+
+class ExportPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for number in range(3):
+            Post.objects.create(
+                author=cls.author, text='Пост %s' % number, group=cls.group
+            )
+        Post.objects.create(
+            author=User.objects.create_user(username='other'), text='Чужой'
+        )
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_export_command(self):
+        """Команда выгружает посты автора в JSONL пачками."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl')
+            call_command('export_posts', author='auth', output=path)
+            with open(path, encoding='utf-8') as exported:
+                records = [json.loads(line) for line in exported]
+        self.assertEqual(
+            [record['text'] for record in records],
+            ['Пост 0', 'Пост 1', 'Пост 2'],
+        )
+        self.assertEqual(records[0]['group'], self.group.slug)
+
+    def test_export_view(self):
+        """Выгрузка из профиля доступна только авторизованным."""
+        url = reverse('posts:profile_export', args=(self.author.username,))
+        self.assertEqual(self.client.get(url).status_code, HTTPStatus.FOUND)
+        self.client.force_login(self.author)
+        response = self.client.get(url, {'format': 'csv', 'gzip': 1})
+        content = gzip.decompress(b''.join(response.streaming_content))
+        rows = list(csv.reader(StringIO(content.decode())))
+        self.assertEqual(
+            rows[0], ['id', 'text', 'author', 'group', 'pub_date']
+        )
+        self.assertEqual(len(rows), 4)
+
+
+class SeedTests(TestCase):
+    def seeded(self, **options):
+        call_command('seed', posts=60, stdout=StringIO(), **options)
+        posts = list(Post.objects.order_by('id').values_list(
+            'text', 'pub_date', 'author__username', 'group__slug'
+        ))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        return posts
+
+    def test_seed_is_deterministic(self):
+        """Одинаковый seed дает одинаковый набор, другой seed - другой."""
+        posts = self.seeded(seed=7)
+        self.assertEqual(len(posts), 60)
+        self.assertEqual(self.seeded(seed=7), posts)
+        self.assertEqual(self.seeded(seed=7, workers=2), posts)
+        self.assertNotEqual(self.seeded(seed=8), posts)
+        pub_dates = [pub_date for _, pub_date, _, _ in posts]
+        self.assertEqual(pub_dates, sorted(pub_dates))
+
+    def test_seed_counters_and_search(self):
+        """Счетчики, профили и поисковый индекс согласованы с постами."""
+        call_command('seed', posts=200, stdout=StringIO())
+        author = User.objects.get(username='author0')
+        self.assertEqual(
+            author.profile.posts_count, author.posts.count()
+        )
+        for group in Group.objects.all():
+            self.assertEqual(group.posts_count, group.posts.count())
+        word = Post.objects.first().text.split()[0]
+        self.assertTrue(search_posts(word).count())
+        Post.objects.create(author=author, text='Уникальноеслово')
+        self.assertEqual(search_posts('Уникальноеслово').count(), 1)
+
+    def test_seed_refuses_second_run(self):
+        """Повторный запуск на заполненной базе запрещен."""
+        call_command('seed', posts=10, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('seed', posts=10, stdout=StringIO())
+
+    @override_settings(POST_SHARDS=['shard_a'])
+    def test_bulk_loads_refuse_with_shards(self):
+        """seed и import_posts не пишут в default при шардировании."""
+        with self.assertRaises(CommandError):
+            call_command('seed', posts=10, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('import_posts', '-', stdout=StringIO())
+        self.assertFalse(Post.objects.exists())
+
+
+class ViewBenchmarkTests(TestCase):
+    def test_compare_flags_regressions(self):
+        """Рост p95 сверх допуска и лишние запросы считаются регрессией."""
+        baseline = {'100': {
+            'index': {'p95': 10.0, 'queries': 4},
+            'profile': {'p95': 10.0, 'queries': 5},
+        }}
+        results = {'100': {
+            'index': {'p95': 11.0, 'queries': 4},
+            'profile': {'p95': 13.0, 'queries': 6},
+            'post_detail': {'p95': 50.0, 'queries': 9},
+        }}
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(r.startswith('100/profile') for r in regressions))
+
+    def test_cold_run_keeps_configured_cache(self):
+        """Холодный прогон очищает кеши из TEST_CACHES, а не рабочие."""
+        author = User.objects.create_user(username='auth')
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(author=author, group=group, text='Пост')
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark-configured',
+        }}
+        with self.settings(CACHES=caches):
+            cache.set('kept', 1)
+            result = ViewBenchmark(1).run()
+            self.assertEqual(cache.get('kept'), 1)
+        self.assertIn('profile', result)
+
+
+class LoadTestTests(TestCase):
+    def test_parse_mix(self):
+        """Смесь маршрутов разбирается, неизвестные маршруты отклоняются."""
+        self.assertEqual(
+            parse_mix('index=3,create=0.5'), {'index': 3, 'create': 0.5}
+        )
+        for value in ('index', 'index=x', 'unknown=1'):
+            with self.subTest(value=value):
+                with self.assertRaises(CommandError):
+                    parse_mix(value)
+
+    def test_stats_report(self):
+        """Ошибки — коды от 400 и исключения, редиректы успешны."""
+        stats = LoadStats()
+        for status in (200, 302, 500, 'ConnectionError'):
+            stats.record('index', 0.01, status)
+        report = stats.report(duration=2)['index']
+        self.assertEqual(report['requests'], 4)
+        self.assertEqual(report['rps'], 2)
+        self.assertEqual(report['error_rate'], 0.5)
+        self.assertEqual(report['statuses']['ConnectionError'], 1)
+
+    def test_login_redirect_is_error(self):
+        """Редирект на страницу входа считается ошибкой."""
+        class User(LoadUser):
+            ROUTES = {'create': 'create'}
+
+            def create(self):
+                response = requests.Response()
+                response.status_code = 302
+                response.headers['Location'] = '%s?next=/create/' % reverse(
+                    'users:login'
+                )
+                return response
+
+        stats = LoadStats()
+        User('http://testserver', None).hit('create', stats)
+        report = stats.report(duration=1)['create']
+        self.assertEqual(report['error_rate'], 1)
+        self.assertEqual(report['statuses']['LoginRedirect'], 1)
+
+    @override_settings(DEBUG=False)
+    def test_loadtest_refuses_without_debug(self):
+        """Без DEBUG нагрузочный тест не пишет в базу."""
+        with self.assertRaises(CommandError):
+            call_command('loadtest', stdout=StringIO())
+        self.assertFalse(User.objects.filter(username='loadtest').exists())
+
+
+class SQLiteBenchmarkTests(TransactionTestCase):
+    def test_benchmark_modes(self):
+        """Бенчмарк отрабатывает оба режима на копии базы."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        author = User.objects.create_user(username='auth')
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(author=author, group=group, text='Пост')
+        source = os.path.join(directory.name, 'source.sqlite3')
+        save_database(source)
+        benchmark = SQLiteBenchmark(source, 1, 1, duration=0.2)
+        for mode in ('stock', 'tuned'):
+            with self.subTest(mode=mode):
+                result = benchmark.run(mode, directory.name)
+                self.assertGreater(result['read']['ops'], 0)
+                self.assertGreater(result['write']['ops'], 0)
+
+
+class ShardBenchmarkTests(TransactionTestCase):
+    def test_benchmark_shard_counts(self):
+        """Бенчмарк раскладывает копию базы по шардам и меряет ленты."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        group = Group.objects.create(title='Группа', slug='group')
+        for username in ('first', 'second'):
+            author = User.objects.create_user(username=username)
+            for number in range(3):
+                Post.objects.create(author=author, group=group, text='Пост')
+        source = os.path.join(directory.name, 'source.sqlite3')
+        save_database(source)
+        benchmark = ShardBenchmark(source, repeat=2, deep_page=1)
+        with self.settings(NUMBER_OBJECTS=2):
+            result = benchmark.run(2, directory.name)
+        self.assertEqual(set(result), {
+            'index', 'index_deep', 'index_cursor_deep', 'group_posts',
+            'profile',
+        })
+        self.assertNotIn('benchmark_shard2_0', connections)
+
+    def test_counts_must_be_positive(self):
+        """--deep-page и --repeat меньше 1 отклоняются при разборе."""
+        for option in ('--deep-page', '--repeat'):
+            with self.subTest(option=option):
+                with self.assertRaises(CommandError):
+                    call_command('benchmark_shards', option, '0')
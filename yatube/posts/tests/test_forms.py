@@ -1,5 +1,6 @@
 from http import HTTPStatus
 
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -24,6 +25,7 @@ class PostFormTests(TestCase):
         cls.form = PostForm()
 
     def setUp(self):
+        cache.clear()
         self.author_client = Client()
         self.author_client.force_login(self.author)
         self.REVERSE_ADDRESS_PROFILE = reverse(
@@ -1,6 +1,14 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
 from ..models import Group, Post, User
+from ..utils import encode_cursor
 
 
 class PostModelTest(TestCase):
@@ -42,3 +50,137 @@ class PostModelTest(TestCase):
                     self.post._meta.get_field(field).verbose_name,
                     expected_value,
                 )
+
+
+class PostIndexTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_feed_plan(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        feed_sql = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "posts_post"."id"')
+            and 'ORDER BY' in query['sql']
+        ]
+        self.assertEqual(len(feed_sql), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + feed_sql[0])
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def check_feed_plans(self, pages):
+        for url, index_name in pages:
+            with self.subTest(url=url):
+                plan = self.get_feed_plan(url)
+                self.assertIn(index_name, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_feeds_use_indexes(self):
+        """Ленты читают посты по индексу без сортировки во временном дереве."""
+        self.check_feed_plans((
+            (reverse('posts:index'), 'post_pub_date_idx'),
+            (
+                reverse('posts:group_list', args=(self.group.slug,)),
+                'post_group_pub_date_idx',
+            ),
+            (
+                reverse('posts:profile', args=(self.user.username,)),
+                'post_author_pub_date_idx',
+            ),
+        ))
+
+    @override_settings(CURSOR_PAGINATION=True)
+    def test_cursor_feeds_use_indexes(self):
+        """Страницы по курсору тоже читаются по индексу."""
+        after = '?after=' + encode_cursor(self.post)
+        self.check_feed_plans((
+            (reverse('posts:index') + after, 'post_pub_date_idx'),
+            (
+                reverse('posts:group_list', args=(self.group.slug,)) + after,
+                'post_group_pub_date_idx',
+            ),
+            (
+                reverse('posts:profile', args=(self.user.username,)) + after,
+                'post_author_pub_date_idx',
+            ),
+        ))
+
+
+class PostCounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Другое описание',
+        )
+
+    def assertCounts(self, author, group, other_group):
+        self.user.profile.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.user.profile.posts_count, author)
+        self.assertEqual(self.group.posts_count, group)
+        self.assertEqual(self.other_group.posts_count, other_group)
+
+    def test_counters_follow_posts(self):
+        """Счетчики меняются при создании, смене группы и удалении поста."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        self.assertCounts(1, 1, 0)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertCounts(1, 0, 1)
+        post.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_group_change_is_seen_without_loaded_copy(self):
+        """Смена группы учитывается, даже если пост не читали из базы."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Post(
+            pk=post.pk, author=self.user, text='Тестовый пост',
+            group=self.other_group, pub_date=post.pub_date,
+        ).save()
+        self.assertCounts(1, 0, 1)
+
+    def test_reading_posts_does_not_track_relations(self):
+        """Чтение постов не запоминает связи, это делает только сохранение."""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        post = Post.objects.get()
+        self.assertFalse(hasattr(post, '_loaded_group_id'))
+
+    def test_recount_fixes_drift(self):
+        """Команда recount_posts исправляет рассинхронизацию."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Тестовый пост', group=self.group),
+        ])
+        self.assertCounts(0, 0, 0)
+        call_command('recount_posts', stdout=StringIO())
+        self.assertCounts(1, 1, 0)
@@ -0,0 +1,68 @@
+from django.test import TestCase
+
+from core.query_plans import shape_changes
+
+from .. import query_plans
+from ..urls import urlpatterns
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        query_plans.seed_database()
+
+    def test_plans_match_snapshot(self):
+        """Запросы страниц совпадают со снимком, планы не хуже."""
+        current = query_plans.collect()
+        snapshot = query_plans.load_snapshot()
+        regressions = query_plans.regressions(current, snapshot)
+        if regressions:
+            self.fail(
+                'Новые полные сканы или сортировки во временном B-дереве '
+                '(если так и задумано, запустите bless_query_plans):\n%s'
+                % '\n'.join(regressions)
+            )
+        changes = shape_changes(current, snapshot)
+        if changes:
+            self.fail(
+                'Набор запросов страниц разошелся со снимком '
+                '(если так и задумано, запустите bless_query_plans):\n%s'
+                % '\n'.join(changes)
+            )
+
+    def test_every_route_has_scenario(self):
+        """Для каждого маршрута posts есть сценарий со снятием планов."""
+        _, steps = query_plans.scenarios()
+        self.assertLessEqual(
+            {pattern.name for pattern in urlpatterns},
+            {name for name, _, _, _ in steps},
+        )
+
+    def test_new_problems_are_reported(self):
+        """Скан posts_post и TEMP B-TREE вне снимка считаются регрессией."""
+        shape = 'SELECT ... FROM posts_post ORDER BY text'
+        current = {'index': {shape: [
+            'SCAN posts_post', 'USE TEMP B-TREE FOR ORDER BY',
+        ]}}
+        self.assertEqual(len(query_plans.regressions(current, {})), 2)
+        self.assertEqual(query_plans.regressions(current, current), [])
+        indexed = {'index': {shape: [
+            'SCAN posts_post USING INDEX posts_post_pub_date',
+        ]}}
+        self.assertEqual(query_plans.regressions(indexed, {}), [])
+
+    def test_changed_shapes_are_reported(self):
+        """Новая или пропавшая форма запроса — расхождение со снимком."""
+        snapshot = {'index': {'SELECT ... FROM posts_post': []}}
+        current = {'index': {
+            'SELECT ... FROM posts_post': [],
+            'SELECT ... FROM auth_user WHERE id IN (...)': [],
+        }}
+        self.assertEqual(shape_changes(current, current), [])
+        self.assertEqual(shape_changes(current, snapshot), [
+            'index: + SELECT ... FROM auth_user WHERE id IN (...)',
+        ])
+        self.assertEqual(shape_changes(snapshot, current), [
+            'index: - SELECT ... FROM auth_user WHERE id IN (...)',
+        ])
@@ -1,8 +1,21 @@
+import warnings
+from http import HTTPStatus
+from urllib.parse import urlencode
+
 from django.conf import settings
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Group, Post, User
+from core.page_cache import purge_path
+from core.testing import QueryBudgetMixin
+
+from ..lookups import GROUPS, USERS, attach_related
+from ..models import Follow, Group, Post, TimelineEntry, User
+from ..utils import (
+    CachedCountPaginator, CursorPaginator, encode_cursor, follow_counts,
+)
 
 
 class PostContextTests(TestCase):
@@ -22,6 +35,7 @@ class PostContextTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.author_client = Client()
         self.author_client.force_login(self.author)
 
@@ -110,6 +124,7 @@ class PaginatorTests(TestCase):
         cls.post = Post.objects.bulk_create(cls.post_list)
 
     def setUp(self):
+        cache.clear()
         self.author_client = Client()
         self.author_client.force_login(self.author)
 
@@ -130,3 +145,602 @@ class PaginatorTests(TestCase):
                     response = self.author_client.get(page + url)
                     context = response.context.get('page_obj')
                     self.assertEqual(len(context), number_posts)
+
+    def test_count_is_cached(self):
+        """Число постов считается один раз и сбрасывается новым постом."""
+        profile = reverse('posts:profile', args=(self.author.username,))
+        self.client.get(profile)
+        with self.assertNumQueries(1):
+            self.client.get(profile + '?page=2')
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(profile + '?page=2')
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            settings.TEST_POSTS + 1,
+        )
+
+    def test_follow_resets_only_follower_counts(self):
+        """Подписка сбрасывает счетчики ленты подписчика, а не все."""
+        reader = User.objects.create_user(username='reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        profile = reverse('posts:profile', args=(self.author.username,))
+        self.client.get(profile)
+        follow_key = follow_counts(reader.pk).key('feed')
+        reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertNotEqual(follow_counts(reader.pk).key('feed'), follow_key)
+        with self.assertNumQueries(1):
+            self.client.get(profile + '?page=2')
+        response = reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            settings.TEST_POSTS,
+        )
+
+    def test_elided_page_range(self):
+        """Ссылки на страницы выводятся окном вокруг текущей."""
+        paginator = CachedCountPaginator(Post.objects.all(), 1)
+        ellipsis = CachedCountPaginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(7)),
+            [1, ellipsis, 5, 6, 7, 8, 9, ellipsis, settings.TEST_POSTS],
+        )
+
+
+@override_settings(CURSOR_PAGINATION=True)
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(author=cls.author, text='Тестовый текст ' + str(pryanik))
+            for pryanik in range(settings.TEST_POSTS)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages(self):
+        """Курсоры after/before листают ленту в обе стороны."""
+        index = reverse('posts:index')
+        first_page = self.client.get(index).context['page_obj']
+        page_obj = self.client.get(
+            index, {'after': first_page.next_cursor()}
+        ).context['page_obj']
+        self.assertTrue(page_obj.is_cursor)
+        self.assertEqual(len(page_obj), settings.TEST_PAGINATOR)
+        self.assertTrue(page_obj.has_previous())
+        self.assertFalse(page_obj.has_next())
+        previous_page = self.client.get(
+            index, {'before': page_obj.previous_cursor()}
+        ).context['page_obj']
+        self.assertEqual(
+            list(previous_page.object_list), list(first_page.object_list)
+        )
+
+    def test_cursor_page_skips_count(self):
+        """Страница по курсору стоит один запрос без COUNT."""
+        index = reverse('posts:index')
+        cursor = Post.objects.order_by('-pub_date', '-id')[5]
+        USERS.get_many([self.author.pk])
+        with self.assertNumQueries(1):
+            self.client.get(index, {'after': encode_cursor(cursor)})
+
+    def test_before_page_knows_if_older_posts_exist(self):
+        """Ссылка «дальше» на странице before есть, только если есть посты."""
+        oldest = Post.objects.order_by('pub_date', 'id').first()
+        cursor = encode_cursor(oldest)
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        self.assertTrue(paginator.get_page(before=cursor).has_next())
+        oldest.delete()
+        page = paginator.get_page(before=cursor)
+        self.assertEqual(len(page), 3)
+        self.assertFalse(page.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.client.get(reverse('posts:index'), {'after': 'x'})
+        page_obj = response.context['page_obj']
+        self.assertFalse(page_obj.has_previous())
+        self.assertEqual(len(page_obj), settings.NUMBER_OBJECTS)
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_are_cached(self):
+        """Повторный показ ленты берет карточки из кеша."""
+        index = reverse('posts:index')
+        response = self.client.get(index)
+        self.assertTemplateUsed(response, 'posts/includes/post_card.html')
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        self.assertTemplateNotUsed(
+            response, 'posts/includes/post_card.html'
+        )
+
+    def test_card_changes_with_author_name(self):
+        """Смена имени автора дает новую карточку."""
+        profile = reverse('posts:profile', args=(self.author.username,))
+        self.client.get(profile)
+        self.author.first_name = 'Пряник'
+        self.author.save()
+        response = self.client.get(profile)
+        self.assertContains(response, 'Пряник')
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_anonymous_page_is_cached(self):
+        """Повторный запрос анонима обходится без базы."""
+        index = reverse('posts:index')
+        self.client.get(index)
+        with self.assertNumQueries(0):
+            response = self.client.get(index)
+        self.assertContains(response, self.post.text)
+
+    def test_cached_page_has_personal_header(self):
+        """Авторизованный получает кешированную страницу со своей шапкой."""
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        response = self.client.get(detail)
+        self.assertNotContains(response, 'Редактировать')
+        with self.assertNumQueries(3):
+            response = self.author_client.get(detail)
+        self.assertContains(response, 'Пользователь ' + self.author.username)
+        self.assertContains(response, 'Редактировать')
+
+    def test_new_post_purges_pages(self):
+        """Новый пост сбрасывает главную и профиль автора."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тульский пряник'
+        )
+        cls.best_post = Post.objects.create(
+            author=cls.author, text='Пряник к пряникам и пряники'
+        )
+        Post.objects.create(author=cls.author, text='Котлета')
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_ranks_results(self):
+        """Поиск находит посты по началу слова и сортирует по bm25."""
+        self.assertEqual(self.search('пряник'), [self.best_post, self.post])
+        self.assertEqual(self.search('"; DROP'), [])
+        self.assertEqual(self.search(''), [])
+
+    @override_settings(NUMBER_OBJECTS=1)
+    def test_search_has_page_links(self):
+        """У выдачи на несколько страниц есть ссылки на номера страниц."""
+        response = self.client.get(reverse('posts:search'), {'q': 'пряник'})
+        self.assertEqual(response.context['page_obj'].paginator.num_pages, 2)
+        prefix = '?%s&amp;' % urlencode({'q': 'пряник'})
+        self.assertContains(response, '%spage=2">2</a>' % prefix)
+
+    def test_search_index_follows_edits(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Тульская котлета'
+        post.save()
+        self.assertEqual(self.search('тульск'), [post])
+        post.delete()
+        self.assertEqual(self.search('тульск'), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет через полнотекстовый индекс."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': 'котлет'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class FollowTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.star = User.objects.create_user(username='star')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get_follow_page(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_and_unfollow(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+        )
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.get_follow_page(), [new_post, self.old_post])
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertEqual(self.get_follow_page(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_merged_on_read(self):
+        """Посты популярного автора читаются при показе ленты."""
+        Follow.objects.create(user=self.reader, author=self.star)
+        post = Post.objects.create(author=self.star, text='Звездный пост')
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(self.get_follow_page(), [post])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2, TIMELINE_TRIM_INTERVAL=1)
+    def test_timeline_is_capped(self):
+        """Лента читателя ограничена по длине."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(3):
+            Post.objects.create(author=self.author, text=str(number))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый текст', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_are_rendered(self):
+        """RSS и Atom отдаются для главной, группы и автора."""
+        urls = (
+            reverse('posts:index_feed', args=('rss',)),
+            reverse('posts:group_feed', args=(self.group.slug, 'atom')),
+            reverse('posts:profile_feed', args=(self.author.username, 'rss')),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, self.post.text)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_repeat_poll_is_not_modified(self):
+        """Повторный опрос без изменений получает 304 за один запрос."""
+        url = reverse('posts:group_feed', args=(self.group.slug, 'rss'))
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Post.objects.create(
+            author=self.author, text='Новый текст', group=self.group
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый текст')
+
+    def test_etag_follows_edits_and_deletes(self):
+        """Правка и удаление поста ленты меняют ETag."""
+        url = reverse('posts:profile_feed', args=(self.author.username, 'rss'))
+        post = Post.objects.create(author=self.author, text='Второй текст')
+        etags = [self.client.get(url)['ETag']]
+        post.text = 'Исправленный текст'
+        post.save()
+        etags.append(self.client.get(url)['ETag'])
+        post.delete()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_etag_follows_author_and_group_names(self):
+        """Переименование автора или группы меняет ETag, вход — нет."""
+        url = reverse('posts:group_feed', args=(self.group.slug, 'rss'))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новое имя')
+        etag = response['ETag']
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новый заголовок'
+        group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый заголовок')
+
+    def test_unknown_feed_kind(self):
+        """Неизвестный формат ленты дает 404."""
+        response = self.client.get(reverse('posts:index_feed', args=('x',)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class PostConditionalTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author, text='Тестовый текст', group=self.group
+        )
+        self.url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_unchanged_post_is_not_modified(self):
+        """Повторный запрос неизменного поста получает 304 за один запрос."""
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_edit_changes_etag(self):
+        """Правка поста обновляет updated_at и ETag."""
+        etag = self.client.get(self.url)['ETag']
+        updated_at = self.post.updated_at
+        self.author_client.post(
+            reverse('posts:post_edit', args=(self.post.pk,)),
+            data={'text': 'Новый текст', 'group': self.group.pk},
+        )
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated_at, updated_at)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый текст')
+
+    def test_group_and_author_changes_etag(self):
+        """Смена названия группы и имени автора меняет ETag."""
+        etags = {self.client.get(self.url)['ETag']}
+        self.group.title = 'Новый заголовок'
+        self.group.save()
+        etags.add(self.client.get(self.url)['ETag'])
+        self.author.first_name = 'Лев'
+        self.author.save()
+        etags.add(self.client.get(self.url)['ETag'])
+        self.assertEqual(len(etags), 3)
+
+    def test_etag_depends_on_user(self):
+        """Гость и автор получают разные ETag."""
+        self.assertNotEqual(
+            self.client.get(self.url)['ETag'],
+            self.author_client.get(self.url)['ETag'],
+        )
+
+    def test_missing_post(self):
+        """Несуществующий пост по-прежнему дает 404."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk + 1,))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджеты запросов страниц при пустом кеше, без N+1."""
+
+    GUEST_BUDGETS = {
+        'posts:index': ((), 4),
+        'posts:group_list': (('test-slug',), 4),
+        'posts:profile': (('auth',), 4),
+        'posts:post_detail': (('post',), 2),
+    }
+    # Страницы не в кеше, авторы, группы и счетчики — в кеше.
+    WARM_BUDGETS = {
+        'posts:index': ((), 1),
+        'posts:group_list': (('test-slug',), 1),
+        'posts:profile': (('auth',), 1),
+    }
+    AUTHOR_BUDGETS = {
+        'posts:index': ((), 6),
+        'posts:post_detail': (('post',), 4),
+        'posts:post_edit': (('post',), 5),
+        'posts:post_create': ((), 3),
+        'posts:follow_index': ((), 4),
+        'admin:posts_post_changelist': ((), 7),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='auth', is_staff=True, is_superuser=True
+        )
+        groups = [
+            Group.objects.create(
+                title='Группа %s' % number,
+                slug='test-slug' if number == 0 else 'slug-%s' % number,
+                description='Тестовое описание',
+            )
+            for number in range(3)
+        ]
+        Post.objects.bulk_create(
+            Post(author=cls.author, text='Пост %s' % number,
+                 group=groups[number % 3])
+            for number in range(settings.TEST_POSTS)
+        )
+        cls.post = Post.objects.first()
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def check_budgets(self, client, budgets):
+        for name, (args, budget) in budgets.items():
+            args = [self.post.pk if arg == 'post' else arg for arg in args]
+            with self.subTest(name=name):
+                cache.clear()
+                with self.assertQueryBudget(budget):
+                    response = client.get(reverse(name, args=args))
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_guest_budgets(self):
+        self.check_budgets(self.client, self.GUEST_BUDGETS)
+
+    def test_warm_object_cache_budgets(self):
+        """Лентам с прогретым кешем объектов хватает запроса постов."""
+        for name, (args, budget) in self.WARM_BUDGETS.items():
+            path = reverse(name, args=args)
+            with self.subTest(name=name):
+                cache.clear()
+                self.client.get(path)
+                purge_path(path)
+                with self.assertQueryBudget(budget):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_author_budgets(self):
+        self.check_budgets(self.author_client, self.AUTHOR_BUDGETS)
+
+    def test_repeated_queries_are_reported(self):
+        """Повтор одной формы запроса — N+1 для теста и для лога."""
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(100):
+                for post in Post.objects.all():
+                    post.author.username
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            with self.settings(QUERY_REPEAT_THRESHOLD=1):
+                self.client.get(reverse('posts:profile', args=('auth',)))
+        self.assertIn('N+1 в posts:profile', logs.output[0])
+
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.create(author=cls.author, text='Пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookups_are_cached(self):
+        """Группа по slug и автор по имени читаются из базы один раз."""
+        GROUPS.get('test-slug')
+        USERS.get('auth')
+        with self.assertNumQueries(0):
+            self.assertEqual(GROUPS.get('test-slug'), self.group)
+            self.assertEqual(USERS.get('auth'), self.author)
+        self.assertIn('password', USERS.get('auth').get_deferred_fields())
+
+    def test_misses_are_cached(self):
+        """Несуществующий slug после первого промаха не доходит до базы."""
+        self.assertIsNone(GROUPS.get('no-such-group'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(GROUPS.get('no-such-group'))
+        group = Group.objects.create(title='Новая', slug='no-such-group')
+        self.assertEqual(GROUPS.get('no-such-group'), group)
+
+    def test_save_and_delete_invalidate(self):
+        """Сохранение и удаление сбрасывают кеш, старый slug не находится."""
+        GROUPS.get('test-slug')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        self.assertIsNone(GROUPS.get('test-slug'))
+        self.assertEqual(GROUPS.get('renamed').slug, 'renamed')
+        user = User.objects.create_user(username='temp')
+        USERS.get('temp')
+        user.first_name = 'Имя'
+        user.save()
+        self.assertEqual(USERS.get('temp').first_name, 'Имя')
+        user.delete()
+        self.assertIsNone(USERS.get('temp'))
+
+    def test_group_page_shows_fresh_count(self):
+        """Новый пост в группе обновляет счетчик закешированной группы."""
+        path = reverse('posts:group_list', args=('test-slug',))
+        self.assertEqual(self.client.get(path).context['group'].posts_count, 1)
+        Post.objects.create(author=self.author, text='Еще', group=self.group)
+        self.assertEqual(self.client.get(path).context['group'].posts_count, 2)
+
+    def test_profile_page_shows_fresh_count(self):
+        """Счетчик постов автора кешируется с ним и сбрасывается постом."""
+        path = reverse('posts:profile', args=('auth',))
+        author = self.client.get(path).context['author']
+        self.assertEqual(author.profile.posts_count, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(USERS.get('auth').profile.posts_count, 1)
+        Post.objects.create(author=self.author, text='Еще')
+        author = self.client.get(path).context['author']
+        self.assertEqual(author.profile.posts_count, 2)
+
+    def test_keys_are_safe_for_memcached(self):
+        """Кириллический slug не попадает в ключ кеша как есть."""
+        Group.objects.create(title='Кириллица', slug='кириллица')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            self.assertEqual(GROUPS.get('кириллица').title, 'Кириллица')
+            self.assertIsNone(GROUPS.get('нет такой группы'))
+
+    def test_feed_rows_get_cached_relations(self):
+        """Посты ленты получают авторов и группы из кеша без JOIN."""
+        attach_related(Post.objects.all())
+        with self.assertNumQueries(1):
+            posts = attach_related(Post.objects.all())
+            self.assertEqual(posts[0].author.username, 'auth')
+            self.assertEqual(posts[0].group.slug, 'test-slug')
@@ -0,0 +1,177 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.cache import get_or_compute
+
+from . import sharding
+from .lookups import attach_related
+from .models import Follow, Post, TimelineEntry
+
+TRIM_SQL = '''
+DELETE FROM posts_timelineentry WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC
+        ) AS position
+        FROM posts_timelineentry WHERE user_id IN (%s)
+    ) WHERE position > %%s
+)
+'''
+
+
+CELEBRITIES_KEY = 'posts:timeline:celebrities'
+
+
+def celebrity_ids():
+    """Авторы, чьи посты не раскладываются по лентам, а читаются при показе."""
+    def compute():
+        authors = Follow.objects.values('author').annotate(
+            followers=Count('pk')
+        ).filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT)
+        return frozenset(row['author'] for row in authors)
+
+    return get_or_compute(
+        CELEBRITIES_KEY, compute, settings.TIMELINE_CELEBRITY_TIMEOUT,
+        name='celebrities',
+    )
+
+
+def trim_timelines(user_ids):
+    if not user_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            TRIM_SQL % ', '.join(['%s'] * len(user_ids)),
+            list(user_ids) + [settings.TIMELINE_MAX_LENGTH],
+        )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков пачками.
+
+    Возвращает число лент, в которые попал пост. С шардами лента
+    собирается при показе, см. followed_posts.
+    """
+    if sharding.enabled() or post.author_id in celebrity_ids():
+        return 0
+    trim = post.pk % settings.TIMELINE_TRIM_INTERVAL == 0
+    followers = Follow.objects.filter(author_id=post.author_id)
+    followers = followers.order_by('user_id').values_list('user_id', flat=True)
+    delivered = 0
+    last_user_id = 0
+    while True:
+        batch = list(
+            followers.filter(user_id__gt=last_user_id)[
+                :settings.TIMELINE_BATCH_SIZE
+            ]
+        )
+        if not batch:
+            return delivered
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                (
+                    TimelineEntry(
+                        user_id=user_id,
+                        post_id=post.pk,
+                        pub_date=post.pub_date,
+                    )
+                    for user_id in batch
+                ),
+                ignore_conflicts=True,
+            )
+            if trim:
+                trim_timelines(batch)
+        delivered += len(batch)
+        last_user_id = batch[-1]
+
+
+def fill_timeline(user_id, author_ids):
+    """Добавляет в ленту читателя последние посты авторов."""
+    author_ids = set(author_ids) - celebrity_ids()
+    if not author_ids or sharding.enabled():
+        return 0
+    # Чтение до транзакции: она начинается с записи и сразу встает в
+    # очередь писателей, см. core.backends.sqlite3.
+    posts = list(Post.objects.filter(author_id__in=author_ids).values_list(
+        'id', 'pub_date'
+    )[:settings.TIMELINE_MAX_LENGTH])
+    with transaction.atomic():
+        entries = TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+            ),
+            ignore_conflicts=True,
+        )
+        trim_timelines([user_id])
+    return len(entries)
+
+
+def rebuild_timeline(user_id):
+    author_ids = Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True
+    )
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        return fill_timeline(user_id, list(author_ids))
+
+
+def follow(user, author):
+    _, created = Follow.objects.get_or_create(user=user, author=author)
+    if created:
+        fill_timeline(user.pk, [author.pk])
+    return created
+
+
+def unfollow(user, author):
+    Follow.objects.filter(user=user, author=author).delete()
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def timeline(user):
+    """(id, pub_date) постов ленты: разложенные и посты популярных авторов."""
+    entries = TimelineEntry.objects.filter(user=user).values_list(
+        'post_id', 'pub_date'
+    )
+    celebrities = celebrity_ids()
+    if celebrities:
+        celebrities = Follow.objects.filter(
+            user=user, author_id__in=celebrities
+        ).values_list('author_id', flat=True)
+        celebrities = list(celebrities)
+    if not celebrities:
+        return entries.order_by('-pub_date', '-post_id')
+    posts = Post.objects.filter(author_id__in=celebrities).order_by()
+    return entries.order_by().union(
+        posts.values_list('id', 'pub_date')
+    ).order_by('-pub_date', '-post_id')
+
+
+def pull_timeline(user):
+    """Лента без материализации: посты всех авторов из подписок."""
+    return Post.objects.filter(
+        author__following__user=user
+    ).values_list('id', 'pub_date')
+
+
+def followed_posts(user):
+    """Лента с шардами: слияние постов авторов из подписок со всех шардов.
+
+    Записи TimelineEntry ссылаются на посты в default, а посты живут на
+    шардах, поэтому лента читается при показе.
+    """
+    author_ids = list(Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True
+    ))
+    return sharding.all_posts(author_id__in=author_ids)
+
+
+def attach_posts(page_obj):
+    """Меняет пары (id, pub_date) страницы на посты."""
+    ids = [pk for pk, _ in page_obj.object_list]
+    posts = Post.objects.in_bulk(ids)
+    page_obj.object_list = attach_related(
+        posts[pk] for pk in ids if pk in posts
+    )
+    return page_obj
@@ -1,14 +1,42 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('feed/<str:kind>/', feeds.index_feed, name='index_feed'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/feed/<str:kind>/',
+        feeds.group_feed,
+        name='group_feed',
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/export/',
+        views.profile_export,
+        name='profile_export',
+    ),
+    path(
+        'profile/<str:username>/feed/<str:kind>/',
+        feeds.profile_feed,
+        name='profile_feed',
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('search/', views.search, name='search'),
+    path('follow/', views.follow_index, name='follow_index'),
+    path(
+        'profile/<str:username>/follow/',
+        views.profile_follow,
+        name='profile_follow',
+    ),
+    path(
+        'profile/<str:username>/unfollow/',
+        views.profile_unfollow,
+        name='profile_unfollow',
+    ),
 ]
@@ -1,8 +1,255 @@
+import hashlib
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.cache import Namespace, get_or_compute
+
+CURSOR_SALT = 'posts.cursor'
+COUNTS = Namespace('posts:count')
+
+
+def encode_cursor(post):
+    return signing.dumps(
+        (post.pub_date.isoformat(), post.pk),
+        salt=CURSOR_SALT,
+    )
+
+
+def decode_cursor(token):
+    """Возвращает пару (pub_date, id) или None для битого курсора."""
+    try:
+        pub_date, pk = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    pub_date = parse_datetime(pub_date)
+    if pub_date is None or not isinstance(pk, int):
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page of %s posts>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return ''
+
+    def previous_cursor(self):
+        if self.object_list:
+            return encode_cursor(self.object_list[0])
+        return ''
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу (pub_date, id) без OFFSET и COUNT.
+
+    Номеров страниц нет, поэтому это не Paginator: страницы открываются
+    только курсорами after и before.
+    """
+
+    ordering = ('-pub_date', '-id')
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = int(per_page)
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        if after:
+            return self._page_after(*after)
+        if before:
+            return self._page_before(*before)
+        return self._page_after()
+
+    def _older(self, pub_date, pk):
+        return self.object_list.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+        )
+
+    def _page_after(self, pub_date=None, pk=None):
+        posts = self.object_list
+        if pub_date is not None:
+            posts = self._older(pub_date, pk)
+        posts = list(posts[:self.per_page + 1])
+        return CursorPage(
+            posts[:self.per_page],
+            self,
+            has_next=len(posts) > self.per_page,
+            has_previous=pub_date is not None,
+        )
+
+    def _page_before(self, pub_date, pk):
+        posts = self.object_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+        ).reverse()
+        posts = list(posts[:self.per_page + 1])
+        page = posts[:self.per_page][::-1]
+        if page:
+            pub_date, pk = page[-1].pub_date, page[-1].pk
+        else:
+            # Курсор мог указывать на удаленный пост: старше него — он сам.
+            pk += 1
+        return CursorPage(
+            page,
+            self,
+            has_next=self._older(pub_date, pk).exists(),
+            has_previous=len(posts) > self.per_page,
+        )
+
+
+def scope_counts(scope, pk):
+    """Счетчики ленты одного автора или группы."""
+    return Namespace('posts:count:%s:%s' % (scope, pk))
+
+
+def follow_counts(user_id):
+    """Счетчики ленты подписок пользователя.
+
+    Лента меняется с любым новым постом, поэтому в имени — версия общих
+    счетчиков; подписка и отписка сбрасывают только счетчики подписчика.
+    """
+    return Namespace('posts:count:follow:%s:%s' % (
+        user_id, COUNTS.version()
+    ))
+
+
+def invalidate_counts(author_ids=(), group_ids=()):
+    """Сбрасывает общие счетчики и счетчики лент авторов и групп."""
+    COUNTS.invalidate()
+    for author_id in set(author_ids):
+        scope_counts('author', author_id).invalidate()
+    for group_id in set(group_ids) - {None}:
+        scope_counts('group', group_id).invalidate()
+
+
+class WindowedPage(Page):
+    @property
+    def elided_page_range(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator с кешированным (или оценочным) числом записей.
+
+    Кеш общий для одинаковых запросов и живет в пространстве имен counts:
+    по умолчанию это общие счетчики, ленты автора, группы и подписок
+    передают свои, чтобы запись в одной ленте не сбрасывала остальные.
+    Вместо полного page_range шаблон выводит окно страниц вокруг текущей.
+    """
+
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, estimate=None, counts=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if estimate is None:
+            estimate = settings.PAGINATOR_ESTIMATED_COUNT
+        self.estimate = estimate
+        self.counts = counts or COUNTS
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        parts = getattr(self.object_list, 'querysets', None)
+        if parts is not None:
+            # Лента шардов: сумма кешированных счетчиков каждого шарда.
+            return sum(
+                type(self)(
+                    part, self.per_page, estimate=self.estimate,
+                    counts=self.counts,
+                ).count
+                for part in parts
+            )
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            # Не QuerySet, например результаты поиска: считаются сами.
+            return super().count
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        if self.estimate and not (query.where or query.combinator):
+            estimated = self._estimated_count()
+            if estimated is not None:
+                return estimated
+        signature = hashlib.md5(
+            repr((self.object_list.db, sql, params)).encode()
+        ).hexdigest()
+        return get_or_compute(
+            self.counts.key(signature), self.object_list.count,
+            settings.PAGINATOR_COUNT_TIMEOUT, name='count',
+        )
+
+    def _estimated_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'sqlite':
+            return None
+        table = self.object_list.model._meta.db_table
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                    [table],
+                )
+                row = cursor.fetchone()
+        except DatabaseError:
+            return None
+        if row is None:
+            return None
+        return int(row[0].split()[0])
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (self.num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
 
 
-def get_page(request, post_list):
-    paginator = Paginator(post_list, settings.NUMBER_OBJECTS)
+def get_page(request, post_list, counts=None):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.CURSOR_PAGINATION or after or before:
+        paginator = CursorPaginator(post_list, settings.NUMBER_OBJECTS)
+        return paginator.get_page(after=after, before=before)
+    paginator = CachedCountPaginator(
+        post_list, settings.NUMBER_OBJECTS, counts=counts
+    )
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
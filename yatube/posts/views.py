@@ -1,24 +1,51 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, render, redirect
+from django.http import StreamingHttpResponse
+from django.shortcuts import render, redirect
+
+from core.page_cache import cache_page_for_everyone
+from core.replicas import replica_reads
 
+from . import sharding
+from .cards import render_cards
+from .conditional import conditional_post
+from .export import FORMATS, export_posts
 from .forms import PostForm
-from .models import Group, Post, User
-from .utils import get_page
+from .lookups import GROUPS, USERS, attach_page
+from .models import Post
+from .search import search_posts
+from .timeline import (
+    attach_posts, follow, followed_posts, timeline, unfollow,
+)
+from .utils import (
+    CachedCountPaginator, follow_counts, get_page, scope_counts,
+)
 
 
+@replica_reads
+@cache_page_for_everyone
 def index(request):
-    post_list = Post.objects.select_related('group', 'author')
-    page_obj = get_page(request, post_list)
+    page_obj = render_cards(
+        attach_page(get_page(request, sharding.all_posts()))
+    )
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@replica_reads
+@cache_page_for_everyone
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
-    page_obj = get_page(request, posts)
+    group = GROUPS.get_or_404(slug)
+    page_obj = render_cards(
+        attach_page(get_page(
+            request, sharding.group_posts(group),
+            counts=scope_counts('group', group.pk),
+        ))
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -26,10 +53,16 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@replica_reads
+@cache_page_for_everyone
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related('group')
-    page_obj = get_page(request, post_list)
+    author = USERS.get_or_404(username)
+    page_obj = render_cards(
+        attach_page(get_page(
+            request, sharding.author_posts(author),
+            counts=scope_counts('author', author.pk),
+        ))
+    )
     context = {
         'page_obj': page_obj,
         'author': author,
@@ -37,8 +70,33 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@login_required
+def profile_export(request, username):
+    author = USERS.get_or_404(username)
+    file_format = request.GET.get('format')
+    if file_format not in FORMATS:
+        file_format = 'jsonl'
+    compress = bool(request.GET.get('gzip'))
+    filename = '%s.%s%s' % (username, file_format, '.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export_posts(
+            sharding.author_posts(author), file_format, compress
+        ),
+        content_type=(
+            'application/gzip' if compress else FORMATS[file_format]
+        ),
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+@replica_reads
+@conditional_post
+@cache_page_for_everyone
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = sharding.get_post_or_404(
+        Post.objects.select_related('author__profile', 'group'), post_id
+    )
     context = {
         'post': post,
     }
@@ -61,7 +119,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = sharding.get_post_or_404(Post.objects.all(), post_id)
     if request.user != post.author:
         return redirect("posts:post_detail", post_id)
     form = PostForm(request.POST or None, instance=post)
@@ -72,3 +130,53 @@ def post_edit(request, post_id):
         'form': form,
     }
     return render(request, "posts/create_post.html", context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = CachedCountPaginator(
+        search_posts(query), settings.NUMBER_OBJECTS
+    )
+    page_obj = render_cards(paginator.get_page(request.GET.get('page')))
+    context = {
+        'page_obj': page_obj,
+        'page_url_prefix': '?%s&' % urlencode({'q': query}),
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@login_required
+def follow_index(request):
+    counts = follow_counts(request.user.pk)
+    if sharding.enabled():
+        page_obj = attach_page(get_page(
+            request, followed_posts(request.user), counts=counts
+        ))
+    else:
+        paginator = CachedCountPaginator(
+            timeline(request.user), settings.NUMBER_OBJECTS, counts=counts
+        )
+        page_obj = attach_posts(
+            paginator.get_page(request.GET.get('page'))
+        )
+    context = {
+        'page_obj': render_cards(page_obj),
+    }
+    return render(request, 'posts/follow.html', context)
+
+
+@login_required
+def profile_follow(request, username):
+    author = USERS.get_or_404(username)
+    if author != request.user and follow(request.user, author):
+        follow_counts(request.user.pk).invalidate()
+    return redirect('posts:profile', username)
+
+
+@login_required
+def profile_unfollow(request, username):
+    author = USERS.get_or_404(username)
+    unfollow(request.user, author)
+    follow_counts(request.user.pk).invalidate()
+    return redirect('posts:profile', username)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_profiles(apps, schema_editor):
+    app_label, model_name = settings.AUTH_USER_MODEL.split('.')
+    User = apps.get_model(app_label, model_name)
+    Profile = apps.get_model('users', 'Profile')
+    users = User.objects.filter(profile__isnull=True)
+    users = users.annotate(total=Count('posts'))
+    Profile.objects.bulk_create(
+        Profile(user_id=user_id, posts_count=total)
+        for user_id, total in users.values_list('id', 'total').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('posts', '0005_group_posts_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_profiles, migrations.RunPython.noop),
+    ]
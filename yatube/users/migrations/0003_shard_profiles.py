@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_shard_profiles(apps, schema_editor):
+    """Шаг 0002 для базы шарда, в которой идет миграция."""
+    app_label, model_name = settings.AUTH_USER_MODEL.split('.')
+    User = apps.get_model(app_label, model_name)
+    Profile = apps.get_model('users', 'Profile')
+    db_alias = schema_editor.connection.alias
+    users = User.objects.using(db_alias).filter(profile__isnull=True)
+    users = users.annotate(total=Count('posts'))
+    Profile.objects.using(db_alias).bulk_create(
+        Profile(user_id=user_id, posts_count=total)
+        for user_id, total in users.values_list('id', 'total').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_fill_profiles'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fill_shard_profiles, migrations.RunPython.noop,
+            hints={'shards': True},
+        ),
+    ]
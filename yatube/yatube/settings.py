@@ -1,4 +1,5 @@
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -6,6 +7,9 @@ SECRET_KEY = 'ppoxj@hnw!%&goxbiw!izn_8u&ox8pr_)0m-indt#)4_(!_^=$'
 
 DEBUG = True
 
+# manage.py test и py.test (pytest-django не смотрит на TEST_RUNNER).
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -28,6 +32,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,7 +50,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.ProfiledDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,11 +70,78 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живет в потоке воркера между запросами.
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # Поверх core.backends.sqlite3.base.DEFAULT_PRAGMAS.
+            'pragmas': {},
+            'write_timeout': 5,
+            'write_retries': 5,
+            'write_backoff': 0.01,
+        },
     }
 }
 
+# Реплики для чтения лент и постов: копии db.sqlite3, которые обновляет
+# sync_replicas. Запись и миграции идут только в default.
+REPLICA_COUNT = 0
+REPLICA_DATABASES = []
+for number in range(1, REPLICA_COUNT + 1):
+    alias = 'replica%s' % number
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, 'db-%s.sqlite3' % alias),
+        OPTIONS=dict(
+            DATABASES['default']['OPTIONS'], pragmas={'query_only': 'ON'}
+        ),
+        TEST={'MIRROR': 'default'},
+    )
+    REPLICA_DATABASES.append(alias)
+
+# Посты по авторам в отдельных базах, см. posts.sharding. Пустой
+# POST_SHARDS — все посты в default. Пользователи, группы и профили
+# копируются в шарды сигналами и командой sync_shard_references, посты
+# из default переносит rebalance_shards --from-default.
+SHARD_COUNT = 0
+POST_SHARDS = []
+for number in range(SHARD_COUNT):
+    alias = 'shard%s' % number
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, 'db-%s.sqlite3' % alias),
+    )
+    POST_SHARDS.append(alias)
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+
+# Кеш в два уровня, см. core.cache.TieredCache: LRU в памяти воркера
+# перед общим для всех воркеров кешем 'shared'. Файловый кеш — замена
+# memcached или Redis для одной машины.
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'yatube',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 2,
+            'JITTER': 0.1,
+            'STALE_TIMEOUT': 60,
+            'LOCK_TIMEOUT': 10,
+            'LOCK_WAIT': 2,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -100,9 +175,77 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 STATIC_URL = '/static/'
 
 NUMBER_OBJECTS = 10
+CURSOR_PAGINATION = False
+PAGINATOR_COUNT_TIMEOUT = 60 * 15
+PAGINATOR_ESTIMATED_COUNT = False
+POST_CARD_TIMEOUT = 60 * 60 * 24
+PAGE_CACHE_TIMEOUT = 60
+OBJECT_CACHE_TIMEOUT = 60 * 60
+OBJECT_CACHE_MISS_TIMEOUT = 60
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_MAX_LENGTH = 1000
+TIMELINE_TRIM_INTERVAL = 50
+TIMELINE_CELEBRITY_TIMEOUT = 60
+EXPORT_BATCH_SIZE = 2000
+FEED_ITEMS = 20
+FEED_CACHE_TIMEOUT = 60 * 60
+QUERY_REPEAT_THRESHOLD = 5
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+# Лог медленных запросов и отчет по формам запросов. В лог попадает
+# форма запроса без значений параметров. В тестах выключен: тесты
+# ставят обертку сами.
+SLOW_QUERY_LOG = DEBUG and not TESTING
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_REPORT_INTERVAL = 60
+SLOW_QUERY_REPORT = os.path.join(BASE_DIR, 'logs', 'slow_queries.jsonl')
+METRICS_DIR = os.path.join(BASE_DIR, 'logs', 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+# /metrics/ отдается только с заголовком Authorization: Bearer <токен>,
+# пустой токен выключает эндпоинт.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+REPLICA_MAX_LAG = 15
+REPLICA_HEALTH_INTERVAL = 2
+REPLICA_PIN_SECONDS = 10
+# Запись моделей этих приложений закрепляет пользователя за default.
+REPLICA_PIN_APPS = ['posts', 'users']
+REPLICA_SYNC_INTERVAL = 5
+SHARD_DIRECTORY_TIMEOUT = 60
+SHARD_ID_BLOCK = 100
 TEST_POSTS = 13
+# Тесты работают с двумя уровнями кеша в памяти процесса: общий файловый
+# кеш делят dev-сервер и параллельные прогоны, а тесты его очищают.
+TEST_CACHES = {
+    'default': dict(CACHES['default'], LOCATION='tests'),
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-shared',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if TESTING:
+    CACHES = TEST_CACHES
 TEST_PAGINATOR = 3
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index